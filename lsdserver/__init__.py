@@ -27,11 +27,25 @@ from lsdserver.version import version
 from lsdserver.sensor import sensor
 from lsdserver.phenomena import phenomena
 from lsdserver.flag import flag
+from lsdserver.observation import observation
+from lsdserver.stats import stats
 from lsdserver.ui import ui
+from lsdserver import spool
+from lsdserver import pool
 from lsdserver import status
 from flask.ext.sqlalchemy import SQLAlchemy
 from lsdserver.backend import mysql
+from lsdserver.backend import chunked
+from lsdserver.backend import mapped
+from lsdserver.backend import sqlite
 
+# observation storage engines selectable by the BACKEND setting
+BACKENDS = {
+    "mysql": mysql.Mysql,
+    "chunked": chunked.Chunked,
+    "mapped": mapped.Mapped,
+    "sqlite": sqlite.Sqlite
+}
 
 
 # https://pythonhosted.org/Flask-Uploads/
@@ -77,12 +91,63 @@ def create_app(app_dir):
     app.register_blueprint(sensor, url_prefix='/sensor')
     app.register_blueprint(phenomena, url_prefix='/phenomena')
     app.register_blueprint(flag, url_prefix='/flag')
+    app.register_blueprint(observation, url_prefix='/observation')
+    app.register_blueprint(stats, url_prefix='/stats')
     app.register_blueprint(ui, url_prefix="")
 
     # database
-    app.system = mysql.Mysql()
+    app.system = BACKENDS[app.config.get("BACKEND", "mysql")]()
     app.db = SQLAlchemy(app)
     app.system.session = app.db.session
+    app.system.observation_rollups = app.config.get("OBSERVATION_ROLLUPS", False)
+    app.system.observation_seal_age = app.config.get(
+        "OBSERVATION_SEAL_AGE", app.system.observation_seal_age)
+    if isinstance(app.system, chunked.Chunked):
+        app.system.chunk_width = app.config.get(
+            "OBSERVATION_CHUNK_WIDTH", chunked.CHUNK_WIDTH)
+        app.system.chunk_delay = app.config.get(
+            "OBSERVATION_CHUNK_DELAY", chunked.CHUNK_DELAY)
+    if isinstance(app.system, mapped.Mapped):
+        app.system.observation_dir = app.config["OBSERVATION_DIR"]
+    if isinstance(app.system, sqlite.Sqlite):
+        app.system.mmap_size = app.config.get(
+            "SQLITE_MMAP_SIZE", sqlite.MMAP_SIZE)
+        app.system.cache_size = app.config.get(
+            "SQLITE_CACHE_SIZE", sqlite.CACHE_SIZE)
+        app.system.synchronous = app.config.get(
+            "SQLITE_SYNCHRONOUS", sqlite.SYNCHRONOUS)
+        engine = app.db.get_engine(app)
+        # the mapped backend may keep its registry in MySQL instead
+        if engine.dialect.name == "sqlite":
+            app.system.prepare(engine)
+
+    # optional write-behind spool for observations
+    if app.config.get("INGEST_SPOOL_DIR"):
+        app.spool = spool.Spool(
+            app.config["INGEST_SPOOL_DIR"],
+            spool_committer(app),
+            app.config.get("INGEST_FLUSH_INTERVAL", spool.FLUSH_INTERVAL),
+            app.config.get("INGEST_BATCH_SIZE", spool.BATCH_SIZE))
+        # replays anything left spooled by the last run
+        app.spool.ensure_started()
+        # restarts the committer in forked workers, which replay too
+        app.before_request(app.spool.ensure_started)
+    else:
+        app.spool = None
+
+    # optional pool of o_N tables created ahead of parameter registration
+    if app.config.get("OBSERVATION_POOL_SIZE"):
+        app.pool = pool.PoolMaintainer(
+            pool_filler(app),
+            app.config["OBSERVATION_POOL_SIZE"],
+            app.config.get("OBSERVATION_POOL_TYPES", pool.POOL_VALUE_TYPES),
+            app.config.get("OBSERVATION_POOL_INTERVAL", pool.POOL_INTERVAL))
+        app.system.observation_pool = True
+        app.pool.ensure_started()
+        # restarts the thread in forked workers
+        app.before_request(app.pool.ensure_started)
+    else:
+        app.pool = None
 
     # general stuff - error pages etc
     app.errorhandler(404)(not_found_error)
@@ -92,6 +157,25 @@ def create_app(app_dir):
     return app
 
 
+def spool_committer(app):
+    """
+    Commit spooled observations through the app's backend, outside of any
+    request
+    """
+    def commit(key, observations):
+        with app.app_context():
+            app.system.create_observations(*(list(key) + [observations]))
+    return commit
+
+
+def pool_filler(app):
+    """Fill the table pool through the app's backend, outside of any request"""
+    def fill(value_type, size):
+        with app.app_context():
+            return app.system.fill_observation_pool(value_type, size)
+    return fill
+
+
 def not_found_error(error):
     return render_template('404.html'), status.NOT_FOUND
 
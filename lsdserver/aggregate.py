@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+import re
+import numpy
+
+# supported aggregate functions for bucketed observation queries
+AGGREGATES = ["count", "sum", "min", "max", "mean"]
+
+BUCKET_UNITS = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": 60 * 60 * 24,
+    "w": 60 * 60 * 24 * 7
+}
+
+# a bucket width such as 30s, 5m or 1d - plain numbers are seconds
+bucket_regexp = re.compile('^(\d+)([smhdw]?)$')
+
+
+def parse_bucket(bucket):
+    """
+    Parse a bucket width
+
+    Returns
+    -------
+        int
+            bucket width in seconds or None if invalid
+    """
+    match = bucket_regexp.match(bucket or "")
+    if match:
+        seconds = int(match.group(1)) * BUCKET_UNITS.get(match.group(2), 1)
+    else:
+        seconds = None
+    return seconds or None
+
+
+def parse_aggregates(agg):
+    """
+    Parse a comma separated list of aggregate functions
+
+    Returns
+    -------
+        list
+            aggregate function names or None if any are unsupported
+    """
+    aggs = [a.strip() for a in (agg or "count").split(",")]
+    if all(a in AGGREGATES for a in aggs):
+        result = aggs
+    else:
+        result = None
+    return result
+
+
+def aggregate(timestamps, values, bucket, aggs):
+    """
+    Vectorised bucketed aggregation of a series sorted by timestamp
+
+    Parameters
+    ----------
+        timestamps
+            array of unix timestamps in ascending order
+        values
+            array of values, same length as timestamps
+        bucket
+            bucket width in seconds
+        aggs
+            list of aggregate function names from AGGREGATES
+
+    Returns
+    -------
+        list
+            one dictionary per non-empty bucket holding the bucket start
+            timestamp and each requested aggregate
+    """
+    timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if not len(timestamps):
+        return []
+
+    buckets = numpy.floor(timestamps / bucket) * bucket
+    starts, index = numpy.unique(buckets, return_index=True)
+    counts = numpy.diff(numpy.append(index, len(values)))
+
+    columns = {}
+    for agg in aggs:
+        if agg == "count":
+            columns[agg] = counts
+        elif agg == "sum":
+            columns[agg] = numpy.add.reduceat(values, index)
+        elif agg == "min":
+            columns[agg] = numpy.minimum.reduceat(values, index)
+        elif agg == "max":
+            columns[agg] = numpy.maximum.reduceat(values, index)
+        elif agg == "mean":
+            columns[agg] = numpy.add.reduceat(values, index) / counts
+
+    starts = starts.astype(numpy.int64).tolist()
+    columns = dict((agg, columns[agg].tolist()) for agg in columns)
+    result = []
+    for i, start in enumerate(starts):
+        row = {"timestamp": start}
+        for agg in aggs:
+            row[agg] = columns[agg][i]
+        result.append(row)
+    return result
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series sorted by
+    timestamp.  The first and last points are always kept and one point is
+    chosen from each of the threshold - 2 buckets in between, the one forming
+    the largest triangle with the previously chosen point and the average of
+    the next bucket.  This preserves the visual shape of the series far better
+    than averaging
+
+    Returns
+    -------
+        tuple
+            (timestamps, values) arrays of at most threshold points
+    """
+    x = numpy.asarray(timestamps, dtype=numpy.float64)
+    y = numpy.asarray(values, dtype=numpy.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # threshold - 2 buckets covering every point except the first and last
+    edges = numpy.linspace(1, n - 1, threshold - 1).astype(numpy.int64)
+    selected = numpy.empty(threshold, dtype=numpy.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start = edges[i]
+        end = edges[i + 1]
+        if i + 2 < len(edges):
+            next_start = edges[i + 1]
+            next_end = edges[i + 2]
+        else:
+            next_start = n - 1
+            next_end = n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # twice the triangle area for every candidate in the bucket
+        area = numpy.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                         (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(numpy.argmax(area))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Observation storage that packs closed time windows of each o_N table into
+compressed blocks in o_N_c.  Observations are written to o_N as usual, which
+then only holds the recent tail, and reads merge the decoded blocks with it.
+
+Block timestamps are delta-of-delta encoded and values are XORed with the
+value before, so a regular series is mostly zero bytes.  Both are byte
+shuffled and deflated, and decoded with a few whole-array numpy passes
+"""
+import logging
+import numpy
+import threading
+import time
+import zlib
+from lsdserver import aggregate
+from lsdserver.cache import LruCache
+from lsdserver.backend.mysql import Mysql, EpochKey, Upsert, VALUE_TYPES, \
+    MICROSECONDS, build_table, microseconds_from_timestamp, \
+    timestamp_from_microseconds
+from sqlalchemy import BigInteger, Column, Integer, LargeBinary, func
+
+# seconds of observations packed into each block
+CHUNK_WIDTH = 86400
+
+# seconds after a window ends before it is packed.  Observations written to
+# a window that is already packed land in the tail and are merged into its
+# block by a later compaction
+CHUNK_DELAY = 3600
+
+# seconds between compactions of each o_N table
+COMPACT_INTERVAL = 60
+
+# LONGBLOB on MySQL, a block of 1Hz readings with irregular timing and noisy
+# values can exceed the 64KB of a plain BLOB
+BLOCK_LENGTH = 2 ** 32 - 1
+
+
+def shuffle(array):
+    """
+    Bytes of an array of 8 byte words with byte i of every word stored
+    together, which groups the zero high bytes of small numbers into runs
+    """
+    return numpy.ascontiguousarray(
+        array.view(numpy.uint8).reshape(-1, 8).T).tobytes()
+
+
+def unshuffle(data, dtype):
+    """Reverse shuffle() giving an array of dtype"""
+    planes = numpy.frombuffer(data, dtype=numpy.uint8).reshape(8, -1)
+    return numpy.ascontiguousarray(planes.T).view(dtype).ravel()
+
+
+def encode_timestamps(timestamps):
+    """
+    Compress sorted epoch microseconds as the first timestamp, the first
+    delta, then the difference between each delta and the one before
+    """
+    timestamps = numpy.asarray(timestamps, dtype='<i8')
+    encoded = numpy.empty_like(timestamps)
+    encoded[:1] = timestamps[:1]
+    encoded[1:2] = numpy.diff(timestamps[:2])
+    encoded[2:] = numpy.diff(timestamps, 2)
+    return zlib.compress(shuffle(encoded))
+
+
+def decode_timestamps(data):
+    encoded = unshuffle(zlib.decompress(data), '<i8')
+    timestamps = numpy.empty_like(encoded)
+    timestamps[:1] = encoded[:1]
+    if len(encoded) > 1:
+        # the first sum rebuilds the deltas, the second the timestamps
+        timestamps[1:] = encoded[0] + numpy.cumsum(numpy.cumsum(encoded[1:]))
+    return timestamps
+
+
+def encode_values(values):
+    """
+    Compress float64 values as the bits of each XORed with the one before,
+    like Gorilla but deflated rather than bit packed
+    """
+    bits = numpy.asarray(values, dtype='<f8').view('<u8')
+    encoded = bits.copy()
+    encoded[1:] ^= bits[:-1]
+    return zlib.compress(shuffle(encoded))
+
+
+def decode_values(data):
+    encoded = unshuffle(zlib.decompress(data), '<u8')
+    return numpy.bitwise_xor.accumulate(encoded).view('<f8')
+
+
+def merge(older, newer):
+    """
+    Merge two (timestamps, values) series sorted by time.  Where both hold a
+    timestamp the value from newer is kept
+    """
+    timestamps = numpy.concatenate([older[0], newer[0]])
+    values = numpy.concatenate([older[1], newer[1]])
+    # a stable sort leaves newer after older, keep the last of each run
+    order = numpy.argsort(timestamps, kind="mergesort")
+    timestamps = timestamps[order]
+    values = values[order]
+    last = numpy.append(timestamps[1:] != timestamps[:-1], True)
+    return timestamps[last], values[last]
+
+
+class Block(EpochKey):
+    """
+    One packed window of an o_N table keyed by the window start.  count and
+    last_timestamp describe the observations packed
+    """
+    timestamp = Column(BigInteger, primary_key=True, autoincrement=False)
+    last_timestamp = Column(BigInteger)
+    count = Column(Integer)
+    timestamps = Column(LargeBinary(BLOCK_LENGTH))
+    values = Column(LargeBinary(BLOCK_LENGTH))
+
+
+class Chunked(Mysql):
+    """
+    Mysql backend that keeps closed windows of observations as compressed
+    blocks.  Parameters created by the Mysql backend have no block table and
+    are stored one row per observation as before
+    """
+
+    logger = logging.getLogger("lsdserver.chunked")
+
+    # seconds of observations in each block
+    chunk_width = CHUNK_WIDTH
+
+    # seconds after a window ends before it is packed
+    chunk_delay = CHUNK_DELAY
+
+    # seconds between compactions of each o_N table
+    compact_interval = COMPACT_INTERVAL
+
+    def __init__(self):
+        super(Chunked, self).__init__()
+        # block table by observation link, False if the o_N table has none
+        self.block_tables = LruCache(self.observation_table_cache_size)
+        # time each o_N table was last compacted by observation link
+        self.compacted = {}
+        self.compact_lock = threading.Lock()
+
+    def evict_registry(self, name):
+        super(Chunked, self).evict_registry(name)
+        if name == "parameter":
+            self.block_tables.clear()
+
+    def build_block_table(self, table):
+        link = table.observation_link
+        return build_table("o_%s_c" % link, Block, link)
+
+    def get_block_table(self, table):
+        """The block table of an o_N table or None if it has none"""
+        link = table.observation_link
+        blocks = self.block_tables.get(link)
+        if blocks is None:
+            blocks = self.build_block_table(table)
+            if not self.session.get_bind().has_table(blocks.__tablename__):
+                blocks = False
+            self.block_tables.put(link, blocks)
+        return blocks or None
+
+    def create_observation_table(self, link, value_type):
+        super(Chunked, self).create_observation_table(link, value_type)
+        table = self.build_observation_table(link)
+        self.create_table(self.build_block_table(table))
+        self.block_tables.invalidate(link)
+
+    def create_observations(self,
+                            platform_id,
+                            manufacturer,
+                            model,
+                            serial_number,
+                            phenomena,
+                            observations):
+        super(Chunked, self).create_observations(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            observations)
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        try:
+            self.maybe_compact(table)
+        except Exception:
+            # the observations are committed, packing is retried later
+            self.logger.exception("compaction of %s failed", table.__tablename__)
+
+    def stored_keys(self, table, rows):
+        # late observations can overwrite ones already packed into a block
+        keys = super(Chunked, self).stored_keys(table, rows)
+        if self.get_rollup_tables(table) and self.get_block_table(table):
+            batch = numpy.array([row["timestamp"] for row in rows])
+            packed, _ = self.read_blocks(
+                table,
+                timestamp_from_microseconds(batch.min()),
+                timestamp_from_microseconds(batch.max() + 1))
+            keys.update(batch[numpy.in1d(batch, packed)].tolist())
+        return keys
+
+    def maybe_compact(self, table):
+        """
+        Pack the oldest closed window of an o_N table, at most once every
+        compact_interval seconds so the cost is spread over many writes
+        """
+        now = time.time()
+        with self.compact_lock:
+            if now - self.compacted.get(table.observation_link, 0) < \
+                    self.compact_interval:
+                return
+            self.compacted[table.observation_link] = now
+        self.compact(table, windows=1)
+
+    def compact(self, table, windows=None):
+        """
+        Pack the closed windows of an o_N table's tail into blocks, oldest
+        first and at most windows of them.  Returns the number packed
+        """
+        blocks = self.get_block_table(table)
+        if blocks is None:
+            return 0
+
+        width = self.chunk_width
+        # windows starting before this have ended at least chunk_delay ago
+        closed = (time.time() - self.chunk_delay) // width * width
+        packed = 0
+        while windows is None or packed < windows:
+            oldest = self.session.query(func.min(table.timestamp)).filter(
+                table.timestamp < table.to_key(closed)).scalar()
+            self.session.commit()
+            if oldest is None:
+                break
+            start = table.from_key(oldest) // width * width
+            self.pack_window(table, blocks, start, start + width)
+            packed += 1
+        return packed
+
+    def pack_window(self, table, blocks, start, end):
+        """
+        Merge the tail of an o_N table in start <= t < end into the window's
+        block and delete it from the tail, in one transaction
+        """
+        try:
+            # locks the tail rows and the gaps between them on MySQL so that
+            # writes to the window wait until it has been packed
+            rows = self.filter_observation_range(
+                self.session.query(table.timestamp, table.value),
+                table, start, end
+            ).order_by(table.timestamp).with_for_update().all()
+            if table.resolution == MICROSECONDS:
+                timestamps = numpy.array([row[0] for row in rows],
+                                         dtype=numpy.int64)
+            else:
+                timestamps = numpy.array(
+                    [microseconds_from_timestamp(table.from_key(row[0]))
+                     for row in rows], dtype=numpy.int64)
+            values = numpy.array([row[1] for row in rows],
+                                 dtype=numpy.float64)
+
+            key = blocks.to_key(start)
+            block = self.session.query(blocks).filter(
+                blocks.timestamp == key).with_for_update().first()
+            if block is not None:
+                timestamps, values = merge(
+                    (decode_timestamps(block.timestamps),
+                     decode_values(block.values)),
+                    (timestamps, values))
+
+            if len(timestamps):
+                self.session.execute(Upsert(blocks.__table__).values(
+                    timestamp=key,
+                    last_timestamp=int(timestamps[-1]),
+                    count=len(timestamps),
+                    timestamps=encode_timestamps(timestamps),
+                    values=encode_values(values)))
+            self.filter_observation_range(
+                self.session.query(table), table, start, end
+            ).delete(synchronize_session=False)
+            self.session.commit()
+        except:
+            self.session.rollback()
+            raise
+
+    def read_blocks(self, table, start=None, end=None, after=None,
+                    limit=None):
+        """
+        Decode the packed observations of an o_N table in start <= t < end
+        and after t, as arrays of epoch microseconds and values.  Blocks are
+        decoded in time order, stopping once limit observations are found
+        """
+        parts = []
+        blocks = self.get_block_table(table)
+        if blocks is not None:
+            query = self.session.query(blocks.timestamp)
+            if start is not None:
+                query = query.filter(blocks.last_timestamp >= blocks.to_key(start))
+            if after is not None:
+                query = query.filter(blocks.last_timestamp > blocks.to_key(after))
+            if end is not None:
+                query = query.filter(blocks.timestamp < blocks.to_key(end))
+            # fetch the keys first so only the blocks needed are read
+            found = 0
+            for key, in query.order_by(blocks.timestamp).all():
+                block = self.session.query(
+                    blocks.timestamps, blocks.values).filter(
+                    blocks.timestamp == key).one()
+                timestamps = decode_timestamps(block.timestamps)
+                values = decode_values(block.values)
+                first = 0
+                if start is not None:
+                    first = numpy.searchsorted(
+                        timestamps, microseconds_from_timestamp(start))
+                if after is not None:
+                    first = max(first, numpy.searchsorted(
+                        timestamps, microseconds_from_timestamp(after),
+                        side="right"))
+                last = len(timestamps)
+                if end is not None:
+                    last = numpy.searchsorted(
+                        timestamps, microseconds_from_timestamp(end))
+                parts.append((timestamps[first:last], values[first:last]))
+                found += max(0, last - first)
+                if limit and found >= limit:
+                    break
+
+        if not parts:
+            return (numpy.empty(0, dtype=numpy.int64),
+                    numpy.empty(0, dtype=numpy.float64))
+        return (numpy.concatenate([part[0] for part in parts]),
+                numpy.concatenate([part[1] for part in parts]))
+
+    def read_observation_arrays(self, table, start=None, end=None):
+        tail = super(Chunked, self).read_observation_arrays(table, start, end)
+        timestamps, values = self.read_blocks(table, start, end)
+        if not len(timestamps):
+            return tail
+        return merge((timestamps / float(MICROSECONDS), values), tail)
+
+    def get_observations(self,
+                         platform_id,
+                         manufacturer,
+                         model,
+                         serial_number,
+                         phenomena,
+                         start=None,
+                         end=None,
+                         limit=None,
+                         after=None):
+        tail = super(Chunked, self).get_observations(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            start=start, end=end, limit=limit, after=after)
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        timestamps, values = self.read_blocks(table, start, end, after, limit)
+        if not len(timestamps):
+            return tail
+
+        # blocks hold float64, give values back as the o_N column type
+        dtype = VALUE_TYPES[table.value_type][1]
+        values = numpy.array(values.astype(dtype).tolist(), dtype=object)
+        timestamps, values = merge(
+            (timestamps, values),
+            (numpy.array([microseconds_from_timestamp(observation["timestamp"])
+                          for observation in tail], dtype=numpy.int64),
+             numpy.array([observation["value"] for observation in tail],
+                         dtype=object)))
+        if limit:
+            timestamps = timestamps[:limit]
+            values = values[:limit]
+        return [{"timestamp": timestamp_from_microseconds(timestamp),
+                 "value": value}
+                for timestamp, value in zip(timestamps.tolist(), values)]
+
+    def get_observation_aggregates(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena,
+                                   bucket,
+                                   aggs,
+                                   start=None,
+                                   end=None):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        if self.get_block_table(table) is None or \
+                self.choose_rollup(table, bucket, aggs, start, end) is not None:
+            # rollups are built from the merged observations so stay exact
+            return super(Chunked, self).get_observation_aggregates(
+                platform_id, manufacturer, model, serial_number, phenomena,
+                bucket, aggs, start=start, end=end)
+        # SQL would only see the tail
+        timestamps, values = self.read_observation_arrays(table, start, end)
+        return aggregate.aggregate(timestamps, values, bucket, aggs)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Observation storage in flat files for small sites without a database
+server.  The registry stays in SQL (eg SQLite) while each parameter's
+observations are kept in two append only files of fixed width records,
+o_N.ts holding int64 epoch microseconds and o_N.values float64 values.
+
+Reads binary search memory mapped views of the files, so the value arrays
+handed to the serializers are slices of the mapping rather than copies.
+Late observations rewrite the files from the first one they precede
+"""
+from contextlib import contextmanager
+from itertools import islice
+from lsdserver import aggregate
+from lsdserver import status
+from lsdserver.backend.chunked import merge
+from lsdserver.backend.mysql import EpochObservation, MICROSECONDS, \
+    convert_values, microseconds_from_timestamp, timestamp_from_microseconds
+from lsdserver.backend.sqlite import Sqlite
+import fcntl
+import flask
+import numpy
+import os
+
+# bytes in each timestamp and each value
+RECORD_WIDTH = 8
+
+
+class Series(object):
+    """
+    The observation files of one parameter.  Writers hold an exclusive lock
+    on <name>.lock and readers a shared one while mapping the files, so
+    readers always see the two files at the same length.  Mappings also hold
+    a shared lock on <name>.readers for as long as any view of them is alive.
+
+    Observations arriving in time order are appended.  Anything else merges
+    the stored observations from the first one the batch precedes, written
+    to <name>.ts.new and <name>.values.new.  Once <name>.commit records that
+    both are complete they are copied over the end of the files, or renamed
+    into place if a mapping is still alive and would see the files change,
+    so a crash part way through is rolled forward or discarded
+    """
+
+    def __init__(self, directory, name):
+        path = os.path.join(directory, name)
+        self.timestamps_path = path + ".ts"
+        self.values_path = path + ".values"
+        self.lock_path = path + ".lock"
+        self.commit_path = path + ".commit"
+        self.readers_path = path + ".readers"
+
+    @contextmanager
+    def locked(self, operation):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def recover(self):
+        """
+        Finish or discard a rewrite interrupted by a crash.  <name>.commit
+        holds the record the .new files start at, or nothing if they replace
+        the files whole
+        """
+        first = None
+        if os.path.exists(self.commit_path):
+            with open(self.commit_path) as f:
+                first = f.read()
+        for path in [self.values_path, self.timestamps_path]:
+            if not os.path.exists(path + ".new"):
+                continue
+            if first:
+                # copying again is harmless if the crash came part way through
+                with open(path + ".new", "rb") as new, \
+                        open(path, "r+b") as f:
+                    f.seek(int(first) * RECORD_WIDTH)
+                    f.write(new.read())
+                    f.truncate()
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.remove(path + ".new")
+            elif first is not None:
+                os.rename(path + ".new", path)
+            else:
+                os.remove(path + ".new")
+        if first is not None:
+            os.remove(self.commit_path)
+
+    def count(self):
+        """
+        Number of complete observations, a crash during an append can leave
+        one file longer than the other
+        """
+        sizes = [os.path.getsize(path) if os.path.exists(path) else 0
+                 for path in [self.timestamps_path, self.values_path]]
+        return min(sizes) // RECORD_WIDTH
+
+    def map(self, shared=True):
+        """
+        Read only views of the timestamps and values files.  Shared views
+        keep the files from being changed in place until they are freed
+        """
+        count = self.count()
+        if not count:
+            return (numpy.empty(0, dtype='<i8'), numpy.empty(0, dtype='<f8'))
+        timestamps = numpy.memmap(self.timestamps_path, dtype='<i8', mode='r',
+                                  shape=(count,))
+        values = numpy.memmap(self.values_path, dtype='<f8', mode='r',
+                              shape=(count,))
+        if shared:
+            # slices refer back to the mapping, the lock is released when the
+            # last of them is freed
+            readers = open(self.readers_path, "a")
+            fcntl.flock(readers, fcntl.LOCK_SH)
+            timestamps.readers = values.readers = readers
+        return timestamps, values
+
+    def read(self):
+        """
+        Map the files.  The mapping stays valid after the lock is released,
+        the files are not changed in place while it is alive
+        """
+        with self.locked(fcntl.LOCK_SH):
+            if not os.path.exists(self.commit_path):
+                return self.map()
+        with self.locked(fcntl.LOCK_EX):
+            self.recover()
+            return self.map()
+
+    def write(self, timestamps, values):
+        """
+        Store observations given as int64 epoch microseconds and float64
+        values.  A timestamp already stored has its value replaced
+        """
+        with self.locked(fcntl.LOCK_EX):
+            self.recover()
+            count = self.count()
+            stored_timestamps, stored_values = self.map(shared=False)
+            ordered = (numpy.diff(timestamps) > 0).all() and \
+                (not count or timestamps[0] > stored_timestamps[-1])
+            if ordered:
+                self.append(count, timestamps, values)
+            else:
+                # observations before the batch are left where they are
+                first = numpy.searchsorted(stored_timestamps, timestamps.min())
+                self.rewrite(first, *merge(
+                    (stored_timestamps[first:], stored_values[first:]),
+                    (timestamps, values)))
+
+    def append(self, count, timestamps, values):
+        for path, array in [(self.values_path, values),
+                            (self.timestamps_path, timestamps)]:
+            with open(path, "ab") as f:
+                # drop any partial record left by a crash
+                f.truncate(count * RECORD_WIDTH)
+                f.write(array.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def rewrite(self, first, timestamps, values):
+        """Replace the observations from record first onwards"""
+        with open(self.readers_path, "a") as readers:
+            try:
+                fcntl.flock(readers, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # a reader still has the files mapped, replace them whole
+                stored_timestamps, stored_values = self.map(shared=False)
+                timestamps = numpy.concatenate(
+                    [stored_timestamps[:first], timestamps])
+                values = numpy.concatenate([stored_values[:first], values])
+                first = None
+            for path, array in [(self.values_path, values),
+                                (self.timestamps_path, timestamps)]:
+                with open(path + ".new", "wb") as f:
+                    f.write(array.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(self.commit_path, "w") as f:
+                if first is not None:
+                    f.write(str(first))
+                f.flush()
+                os.fsync(f.fileno())
+            self.recover()
+
+
+class Mapped(Sqlite):
+    """
+    Sqlite backend keeping observations in memory mapped files under
+    observation_dir instead of o_N tables.  Values are stored as float64
+    whatever the phenomena data_type, and there are no rollups.  The registry
+    may also be kept in MySQL, prepare() is then not called
+    """
+
+    # directory holding the observation files
+    observation_dir = None
+
+    def series(self, table):
+        return Series(self.observation_dir, table.__tablename__)
+
+    def observation_layout(self, tablename):
+        # there is no o_N table, values are always stored as float64
+        return EpochObservation, "double"
+
+    def create_observation_table(self, link, value_type):
+        # the files are created by the first write
+        if not os.path.isdir(self.observation_dir):
+            os.makedirs(self.observation_dir)
+
+    def create_observations(self,
+                            platform_id,
+                            manufacturer,
+                            model,
+                            serial_number,
+                            phenomena,
+                            observations):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+        # convert in chunks, nothing is written unless the whole batch is
+        # valid
+        timestamps = []
+        values = []
+        observations = iter(observations)
+        while True:
+            chunk = list(islice(observations, self.observation_batch_size))
+            if not chunk:
+                break
+            try:
+                values.append(numpy.array(convert_values(
+                    [observation["value"] for observation in chunk],
+                    "double"), dtype='<f8'))
+                timestamps.append(numpy.round(numpy.array(
+                    [observation["timestamp"] for observation in chunk],
+                    dtype=numpy.float64) * MICROSECONDS).astype('<i8'))
+            except (TypeError, ValueError):
+                flask.abort(status.BAD_REQUEST)
+        if timestamps:
+            timestamps = numpy.concatenate(timestamps)
+            self.series(table).write(timestamps, numpy.concatenate(values))
+            self.seal_observations(
+                table, timestamps.min() / float(MICROSECONDS))
+
+    def read_observation_arrays(self, table, start=None, end=None):
+        timestamps, values = self.series(table).read()
+        first = 0
+        last = len(timestamps)
+        if start is not None:
+            first = numpy.searchsorted(
+                timestamps, microseconds_from_timestamp(start))
+        if end is not None:
+            last = numpy.searchsorted(
+                timestamps, microseconds_from_timestamp(end))
+        # values are handed out as a slice of the mapping, timestamps have to
+        # be converted to seconds
+        return (timestamps[first:last] / float(MICROSECONDS),
+                values[first:last])
+
+    def get_observations(self,
+                         platform_id,
+                         manufacturer,
+                         model,
+                         serial_number,
+                         phenomena,
+                         start=None,
+                         end=None,
+                         limit=None,
+                         after=None):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        timestamps, values = self.series(table).read()
+        first = 0
+        last = len(timestamps)
+        if start is not None:
+            first = numpy.searchsorted(
+                timestamps, microseconds_from_timestamp(start))
+        if after is not None:
+            first = max(first, numpy.searchsorted(
+                timestamps, microseconds_from_timestamp(after), side="right"))
+        if end is not None:
+            last = numpy.searchsorted(
+                timestamps, microseconds_from_timestamp(end))
+        if limit:
+            last = min(last, first + limit)
+        return [{"timestamp": timestamp_from_microseconds(timestamp),
+                 "value": value}
+                for timestamp, value in zip(timestamps[first:last].tolist(),
+                                            values[first:last].tolist())]
+
+    def get_observation_aggregates(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena,
+                                   bucket,
+                                   aggs,
+                                   start=None,
+                                   end=None):
+        timestamps, values = self.get_observation_arrays(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            start=start, end=end)
+        return aggregate.aggregate(timestamps, values, bucket, aggs)
@@ -18,10 +18,26 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import flask
+import calendar
+import datetime
+import numpy
+import threading
+import time
+import warnings
+from itertools import chain, islice
+from lsdserver import aggregate
+from lsdserver import spatial
+from lsdserver import status
+from lsdserver.cache import LruCache
 from lsdserver.driver import LsdBackend
 
-from sqlalchemy import Sequence, Column, DateTime, String, Integer, ForeignKey, func, ForeignKeyConstraint
+from sqlalchemy import Sequence, Column, DateTime, String, Integer, Float, ForeignKey, func, ForeignKeyConstraint
+from sqlalchemy import BigInteger, Boolean, Index, SmallInteger, and_, cast, exists, inspect, literal_column, select
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.exc import IntegrityError, NoSuchTableError, SAWarning
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Insert
+from sqlalchemy.dialects import mysql
 #from sqlalchemy.ext.declarative import declarative_base
 from lsdserver.base import Base
 
@@ -36,6 +52,9 @@ class Platform(Base):
     description = Column(String(100))
     info = Column(String(100))
     location = Column(String(100))
+    # parsed from location when written, NULL if it is not a WKT point
+    longitude = Column(Float(precision=53))
+    latitude = Column(Float(precision=53))
 
 class Sensor(Base):
     __tablename__ = 'sensor'
@@ -59,50 +78,871 @@ class Parameter(Base):
                                            [Sensor.platform_id, Sensor.manufacturer, Sensor.model, Sensor.serial_number]),
                       {})
 
+# secondary indexes for filtering the sensor and parameter collections, the
+# primary keys already cover filtering by platform/manufacturer/model prefix
+Index("sensor_manufacturer_model", Sensor.manufacturer, Sensor.model)
+Index("sensor_model", Sensor.model)
+Index("parameter_phenomena", Parameter.phenomena)
+
+class Phenomena(Base):
+    __tablename__ = 'user_phenomena'
+    term = Column(String(FIELD_LENGTH), primary_key=True)
+    data_type = Column(String(20))
+    min_valid = Column(Float(precision=53))
+    max_valid = Column(Float(precision=53))
+    uom = Column(String(100))
+    description = Column(String(100))
+
 class ObservationLink(Base):
     __tablename__ = 'observation_link'
     observation_link_id = Column(Integer, autoincrement=True, primary_key=True)
 
-class Observation():
+class ObservationPool(Base):
+    """
+    o_N tables created ahead of time, waiting to be claimed by a new
+    parameter with a phenomena of the same value_type
+    """
+    __tablename__ = 'observation_pool'
+    observation_link = Column(Integer, primary_key=True, autoincrement=False)
+    value_type = Column(String(20), nullable=False)
+
+Index("observation_pool_value_type", ObservationPool.value_type)
+
+class RegistryVersion(Base):
+    """
+    Count of writes to each kind of registry entity, polled by every process
+    to know when its cached copies have gone stale
+    """
+    __tablename__ = 'registry_version'
+    name = Column(String(FIELD_LENGTH), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# registry entities with a version counter
+REGISTRY_ENTITIES = ["platform", "sensor", "parameter"]
+
+# epoch keys count microseconds since 1970
+MICROSECONDS = 1000000
+
+
+def datetime_from_timestamp(timestamp):
+    """Convert a unix timestamp to a naive UTC datetime"""
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+def timestamp_from_datetime(value):
+    """Convert a naive UTC datetime to a unix timestamp"""
+    timestamp = calendar.timegm(value.utctimetuple())
+    if value.microsecond:
+        timestamp += value.microsecond / 1e6
+    return timestamp
+
+
+def microseconds_from_timestamp(timestamp):
+    """Convert a unix timestamp to integer microseconds since 1970"""
+    return int(round(timestamp * MICROSECONDS))
+
+
+def timestamp_from_microseconds(value):
+    """
+    Convert microseconds since 1970 to a unix timestamp, an integer when
+    there is no fractional second
+    """
+    seconds, fraction = divmod(value, MICROSECONDS)
+    if fraction:
+        return value / float(MICROSECONDS)
+    return int(seconds)
+
+
+class DateTimeKey(object):
+    """
+    Tables keyed by a DateTime, the layout of o_N tables created before
+    epoch keys.  MySQL stores these to the whole second
+    """
+    # units of the key per second when read as an epoch
+    resolution = 1
+    to_key = staticmethod(datetime_from_timestamp)
+    from_key = staticmethod(timestamp_from_datetime)
+
+
+class EpochKey(object):
+    """
+    Tables keyed by integer microseconds since 1970, so sub-second
+    observations can be stored and range scans compare integers
+    """
+    resolution = MICROSECONDS
+    to_key = staticmethod(microseconds_from_timestamp)
+    from_key = staticmethod(timestamp_from_microseconds)
+
+
+# the value column of each o_N table is added by build_table with the type
+# chosen from its phenomena data_type
+class Observation(DateTimeKey):
     timestamp = Column(DateTime, primary_key=True)
-    value = Column(Integer)
+
+class EpochObservation(EpochKey):
+    timestamp = Column(BigInteger, primary_key=True, autoincrement=False)
+
+class Rollup(DateTimeKey):
+    """
+    Precomputed aggregates of an o_N table, one row per bucket keyed by the
+    bucket start time.  last holds the value of the latest observation in the
+    bucket, taken at last_timestamp
+    """
+    timestamp = Column(DateTime, primary_key=True)
+    count = Column(Integer)
+    sum = Column(Float(precision=53))
+    min = Column(Float(precision=53))
+    max = Column(Float(precision=53))
+    last_timestamp = Column(DateTime)
+    last = Column(Float(precision=53))
+
+class EpochRollup(EpochKey):
+    """Rollup of an o_N table keyed by epoch microseconds"""
+    timestamp = Column(BigInteger, primary_key=True, autoincrement=False)
+    count = Column(Integer)
+    sum = Column(Float(precision=53))
+    min = Column(Float(precision=53))
+    max = Column(Float(precision=53))
+    last_timestamp = Column(BigInteger)
+    last = Column(Float(precision=53))
+
+# o_N value column type and the numpy dtype values are converted through for
+# each phenomena data_type
+VALUE_TYPES = {
+    "bool": (Boolean, numpy.bool_),
+    "smallint": (SmallInteger, numpy.int16),
+    "int": (Integer, numpy.int32),
+    "float": (lambda: Float(precision=24), numpy.float32),
+    "double": (lambda: Float(precision=53), numpy.float64)
+}
+
+# value type for phenomena that are not registered or have an unsupported
+# data_type
+DEFAULT_VALUE_TYPE = "double"
+
+# rollup tables maintained alongside each o_N table when enabled, keyed by
+# table name suffix
+ROLLUPS = {
+    "h": 60 * 60,
+    "d": 60 * 60 * 24
+}
+
+# aggregates that can be answered by combining rollup rows
+ROLLUP_AGGREGATES = ["count", "sum", "min", "max", "mean"]
+
+
+class Upsert(Insert):
+    """
+    INSERT that overwrites any row whose primary key is already stored, so
+    resending a batch is harmless.  Databases without a compilation below
+    get a plain INSERT
+    """
+
+
+@compiles(Upsert)
+def compile_upsert(insert, compiler, **kw):
+    return compiler.visit_insert(insert, **kw)
+
+
+@compiles(Upsert, "mysql")
+def compile_upsert_mysql(insert, compiler, **kw):
+    quote = compiler.preparer.quote
+    columns = [quote(column.name) for column in insert.table.columns
+               if not column.primary_key]
+    return compiler.visit_insert(insert, **kw) + \
+        " ON DUPLICATE KEY UPDATE " + \
+        ", ".join("%s = VALUES(%s)" % (column, column) for column in columns)
+
+
+@compiles(Upsert, "sqlite")
+def compile_upsert_sqlite(insert, compiler, **kw):
+    return compiler.visit_insert(insert, **kw).replace(
+        "INSERT", "INSERT OR REPLACE", 1)
+
+
+def value_type_of(column_type):
+    """The VALUE_TYPES entry matching the reflected type of a value column"""
+    if isinstance(column_type, Boolean) or \
+            getattr(column_type, "display_width", None) == 1:
+        # MySQL reports BOOL columns as TINYINT(1)
+        value_type = "bool"
+    elif isinstance(column_type, SmallInteger):
+        value_type = "smallint"
+    elif isinstance(column_type, Integer):
+        value_type = "int"
+    elif isinstance(column_type, mysql.FLOAT):
+        value_type = "float"
+    else:
+        # other databases don't distinguish single precision when reflected
+        value_type = "double"
+    return value_type
+
+
+def convert_values(values, value_type):
+    """
+    Convert a list of observation values for a value column in one pass
+    through a typed array.  Raises ValueError if any value can't be stored
+    exactly: integers must be whole and in range for the column, bools
+    true, false, 0 or 1 and floats finite once converted
+    """
+    dtype = numpy.dtype(VALUE_TYPES[value_type][1])
+    if None in values:
+        # numpy would store these as NaN or False
+        raise ValueError("missing %s value" % value_type)
+    try:
+        if dtype.kind == "b":
+            # numpy takes any non-empty string or non-zero number as true
+            if not all(value in (0, 1) for value in values):
+                raise ValueError("invalid %s value" % value_type)
+            array = numpy.array(values, dtype=dtype)
+        elif dtype.kind == "i":
+            array = numpy.array(values, dtype=numpy.float64)
+            limits = numpy.iinfo(dtype)
+            if array.ndim == 1 and len(array) and \
+                    not (numpy.floor(array) == array).all():
+                raise ValueError("%s value is not whole" % value_type)
+            if len(array) and \
+                    (array.min() < limits.min or array.max() > limits.max):
+                raise ValueError("%s value out of range" % value_type)
+        else:
+            with numpy.errstate(over="ignore"):
+                array = numpy.array(values, dtype=dtype)
+            if array.ndim == 1 and not numpy.isfinite(array).all():
+                raise ValueError("%s value is not finite" % value_type)
+    except (TypeError, OverflowError):
+        raise ValueError("invalid %s value" % value_type)
+    if array.ndim != 1:
+        raise ValueError("invalid %s value" % value_type)
+    return array.astype(dtype).tolist()
+
+
+def bucket_runs(starts, width):
+    """
+    (start, end) time ranges covering sorted bucket starts, with buckets that
+    follow on from each other merged into one range
+    """
+    runs = []
+    for start in starts.tolist():
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = start + width
+        else:
+            runs.append([start, start + width])
+    return [tuple(run) for run in runs]
+
+
+def row_dict(row):
+    """Copy the column values of a mapped object into a plain dictionary"""
+    return dict((column.name, getattr(row, column.name))
+                for column in row.__table__.columns)
+
+
+# mapped o_N classes by table name.  Classes are registered on the shared
+# declarative Base so each one must only ever be built once per process
+observation_classes = {}
+observation_classes_lock = threading.Lock()
+
+
+def build_table(classname, mixin, link, **attributes):
+    """
+    Build or reuse the mapped class for an observation or rollup table.
+    attributes are added to the class, eg columns that vary by table
+    """
+    with observation_classes_lock:
+        table = observation_classes.get(classname)
+        if table is None:
+            attributes.update({
+                '__tablename__': classname,
+                'observation_link': link})
+            table = type(classname, (Base, mixin), attributes)
+            observation_classes[classname] = table
+    return table
+
+
+def forget_table(classname):
+    """Drop a mapped class built with the wrong layout so it can be rebuilt"""
+    with observation_classes_lock:
+        table = observation_classes.pop(classname, None)
+        if table is not None:
+            Base.metadata.remove(table.__table__)
+            Base._decl_class_registry.pop(classname, None)
 
 
 class Mysql(LsdBackend):
 
     session = None
 
-    def build_observation_table(self, link):
+    # number of rows written by each multi-row INSERT statement
+    observation_batch_size = 1000
+
+    # number of rows fetched from the cursor at a time when listing
+    list_batch_size = 1000
+
+    # number of parameter natural keys to remember the o_N table for
+    observation_table_cache_size = 4096
+
+    # number of platforms and of sensors to keep in the registry caches
+    registry_cache_size = 10000
+
+    # seconds between polls of registry_version for writes by other processes
+    registry_poll_interval = 0.05
+
+    # create and maintain hourly and daily rollups for new parameters
+    observation_rollups = False
+
+    # claim o_N tables from observation_pool for new parameters
+    observation_pool = False
+
+    # pooled o_N tables a parameter registration tries to claim before
+    # creating one itself
+    pool_claim_candidates = 10
+
+    def __init__(self):
+        self.observation_tables = LruCache(self.observation_table_cache_size)
+        self.rollup_tables = LruCache(self.observation_table_cache_size)
+        # platform and sensor rows by natural key, invalidated on write
+        self.platform_cache = LruCache(self.registry_cache_size)
+        self.sensor_cache = LruCache(self.registry_cache_size)
+        # last registry_version counters seen, None until the first poll
+        self.registry_versions = None
+        self.registry_polled = 0
+        self.registry_lock = threading.Lock()
+        # grid index and map clusters of platform locations, loaded on the
+        # first spatial query
+        self.spatial_index = None
+        self.cluster_index = None
+        self.spatial_index_lock = threading.Lock()
+
+    def refresh_registry(self):
+        """
+        Evict cached registry entries written by other processes.  Polls the
+        registry_version counters at most every registry_poll_interval
+        seconds, on a connection of its own so the session's transaction
+        can't hide the latest values
+        """
+        now = time.time()
+        if now - self.registry_polled < self.registry_poll_interval:
+            return
+        with self.registry_lock:
+            if now - self.registry_polled < self.registry_poll_interval:
+                return
+            self.registry_polled = now
+            table = RegistryVersion.__table__
+            versions = dict(self.session.get_bind().execute(
+                select([table.c.name, table.c.version])).fetchall())
+            if self.registry_versions is not None:
+                for name in REGISTRY_ENTITIES:
+                    if versions.get(name, 0) != \
+                            self.registry_versions.get(name, 0):
+                        self.evict_registry(name)
+            self.registry_versions = versions
+
+    def get_registry_generation(self):
+        self.refresh_registry()
+        versions = self.registry_versions or {}
+        return ".".join(str(versions.get(name, 0)) for name in REGISTRY_ENTITIES)
+
+    def bump_registry_version(self, name):
+        """
+        Record a committed write to a kind of registry entity so other
+        processes evict their cached copies.  Returns the new counter
+        """
+        version = self.count_registry_version(name)
+
+        # this process already updated its own caches for the write, so only
+        # evict if other processes have written too
+        with self.registry_lock:
+            versions = self.registry_versions
+            if versions is not None and \
+                    version == versions.get(name, 0) + 1:
+                versions = dict(versions)
+                versions[name] = version
+                self.registry_versions = versions
+            else:
+                self.registry_polled = 0
+        return version
+
+    def count_registry_version(self, name):
+        """
+        Increment a registry_version counter, creating it on first use.
+        Returns the new value
+        """
+        table = RegistryVersion.__table__
+        bind = self.session.get_bind()
+        version = self.increment_registry_version(bind, name)
+        if version is None:
+            try:
+                bind.execute(table.insert().values(name=name, version=1))
+                version = 1
+            except IntegrityError:
+                # another process created the counter first
+                version = self.increment_registry_version(bind, name)
+        return version
+
+    def increment_registry_version(self, bind, name):
+        """
+        Increment a registry_version counter, returns the new value or None
+        if the counter does not exist yet.  The value is read back in the
+        same transaction, while the row is still locked by the update
+        """
+        table = RegistryVersion.__table__
+        with bind.begin() as connection:
+            if not connection.execute(table.update().where(
+                    table.c.name == name).values(
+                    version=table.c.version + 1)).rowcount:
+                return None
+            return connection.execute(select([table.c.version]).where(
+                table.c.name == name)).scalar()
+
+    def evict_registry(self, name):
+        """Drop everything cached about a kind of registry entity"""
+        if name == "platform":
+            self.platform_cache.clear()
+            with self.spatial_index_lock:
+                self.spatial_index = None
+                self.cluster_index = None
+        elif name == "sensor":
+            self.sensor_cache.clear()
+        elif name == "parameter":
+            self.observation_tables.clear()
+            self.rollup_tables.clear()
+
+    def build_observation_table(self, link, layout=None):
+        """
+        Build or reuse the mapped class for an o_N table.  Unless the layout,
+        a (mixin, value type) pair, is given it is read from the table in the
+        database.  Returns None if the table doesn't exist yet
+        """
         classname = "o_" + str(link)
-        table = type(classname, (Base, Observation), {'__tablename__' : classname})
+        table = observation_classes.get(classname)
+        replaced = table is not None and layout is not None and \
+            (layout[0] not in table.__bases__ or table.value_type != layout[1])
+        if replaced:
+            # built for an earlier table of the same name, eg one dropped
+            forget_table(classname)
+            table = None
+        if table is None:
+            layout = layout or self.observation_layout(classname)
+            if layout is None:
+                return None
+            mixin, value_type = layout
+            with warnings.catch_warnings():
+                if replaced:
+                    # declarative warns that the class name is reused
+                    warnings.simplefilter("ignore", SAWarning)
+                table = build_table(
+                    classname, mixin, link,
+                    value=Column(VALUE_TYPES[value_type][0]()),
+                    value_type=value_type)
         return table
 
-    def get_platform(self, platform_id):
-        obj = self.session.query(Platform).filter(Platform.platform_id == platform_id).first()
-        if obj:
-            json = obj.__dict__
+    def observation_layout(self, tablename):
+        """
+        The mixin and value type an o_N table was created with, or None if
+        it doesn't exist yet.  Tables keyed by a DateTime predate epoch keys
+        and are still read and written as they are
+        """
+        try:
+            columns = inspect(self.session.get_bind()).get_columns(tablename)
+        except NoSuchTableError:
+            columns = []
+        if not columns:
+            # the parameter is committed before its table is created
+            return None
+        mixin = EpochObservation
+        value_type = DEFAULT_VALUE_TYPE
+        for column in columns:
+            if column["name"] == "timestamp" and \
+                    isinstance(column["type"], DateTime):
+                mixin = Observation
+            elif column["name"] == "value":
+                value_type = value_type_of(column["type"])
+        return mixin, value_type
+
+    def build_rollup_table(self, table, suffix):
+        """Build or reuse the mapped class for a rollup of an o_N table"""
+        mixin = EpochRollup if issubclass(table, EpochKey) else Rollup
+        link = table.observation_link
+        return build_table("o_%s_%s" % (link, suffix), mixin, link)
+
+    def get_rollup_tables(self, table):
+        """
+        Lookup the rollup tables that exist for an o_N table
+
+        Returns
+        -------
+            dict
+                mapped rollup class by bucket width in seconds
+        """
+        link = table.observation_link
+        rollups = self.rollup_tables.get(link)
+        if rollups is None:
+            bind = self.session.get_bind()
+            rollups = {}
+            for suffix in ROLLUPS:
+                rollup = self.build_rollup_table(table, suffix)
+                if bind.has_table(rollup.__tablename__):
+                    rollups[ROLLUPS[suffix]] = rollup
+            self.rollup_tables.put(link, rollups)
+        return rollups
+
+    def update_rollups(self, table, rows, replaced=()):
+        """
+        Bring the rollup buckets touched by a batch of o_N rows up to date.
+        New rows are folded into their buckets.  Buckets holding a row that
+        overwrote a stored one (replaced, a set of keys) are recomputed from
+        what is stored instead, so writing the same observations twice
+        leaves the rollups unchanged.  A recomputed bucket is built from the
+        next finer rollup where the widths divide, eg a day from 24 hourly
+        rows instead of 86400 observations
+        """
+        rollups = self.get_rollup_tables(table)
+        if not rollups or not rows:
+            return
+
+        # the upsert keeps the last row written for each key
+        latest = dict((row["timestamp"], row["value"]) for row in rows)
+        added = sorted(key for key in latest if key not in replaced)
+        timestamps = numpy.array([table.from_key(key) for key in added])
+        values = numpy.array([latest[key] for key in added],
+                             dtype=numpy.float64)
+        replaced = numpy.array([table.from_key(key) for key in replaced])
+
+        finer = None
+        for width in sorted(rollups):
+            rollup = rollups[width]
+            dirty = numpy.unique(numpy.floor(replaced / width) * width)
+            buckets = []
+            for start, end in bucket_runs(dirty, width):
+                if finer is not None and width % finer == 0:
+                    buckets.extend(
+                        self.combine_rollup(rollups[finer], width, start, end))
+                else:
+                    buckets.extend(self.build_rollup(table, width, start, end))
+
+            # fold new rows into the buckets that weren't recomputed
+            starts = numpy.floor(timestamps / width) * width
+            clean = ~numpy.in1d(starts, dirty)
+            buckets.extend(self.fold_rollup(
+                table, rollup, width, timestamps[clean], values[clean]))
+            if buckets:
+                self.session.execute(Upsert(rollup.__table__).values(buckets))
+            finer = width
+
+    def lock_rollups(self, table):
+        """
+        Make writers to an o_N table with rollups take turns, so each sees
+        the observations the last one stored when deciding what to fold in.
+        The parameter row is locked by a write that opens the transaction,
+        which also takes the write lock on SQLite, so nothing is read from
+        a snapshot older than the lock
+        """
+        self.session.commit()
+        parameter = Parameter.__table__
+        self.session.execute(parameter.update().where(
+            parameter.c.observation_link == table.observation_link).values(
+            observation_link=parameter.c.observation_link))
+
+    def stored_keys(self, table, rows):
+        """
+        The keys of a batch of o_N rows that are already stored, only looked
+        up when the table has rollups to keep exact.  Reliable once
+        lock_rollups() has been called
+        """
+        if not self.get_rollup_tables(table):
+            return set()
+        keys = [row["timestamp"] for row in rows]
+        return set(key for key, in self.session.query(table.timestamp).filter(
+            table.timestamp.in_(keys)))
+
+    def fold_rollup(self, table, rollup, width, timestamps, values):
+        """
+        Rollup rows with new observations, sorted timestamps and their
+        values, added to the stored buckets
+        """
+        if not len(timestamps):
+            return []
+        buckets = self.rollup_buckets(table, width, timestamps, values)
+        keys = [bucket["timestamp"] for bucket in buckets]
+        # locked so concurrent writers to a bucket fold one after the other
+        stored = dict((row.timestamp, row) for row in self.session.query(
+            rollup).filter(rollup.timestamp.in_(keys)).with_for_update())
+        for bucket in buckets:
+            current = stored.get(bucket["timestamp"])
+            if current is None:
+                continue
+            bucket["count"] += current.count
+            bucket["sum"] += current.sum
+            bucket["min"] = min(bucket["min"], current.min)
+            bucket["max"] = max(bucket["max"], current.max)
+            if current.last_timestamp > bucket["last_timestamp"]:
+                bucket["last_timestamp"] = current.last_timestamp
+                bucket["last"] = current.last
+        return buckets
+
+    def build_rollup(self, table, width, start, end):
+        """Rollup rows for the buckets of an o_N table in start <= t < end"""
+        timestamps, values = self.read_observation_arrays(table, start, end)
+        return self.rollup_buckets(table, width, timestamps, values)
+
+    def rollup_buckets(self, table, width, timestamps, values):
+        """Rollup rows for sorted observation timestamps and values"""
+        if not len(timestamps):
+            return []
+        buckets = aggregate.aggregate(
+            timestamps, values, width, ["count", "sum", "min", "max"])
+
+        # rows are sorted so the last row in each bucket is the one just
+        # before the next bucket starts
+        starts = [bucket["timestamp"] for bucket in buckets]
+        ends = numpy.searchsorted(timestamps, starts[1:] + [numpy.inf]) - 1
+        for bucket, last in zip(buckets, ends):
+            bucket["timestamp"] = table.to_key(bucket["timestamp"])
+            bucket["last_timestamp"] = table.to_key(timestamps[last])
+            bucket["last"] = float(values[last])
+        return buckets
+
+    def combine_rollup(self, finer, width, start, end):
+        """
+        Rollup rows of a coarser width built from a finer rollup table's
+        rows in start <= t < end
+        """
+        rows = self.filter_observation_range(
+            self.session.query(finer), finer, start, end
+        ).order_by(finer.timestamp).all()
+        if not rows:
+            return []
+        timestamps = numpy.array(
+            [finer.from_key(row.timestamp) for row in rows])
+        starts, index = numpy.unique(
+            numpy.floor(timestamps / width) * width, return_index=True)
+        ends = numpy.append(index[1:], len(rows)) - 1
+        counts = numpy.add.reduceat([row.count for row in rows], index)
+        sums = numpy.add.reduceat([row.sum for row in rows], index)
+        mins = numpy.minimum.reduceat([row.min for row in rows], index)
+        maxs = numpy.maximum.reduceat([row.max for row in rows], index)
+
+        buckets = []
+        for i, bucket_start in enumerate(starts.tolist()):
+            # finer rows are in time order so the last one holds the latest
+            # observation of the bucket
+            last = rows[ends[i]]
+            buckets.append({
+                "timestamp": finer.to_key(bucket_start),
+                "count": int(counts[i]),
+                "sum": float(sums[i]),
+                "min": float(mins[i]),
+                "max": float(maxs[i]),
+                "last_timestamp": last.last_timestamp,
+                "last": last.last
+            })
+        return buckets
+
+    def get_observation_table(self,
+                              platform_id,
+                              manufacturer,
+                              model,
+                              serial_number,
+                              phenomena):
+        """
+        Lookup the o_N table for a parameter, returns None if the parameter
+        or its table does not exist.  Results are cached until the parameter is created or
+        deleted through this backend
+        """
+        self.refresh_registry()
+        key = (platform_id, manufacturer, model, serial_number, phenomena)
+        table = self.observation_tables.get(key)
+        if table is None:
+            parameter = self.session.query(Parameter.observation_link).filter_by(
+                platform_id=platform_id,
+                manufacturer=manufacturer,
+                model=model,
+                serial_number=serial_number,
+                phenomena=phenomena
+                ).first()
+            if parameter:
+                table = self.build_observation_table(parameter.observation_link)
+                if table is not None:
+                    self.observation_tables.put(key, table)
+        return table
+
+    def get_observation_generation(self, *key):
+        # o_N tables count writes to sealed time in registry_version, under
+        # their own name, and are polled along with the registry counters
+        table = self.get_observation_table(*key)
+        if table is None:
+            return "0"
+        versions = self.registry_versions or {}
+        return str(versions.get(table.__tablename__, 0))
+
+    def seal_observations(self, table, oldest):
+        """
+        Count a committed write to a parameter that reached older than
+        observation_seal_age seconds, changing its sealed time ranges
+        """
+        if oldest < time.time() - self.observation_seal_age:
+            name = table.__tablename__
+            version = self.count_registry_version(name)
+            # seen at once by this process, others on their next poll
+            with self.registry_lock:
+                versions = self.registry_versions
+                if versions is not None and \
+                        version > versions.get(name, 0):
+                    versions = dict(versions)
+                    versions[name] = version
+                    self.registry_versions = versions
+
+    def require_observation_table(self, *key):
+        """Lookup the o_N table for a parameter or abort with 404"""
+        table = self.get_observation_table(*key)
+        if table is None:
+            flask.abort(status.NOT_FOUND)
+        return table
+
+    def filter_observation_range(self, query, table, start=None, end=None):
+        """Restrict a query to the time range start <= timestamp < end"""
+        if start is not None:
+            query = query.filter(table.timestamp >= table.to_key(start))
+        if end is not None:
+            query = query.filter(table.timestamp < table.to_key(end))
+        return query
+
+    def epoch_expression(self, table):
+        """
+        SQL expression for the timestamp of an o_N or rollup table counted in
+        table.resolution units since 1970, or None if the database dialect
+        has no functions to convert a DateTime key
+        """
+        if issubclass(table, EpochKey):
+            return table.timestamp
+        column = table.timestamp
+        dialect = self.session.get_bind().dialect.name
+        if dialect == "mysql":
+            # unlike UNIX_TIMESTAMP this ignores the session time zone
+            expression = func.timestampdiff(
+                literal_column("SECOND"),
+                literal_column("'1970-01-01 00:00:00'"),
+                column)
+        elif dialect == "sqlite":
+            expression = cast(func.strftime("%s", column), Integer)
         else:
-            json = None
-        return json
+            expression = None
+        return expression
+
+    def get_platform(self, platform_id):
+        self.refresh_registry()
+        json = self.platform_cache.get(platform_id)
+        if json is None:
+            obj = self.session.query(Platform).filter(Platform.platform_id == platform_id).first()
+            if obj:
+                json = row_dict(obj)
+                self.platform_cache.put(platform_id, json)
+        # hand out a copy, callers such as put_info() modify what they get
+        return dict(json) if json is not None else None
 
     def get_sensor(self, platform_id, manufacturer, model, serial_number):
-        obj = self.session.query(Sensor).filter(
-            Sensor.platform_id == platform_id,
-            Sensor.manufacturer == manufacturer,
-            Sensor.model == model,
-            Sensor.serial_number == serial_number).first()
-        if obj:
-            json = obj.__dict__
-        else:
-            json = None
-        return json
+        self.refresh_registry()
+        key = (platform_id, manufacturer, model, serial_number)
+        json = self.sensor_cache.get(key)
+        if json is None:
+            obj = self.session.query(Sensor).filter(
+                Sensor.platform_id == platform_id,
+                Sensor.manufacturer == manufacturer,
+                Sensor.model == model,
+                Sensor.serial_number == serial_number).first()
+            if obj:
+                json = row_dict(obj)
+                self.sensor_cache.put(key, json)
+        return dict(json) if json is not None else None
 
-    def get_platforms(self):
-        data = self.session.query(Platform).all()
-        result = []
-        for row in data:
-            result.append(row.__dict__)
-        return result
+    def get_cache_stats(self):
+        return {
+            "platform": self.platform_cache.stats(),
+            "sensor": self.sensor_cache.stats(),
+            "parameter": self.observation_tables.stats()
+        }
+
+    def iterate(self, query):
+        """
+        Generate a dictionary of column values for each row of a query,
+        fetching from a server side cursor in batches
+        """
+        query = query.execution_options(stream_results=True) \
+            .yield_per(self.list_batch_size)
+        for row in query:
+            yield row_dict(row)
+
+    def load_spatial_indexes(self):
+        """
+        Build the grid index and map clusters of platform locations from the
+        platform table the first time they are needed.  create_platform() and
+        delete_platform() keep them up to date from then on
+        """
+        self.refresh_registry()
+        with self.spatial_index_lock:
+            if self.spatial_index is None:
+                index = spatial.GridIndex()
+                clusters = spatial.ClusterIndex()
+                query = self.session.query(
+                    Platform.platform_id, Platform.longitude, Platform.latitude
+                ).filter(Platform.longitude != None)
+                for platform_id, longitude, latitude in query:
+                    index.insert(platform_id, longitude, latitude)
+                    clusters.insert(platform_id, longitude, latitude)
+                self.cluster_index = clusters
+                self.spatial_index = index
+
+    def get_spatial_index(self):
+        self.load_spatial_indexes()
+        return self.spatial_index
+
+    def get_platform_clusters(self, box, zoom):
+        self.load_spatial_indexes()
+        return self.cluster_index.query(box, zoom)
+
+    def get_nearest_platforms(self, x, y, k, phenomena=None):
+        accept = None
+        if phenomena is not None:
+            platform_ids = set(platform_id for platform_id, in
+                               self.session.query(Parameter.platform_id)
+                               .filter(Parameter.phenomena == phenomena)
+                               .distinct())
+            accept = platform_ids.__contains__
+        nearest = self.get_spatial_index().nearest(x, y, k, accept)
+        if not nearest:
+            return []
+
+        platforms = dict(
+            (row.platform_id, row_dict(row))
+            for row in self.session.query(Platform).filter(
+                Platform.platform_id.in_([key for _, key in nearest])))
+        data = []
+        for distance, platform_id in nearest:
+            # skip platforms deleted by another process since indexing
+            if platform_id in platforms:
+                platform = platforms[platform_id]
+                platform["distance"] = distance
+                data.append(platform)
+        return data
+
+    def get_platforms(self, limit=None, after=None, region=None):
+        query = self.session.query(Platform)
+        if region is not None:
+            platform_ids = sorted(self.get_spatial_index().query(region))
+            if limit:
+                # page through the matches before asking the database
+                if after is not None:
+                    platform_ids = [platform_id for platform_id in platform_ids
+                                    if platform_id > after]
+                platform_ids = platform_ids[:limit]
+            if not platform_ids:
+                return iter([])
+            query = query.filter(Platform.platform_id.in_(platform_ids))
+        if limit:
+            # seek on the primary key so every page costs the same
+            if after is not None:
+                query = query.filter(Platform.platform_id > after)
+            query = query.order_by(Platform.platform_id).limit(limit)
+        return self.iterate(query)
 
 
     def create_platform(self, platform_dict):
@@ -112,8 +952,26 @@ class Mysql(LsdBackend):
         platform.description = platform_dict["description"]
         platform.info = platform_dict["info"]
         platform.location = platform_dict["location"]
+        longitude, latitude = spatial.location_coordinates(platform.location)
+        platform.longitude = longitude
+        platform.latitude = latitude
         self.session.add(platform)
         self.session.commit()
+        self.platform_cache.invalidate(platform_dict["platform_id"])
+        self.bump_registry_version("platform")
+        self.index_platform(platform_dict["platform_id"], longitude, latitude)
+
+    def index_platform(self, platform_id, longitude, latitude):
+        """Update the spatial indexes, if loaded, for a platform's location"""
+        with self.spatial_index_lock:
+            index, clusters = self.spatial_index, self.cluster_index
+        if index is not None:
+            if longitude is None:
+                index.remove(platform_id)
+                clusters.remove(platform_id)
+            else:
+                index.insert(platform_id, longitude, latitude)
+                clusters.insert(platform_id, longitude, latitude)
 
     def create_sensor(self, data):
         sensor = Sensor()
@@ -125,18 +983,56 @@ class Mysql(LsdBackend):
         sensor.info = data["info"]
         self.session.add(sensor)
         self.session.commit()
+        self.sensor_cache.invalidate((data["platform_id"],
+                                      data["manufacturer"],
+                                      data["model"],
+                                      data["serial_number"]))
+        self.bump_registry_version("sensor")
 
     def update_platform(self, data):
-        pass
+        platform_id = data["platform_id"]
+        platform = self.session.query(Platform).filter_by(
+            platform_id=platform_id).first()
+        if platform is None:
+            flask.abort(status.NOT_FOUND)
+        for field in ["name", "description", "info", "location"]:
+            if field in data:
+                setattr(platform, field, data[field])
+        longitude, latitude = spatial.location_coordinates(platform.location)
+        platform.longitude = longitude
+        platform.latitude = latitude
+        self.session.commit()
+        self.platform_cache.invalidate(platform_id)
+        self.bump_registry_version("platform")
+        self.index_platform(platform_id, longitude, latitude)
 
     def update_sensor(self, data):
-        pass
+        key = (data["platform_id"],
+               data["manufacturer"],
+               data["model"],
+               data["serial_number"])
+        sensor = self.session.query(Sensor).filter_by(
+            platform_id=key[0],
+            manufacturer=key[1],
+            model=key[2],
+            serial_number=key[3]).first()
+        if sensor is None:
+            flask.abort(status.NOT_FOUND)
+        for field in ["description", "info"]:
+            if field in data:
+                setattr(sensor, field, data[field])
+        self.session.commit()
+        self.sensor_cache.invalidate(key)
+        self.bump_registry_version("sensor")
 
     def delete_platform(self, platform_id):
         platform = self.session.query(Platform).filter_by(
             platform_id=platform_id).first()
         self.session.delete(platform)
         self.session.commit()
+        self.platform_cache.invalidate(platform_id)
+        self.bump_registry_version("platform")
+        self.index_platform(platform_id, None, None)
 
     def delete_sensor(self, platform_id, manufacturer, model, serial_number):
         sensor = self.session.query(Sensor).filter_by(
@@ -146,11 +1042,25 @@ class Mysql(LsdBackend):
             serial_number=serial_number).first()
         self.session.delete(sensor)
         self.session.commit()
+        self.sensor_cache.invalidate(
+            (platform_id, manufacturer, model, serial_number))
+        self.bump_registry_version("sensor")
 
     def create_parameter(self, data):
-        # Allocate a new observation table
-        observation_link = ObservationLink()
-        observation_link = self.session.merge(observation_link)
+        value_type = self.phenomena_value_type(data["phenomena"])
+
+        # take a ready made observation table from the pool if there is one,
+        # otherwise allocate a new one and create it once committed
+        link = None
+        if self.observation_pool:
+            link = self.claim_observation_table(value_type)
+        pooled = link is not None
+        if not pooled:
+            observation_link = ObservationLink()
+            observation_link = self.session.merge(observation_link)
+            # flush to obtain the auto increment id for the new link
+            self.session.flush()
+            link = observation_link.observation_link_id
 
         parameter = Parameter()
         parameter.platform_id = data["platform_id"]
@@ -158,16 +1068,100 @@ class Mysql(LsdBackend):
         parameter.model = data["model"]
         parameter.serial_number = data["serial_number"]
         parameter.phenomena = data["phenomena"]
-        parameter.observation_link = observation_link.observation_link_id
+        parameter.observation_link = link
         self.session.add(parameter)
         self.session.commit()
+        self.observation_tables.invalidate((
+            parameter.platform_id,
+            parameter.manufacturer,
+            parameter.model,
+            parameter.serial_number,
+            parameter.phenomena))
+        self.bump_registry_version("parameter")
 
-        # once committed, there should be a value in parameter.observation_link
-        self.build_observation_table(
-            parameter.observation_link).__table__.create(self.session.bind) #bind=engine)
+        if not pooled:
+            self.create_observation_table(link, value_type)
 
-    def get_parameter(self, parameter_id):
-        pass
+    def phenomena_value_type(self, phenomena):
+        """The VALUE_TYPES entry for the o_N table of a phenomena"""
+        data_type = self.session.query(Phenomena.data_type).filter_by(
+            term=phenomena).scalar()
+        if data_type not in VALUE_TYPES:
+            data_type = DEFAULT_VALUE_TYPE
+        return data_type
+
+    def claim_observation_table(self, value_type):
+        """
+        Take a pooled o_N table of value_type inside the session's
+        transaction, so it only leaves the pool if the transaction commits.
+        Returns its observation link, or None if none could be claimed
+        """
+        pool = ObservationPool.__table__
+        candidates = self.session.query(ObservationPool.observation_link) \
+            .filter_by(value_type=value_type) \
+            .order_by(ObservationPool.observation_link) \
+            .limit(self.pool_claim_candidates)
+        for link, in candidates.all():
+            # concurrent registrations may pick the same table, only the one
+            # whose delete removes the row gets it
+            claimed = self.session.execute(pool.delete().where(
+                pool.c.observation_link == link)).rowcount
+            if claimed:
+                return link
+        return None
+
+    def fill_observation_pool(self, value_type, size):
+        """
+        Create o_N tables of value_type until size of them are pooled.
+        Returns the number created
+        """
+        created = 0
+        while self.session.query(ObservationPool).filter_by(
+                value_type=value_type).count() < size:
+            observation_link = self.session.merge(ObservationLink())
+            self.session.flush()
+            link = observation_link.observation_link_id
+            self.session.commit()
+            # only pooled once the tables exist, a crash in between leaks an
+            # unused link
+            self.create_observation_table(link, value_type)
+            self.session.add(
+                ObservationPool(observation_link=link, value_type=value_type))
+            self.session.commit()
+            created += 1
+        self.session.commit()
+        return created
+
+    def create_observation_table(self, link, value_type):
+        """Create the o_N table, and any rollups, for a new parameter"""
+        table = self.build_observation_table(
+            link, (EpochObservation, value_type))
+        self.create_table(table)
+        if self.observation_rollups:
+            for suffix in ROLLUPS:
+                self.create_table(self.build_rollup_table(table, suffix))
+
+    def create_table(self, table):
+        """Create the table of a mapped observation or rollup class"""
+        table.__table__.create(self.session.bind)
+
+    def get_parameter(self,
+                      platform_id,
+                      manufacturer,
+                      model,
+                      serial_number,
+                      phenomena):
+        # the natural key and the cached o_N class hold the whole row
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        return {
+            "platform_id": platform_id,
+            "manufacturer": manufacturer,
+            "model": model,
+            "serial_number": serial_number,
+            "phenomena": phenomena,
+            "observation_link": table.observation_link
+        }
 
     def delete_parameter(self,
                          platform_id,
@@ -187,18 +1181,35 @@ class Mysql(LsdBackend):
             self.session.commit()
         else:
             print "non found"
-
-    def get_parameters(self):
-        pass
+        self.observation_tables.invalidate(
+            (platform_id, manufacturer, model, serial_number, phenomena))
+        self.bump_registry_version("parameter")
 
     def create_phenomena(self, data):
-        pass
+        phenomena = Phenomena()
+        phenomena.term = data["term"]
+        for field in ["data_type", "min_valid", "max_valid", "uom",
+                      "description"]:
+            setattr(phenomena, field, data.get(field))
+        self.session.add(phenomena)
+        try:
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            flask.abort(status.CONFLICT)
 
     def get_phenomena(self, term):
-        pass
+        phenomena = self.session.query(Phenomena).filter_by(term=term).first()
+        if phenomena is None:
+            flask.abort(status.NOT_FOUND)
+        return row_dict(phenomena)
 
     def delete_phenomena(self, term):
-        pass
+        phenomena = self.session.query(Phenomena).filter_by(term=term).first()
+        if phenomena is None:
+            flask.abort(status.NOT_FOUND)
+        self.session.delete(phenomena)
+        self.session.commit()
 
     def create_flag(self, data):
         pass
@@ -209,25 +1220,260 @@ class Mysql(LsdBackend):
     def delete_flag(self, term):
         pass
 
-    def get_sensors(self, platform_id=None, manufacturer=None, model=None):
-        data = self.session.query(Sensor).all()
-        result = []
-        for row in data:
-            result.append(row.__dict__)
-        return result
+    def filter_query(self, query, table, key, filters, columns):
+        """
+        Push natural key prefix and query string filters down into the WHERE
+        clause.  key is a list of (column name, value) pairs where None values
+        are ignored, columns maps filter names to columns
+        """
+        for name, value in key:
+            if value is not None:
+                query = query.filter(getattr(table, name) == value)
+        for name, value in (filters or {}).items():
+            if name == "parameter_phenomena" and table is Sensor:
+                query = query.filter(exists().where(and_(
+                    Parameter.platform_id == Sensor.platform_id,
+                    Parameter.manufacturer == Sensor.manufacturer,
+                    Parameter.model == Sensor.model,
+                    Parameter.serial_number == Sensor.serial_number,
+                    Parameter.phenomena == value)))
+            elif name in columns:
+                query = query.filter(columns[name] == value)
+        return query
 
-    def get_parameters(self, platform_id=None, manufacturer=None, model=None, serial_number=None):
-        data = self.session.query(Parameter).all()
-        result = []
-        for row in data:
-            result.append(row.__dict__)
-        return result
+    def get_sensors(self, platform_id=None, manufacturer=None, model=None,
+                    filters=None):
+        query = self.filter_query(
+            self.session.query(Sensor),
+            Sensor,
+            [("platform_id", platform_id),
+             ("manufacturer", manufacturer),
+             ("model", model)],
+            filters,
+            {
+                "sensor_manufacturer": Sensor.manufacturer,
+                "sensor_model": Sensor.model,
+                "sensor_serial_number": Sensor.serial_number,
+                "sensor_description": Sensor.description,
+                "sensor_info": Sensor.info
+            })
+        return self.iterate(query)
+
+    def get_parameters(self, platform_id=None, manufacturer=None, model=None,
+                       serial_number=None, filters=None):
+        query = self.filter_query(
+            self.session.query(Parameter),
+            Parameter,
+            [("platform_id", platform_id),
+             ("manufacturer", manufacturer),
+             ("model", model),
+             ("serial_number", serial_number)],
+            filters,
+            {"parameter_phenomena": Parameter.phenomena})
+        return self.iterate(query)
 
     def get_flags(self):
         pass
 
+    def create_observations(self,
+                            platform_id,
+                            manufacturer,
+                            model,
+                            serial_number,
+                            phenomena,
+                            observations):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+        # write the observations as chunked multi-row upserts inside a single
+        # transaction so that a batch is either stored completely or not at
+        # all, and a resent batch overwrites rather than conflicts
+        insert = Upsert(table.__table__)
+        observations = iter(observations)
+        oldest = float("inf")
+        try:
+            if self.get_rollup_tables(table):
+                self.lock_rollups(table)
+            while True:
+                chunk = list(islice(observations, self.observation_batch_size))
+                if not chunk:
+                    break
+                # convert the chunk's values as one typed array
+                try:
+                    values = convert_values(
+                        [observation["value"] for observation in chunk],
+                        table.value_type)
+                except ValueError:
+                    flask.abort(status.BAD_REQUEST)
+                rows = [{
+                    "timestamp": table.to_key(observation["timestamp"]),
+                    "value": value
+                } for observation, value in zip(chunk, values)]
+                oldest = min([oldest] + [
+                    observation["timestamp"] for observation in chunk])
+                replaced = self.stored_keys(table, rows)
+                self.session.execute(insert.values(rows))
+                self.update_rollups(table, rows, replaced)
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            flask.abort(status.CONFLICT)
+        except:
+            # streamed observations are validated as they are consumed
+            self.session.rollback()
+            raise
+        self.seal_observations(table, oldest)
+
     def get_phenomenas(self):
-        pass
+        return self.iterate(
+            self.session.query(Phenomena).order_by(Phenomena.term))
+
+    def get_observations(self,
+                         platform_id,
+                         manufacturer,
+                         model,
+                         serial_number,
+                         phenomena,
+                         start=None,
+                         end=None,
+                         limit=None,
+                         after=None):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+        # seek on the timestamp primary key rather than using OFFSET so every
+        # page is a bounded index range scan
+        query = self.session.query(table.timestamp, table.value)
+        query = self.filter_observation_range(query, table, start, end)
+        if after is not None:
+            query = query.filter(table.timestamp > table.to_key(after))
+        query = query.order_by(table.timestamp)
+        if limit:
+            query = query.limit(limit)
+
+        return [{"timestamp": table.from_key(timestamp), "value": value}
+                for timestamp, value in query]
+
+    def get_observation_arrays(self,
+                               platform_id,
+                               manufacturer,
+                               model,
+                               serial_number,
+                               phenomena,
+                               start=None,
+                               end=None):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        return self.read_observation_arrays(table, start, end)
+
+    def read_observation_arrays(self, table, start=None, end=None):
+        """
+        The timestamps and values of an o_N table in start <= t < end as
+        float64 arrays in time order
+        """
+        epoch = self.epoch_expression(table)
+        if epoch is None:
+            query = self.session.query(table.timestamp, table.value)
+        else:
+            query = self.session.query(epoch, table.value)
+        query = self.filter_observation_range(query, table, start, end)
+        # fetch from the cursor in chunks rather than materialising every row
+        query = query.order_by(table.timestamp).yield_per(10000)
+
+        if epoch is None:
+            query = ((table.from_key(timestamp), value)
+                     for timestamp, value in query)
+
+        # flatten the rows straight into one contiguous buffer and split it
+        # into columns, no per-row python objects are kept
+        rows = numpy.fromiter(chain.from_iterable(query), dtype=numpy.float64)
+        rows = rows.reshape(-1, 2)
+        timestamps = rows[:, 0]
+        if table.resolution != 1:
+            timestamps = timestamps / table.resolution
+        return (numpy.ascontiguousarray(timestamps),
+                numpy.ascontiguousarray(rows[:, 1]))
+
+    def choose_rollup(self, table, bucket, aggs, start, end):
+        """
+        Pick the coarsest rollup table that can answer an aggregate query
+        exactly, or None if the raw o_N table must be used.  The bucket must
+        be a multiple of the rollup width and the time range must start and
+        end on rollup boundaries
+        """
+        if not all(agg in ROLLUP_AGGREGATES for agg in aggs):
+            return None
+
+        chosen = None
+        rollups = self.get_rollup_tables(table)
+        for width in sorted(rollups):
+            aligned = bucket % width == 0
+            for limit in [start, end]:
+                if limit is not None and limit % width != 0:
+                    aligned = False
+            if aligned:
+                chosen = rollups[width]
+        return chosen
+
+    def get_observation_aggregates(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena,
+                                   bucket,
+                                   aggs,
+                                   start=None,
+                                   end=None):
+        table = self.require_observation_table(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        epoch = self.epoch_expression(table)
+        if epoch is None:
+            # no date functions for this database, aggregate in numpy instead
+            timestamps, values = self.get_observation_arrays(
+                platform_id, manufacturer, model, serial_number, phenomena,
+                start=start, end=end)
+            return aggregate.aggregate(timestamps, values, bucket, aggs)
+
+        rollup = self.choose_rollup(table, bucket, aggs, start, end)
+        if rollup is not None:
+            source = rollup
+            epoch = self.epoch_expression(rollup)
+            functions = {
+                "count": lambda: func.sum(rollup.count),
+                "sum": lambda: func.sum(rollup.sum),
+                "min": lambda: func.min(rollup.min),
+                "max": lambda: func.max(rollup.max),
+                "mean": lambda: func.sum(rollup.sum) / func.sum(rollup.count)
+            }
+        else:
+            source = table
+            functions = {
+                "count": lambda: func.count(table.value),
+                "sum": lambda: func.sum(table.value),
+                "min": lambda: func.min(table.value),
+                "max": lambda: func.max(table.value),
+                "mean": lambda: func.avg(table.value)
+            }
+
+        # floor to the bucket, correct for timestamps before 1970 too
+        width = literal_column(str(int(bucket) * source.resolution))
+        bucket_start = epoch - ((epoch % width) + width) % width
+        query = self.session.query(
+            bucket_start, *[functions[agg]() for agg in aggs])
+        query = self.filter_observation_range(query, source, start, end)
+        query = query.group_by(bucket_start).order_by(bucket_start)
+
+        result = []
+        for row in query:
+            item = {"timestamp": int(row[0]) // source.resolution}
+            for agg, value in zip(aggs, row[1:]):
+                if agg == "count":
+                    item[agg] = int(value)
+                else:
+                    item[agg] = None if value is None else float(value)
+            result.append(item)
+        return result
 
 
 LsdBackend.register(Mysql)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Backend for a single node keeping everything in one SQLite file, so small
+sites and test runs need no database server.
+
+Connections use the write-ahead log so readers don't block the writer, and
+o_N tables are created WITHOUT ROWID so observations are stored clustered
+on their timestamp key rather than in a rowid table plus a key index
+"""
+from lsdserver.backend.mysql import Mysql, Platform, Sensor, Parameter, \
+    Phenomena, ObservationLink, ObservationPool, RegistryVersion
+from lsdserver.base import Base
+from sqlalchemy import event
+from sqlalchemy.schema import CreateTable
+
+# tables of the registry, created in a new database file
+REGISTRY_TABLES = [Platform, Sensor, Parameter, Phenomena, ObservationLink,
+                   ObservationPool, RegistryVersion]
+
+# bytes of the database file read through a memory map rather than read()
+MMAP_SIZE = 256 * 1024 * 1024
+
+# page cache of each connection, negative values are KiB
+CACHE_SIZE = -64 * 1024
+
+# fsync at checkpoints rather than every commit.  With the write-ahead log a
+# crash of lsdserver loses nothing, losing power can lose the last commits
+SYNCHRONOUS = "NORMAL"
+
+# milliseconds a writer waits for another process's transaction to finish
+BUSY_TIMEOUT = 5000
+
+
+class Sqlite(Mysql):
+    """
+    Mysql backend tuned for an SQLite database, see prepare()
+    """
+
+    # SQLite before 3.32 allows 999 parameters in a statement, two for each
+    # observation row
+    observation_batch_size = 400
+
+    mmap_size = MMAP_SIZE
+    cache_size = CACHE_SIZE
+    synchronous = SYNCHRONOUS
+    busy_timeout = BUSY_TIMEOUT
+
+    def prepare(self, engine):
+        """
+        Set the pragmas on every new connection of engine and create the
+        registry tables if the database is new
+        """
+        event.listen(engine, "connect", self.set_pragmas)
+        Base.metadata.create_all(
+            engine, tables=[table.__table__ for table in REGISTRY_TABLES])
+
+    def set_pragmas(self, connection, record):
+        cursor = connection.cursor()
+        # persistent in the file, ignored by in-memory databases
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = %s" % self.synchronous)
+        cursor.execute("PRAGMA mmap_size = %d" % self.mmap_size)
+        cursor.execute("PRAGMA cache_size = %d" % self.cache_size)
+        cursor.execute("PRAGMA busy_timeout = %d" % self.busy_timeout)
+        # enforce the parameter to sensor key as InnoDB does
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+
+    def create_table(self, table):
+        # every observation and rollup table has a primary key, which
+        # WITHOUT ROWID requires
+        bind = self.session.bind
+        ddl = CreateTable(table.__table__).compile(dialect=bind.dialect)
+        bind.execute(str(ddl).rstrip() + " WITHOUT ROWID")
+        for index in table.__table__.indexes:
+            index.create(bind)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Columnar binary encodings of observation series.  Both formats carry the
+# timestamps and values as contiguous arrays so clients can load them without
+# parsing or copying
+import struct
+import numpy
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# little-endian uint64 count, then count float64 unix timestamps, then count
+# float64 values
+RAW_MIMETYPE = "application/octet-stream"
+
+# Apache Arrow IPC stream holding a single record batch of
+# timestamp (timestamp[us, UTC]) and value (double) columns
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def mimetypes():
+    """Binary mimetypes supported by this installation, most preferred first"""
+    supported = [RAW_MIMETYPE]
+    if pyarrow is not None:
+        supported.insert(0, ARROW_MIMETYPE)
+    return supported
+
+
+def encode_raw(timestamps, values):
+    timestamps = numpy.ascontiguousarray(timestamps, dtype='<f8')
+    values = numpy.ascontiguousarray(values, dtype='<f8')
+    return struct.pack('<Q', len(timestamps)) + \
+        timestamps.tobytes() + values.tobytes()
+
+
+def encode_arrow(timestamps, values):
+    micros = numpy.round(
+        numpy.asarray(timestamps, dtype=numpy.float64) * 1e6).astype(numpy.int64)
+    batch = pyarrow.RecordBatch.from_arrays([
+        pyarrow.array(micros, type=pyarrow.timestamp('us', tz='UTC')),
+        pyarrow.array(numpy.asarray(values, dtype=numpy.float64))
+    ], ['timestamp', 'value'])
+    sink = pyarrow.BufferOutputStream()
+    writer = pyarrow.RecordBatchStreamWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def encode(mimetype, timestamps, values):
+    """Encode a series of timestamps and values in the requested format"""
+    if mimetype == ARROW_MIMETYPE:
+        data = encode_arrow(timestamps, values)
+    else:
+        data = encode_raw(timestamps, values)
+    return data
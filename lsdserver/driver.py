@@ -76,6 +76,24 @@ class LsdBackend(object):
 
     __metaclass__ = ABCMeta
 
+    # query string filters supported by get_sensors and get_parameters
+    sensor_filters = [
+        "sensor_manufacturer",
+        "sensor_model",
+        "sensor_serial_number",
+        "sensor_description",
+        "sensor_info",
+        "parameter_phenomena"
+    ]
+
+    parameter_filters = [
+        "parameter_phenomena"
+    ]
+
+    # seconds after which observations are assumed to be complete, the
+    # OBSERVATION_SEAL_AGE setting
+    observation_seal_age = 86400
+
     @abstractmethod
     def get_platform(self, platform_id):
         """
@@ -85,7 +103,33 @@ class LsdBackend(object):
         pass
 
     @abstractmethod
-    def get_platforms(self, limit, offset):
+    def get_platform_clusters(self, box, zoom):
+        """
+        Grid clusters of platform locations for a map zoom level whose
+        centroid lies inside the spatial.BoundingBox box.  Each cluster is a
+        dictionary of count, longitude, latitude (the centroid) and a few
+        representative platform_ids
+        """
+        pass
+
+    @abstractmethod
+    def get_nearest_platforms(self, x, y, k, phenomena=None):
+        """
+        The k platforms located nearest to the point (x, y), closest first,
+        each with its planar distance from the point under "distance".
+        phenomena restricts the search to platforms with a parameter
+        measuring it
+        """
+        pass
+
+    @abstractmethod
+    def get_platforms(self, limit=None, after=None, region=None):
+        """
+        List platforms in platform_id order.  When limit is given at most
+        limit platforms are returned, starting after the platform_id `after`
+        (keyset pagination).  region (a spatial.BoundingBox or
+        spatial.Polygon) restricts the list to platforms located inside it
+        """
         pass
 
     @abstractmethod
@@ -117,7 +161,12 @@ class LsdBackend(object):
         pass
 
     @abstractmethod
-    def get_sensors(self, platform_id=None, manufacturer=None, model=None):
+    def get_sensors(self, platform_id=None, manufacturer=None, model=None,
+                    filters=None):
+        """
+        List sensors, optionally restricted to a platform, manufacturer and
+        model and filtered by exact matches on sensor_filters
+        """
         pass
 
     @abstractmethod
@@ -134,7 +183,12 @@ class LsdBackend(object):
         pass
 
     @abstractmethod
-    def get_parameters(self, platform_id=None, manufacturer=None, model=None, serial_number=None):
+    def get_parameters(self, platform_id=None, manufacturer=None, model=None,
+                       serial_number=None, filters=None):
+        """
+        List parameters, optionally restricted to a sensor key prefix and
+        filtered by exact matches on parameter_filters
+        """
         pass
 
     @abstractmethod
@@ -146,10 +200,6 @@ class LsdBackend(object):
                          phenomena):
         pass
 
-    @abstractmethod
-    def get_parameters(self):
-        pass
-
     @abstractmethod
     def create_phenomena(self, data):
         pass
@@ -180,4 +230,100 @@ class LsdBackend(object):
 
     @abstractmethod
     def delete_flag(self, term):
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def create_observations(self,
+                            platform_id,
+                            manufacturer,
+                            model,
+                            serial_number,
+                            phenomena,
+                            observations):
+        """
+        Store an iterable of {timestamp, value} dictionaries against the
+        parameter identified by the natural key.  Timestamps are unix
+        timestamps in UTC
+        """
+        pass
+
+    @abstractmethod
+    def get_observations(self,
+                         platform_id,
+                         manufacturer,
+                         model,
+                         serial_number,
+                         phenomena,
+                         start=None,
+                         end=None,
+                         limit=None,
+                         after=None):
+        """
+        List observations for a parameter in timestamp order as
+        {timestamp, value} dictionaries.  start is inclusive, end is exclusive
+        and after is the exclusive timestamp to resume a previous page from
+        """
+        pass
+
+    @abstractmethod
+    def get_observation_arrays(self,
+                               platform_id,
+                               manufacturer,
+                               model,
+                               serial_number,
+                               phenomena,
+                               start=None,
+                               end=None):
+        """
+        Read observations in a time range as a pair of numpy float64 arrays of
+        (unix timestamps, values) in timestamp order
+        """
+        pass
+
+    @abstractmethod
+    def get_observation_aggregates(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena,
+                                   bucket,
+                                   aggs,
+                                   start=None,
+                                   end=None):
+        """
+        Aggregate observations in a time range into buckets of `bucket`
+        seconds, see lsdserver.aggregate.aggregate for the result format
+        """
+        pass
+
+    @abstractmethod
+    def get_cache_stats(self):
+        """
+        Counters for the backend's in-process caches as a dictionary of
+        cache name to {size, entries, hits, misses}
+        """
+        pass
+
+    @abstractmethod
+    def get_registry_generation(self):
+        """
+        Token that changes whenever a platform, sensor or parameter is
+        created, updated or deleted.  Must be cheap, it is read on every
+        conditional GET
+        """
+        pass
+
+    @abstractmethod
+    def get_observation_generation(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena):
+        """
+        Token that changes whenever observations older than
+        observation_seal_age seconds are written for a parameter.  Must be
+        cheap, it is read on every conditional GET of a sealed time range
+        """
+        pass
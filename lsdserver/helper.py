@@ -1,6 +1,10 @@
 from flask import Blueprint, render_template, abort, current_app, redirect
+from itertools import chain
 from lsdserver import status
 import flask
+import functools
+import hashlib
+import urllib
 
 class Helper():
 
@@ -12,6 +16,26 @@ class Helper():
             request.accept_mimetypes[best] > \
             request.accept_mimetypes['text/html']
 
+    @staticmethod
+    def want_binary(request, mimetypes):
+        """
+        Return whichever of the binary mimetypes the client asked for by name
+        (wildcards don't count) or None if it would rather have JSON/HTML
+        """
+        best = request.accept_mimetypes \
+            .best_match(mimetypes + ['application/json', 'text/html'])
+        if best in mimetypes and best in request.accept_mimetypes.values():
+            wanted = best
+        else:
+            wanted = None
+        return wanted
+
+    @staticmethod
+    def get_filters(request, supported):
+        """Collect the supported filters present in the query string"""
+        return dict((name, request.args[name])
+                    for name in supported if name in request.args)
+
     @staticmethod
     def info_redirect(data):
         """Redirect to the info URI present in the `info` key or abort if missing"""
@@ -55,14 +79,161 @@ class Helper():
 
         return message, result
 
+    # number of list items encoded into each chunk of a streamed response
+    stream_chunk_size = 500
+
+    @staticmethod
+    def etag(request, *validators):
+        """
+        Strong entity tag for the representation asked for by request (its
+        URL and Accept header) that stays valid while validators don't change
+        """
+        digest = hashlib.sha1()
+        parts = (request.full_path, request.headers.get("Accept", "")) + \
+            validators
+        for part in parts:
+            digest.update(unicode(part).encode("utf-8") + "\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def conditional(tag, view, args, kwargs, cache_control=None):
+        """
+        Answer 304 NOT MODIFIED if the client already holds the entity tag,
+        without calling view.  Otherwise call view(*args, **kwargs) and tag
+        the response if it succeeded
+        """
+        if tag in flask.request.if_none_match:
+            response = flask.Response(status=status.NOT_MODIFIED)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != status.OK:
+                return response
+        response.set_etag(tag)
+        response.vary.add("Accept")
+        if cache_control:
+            response.headers["Cache-Control"] = cache_control
+        return response
+
+    @staticmethod
+    def registry_etag(view):
+        """
+        Decorate a GET view of registry data (platforms, sensors and
+        parameters) to tag its responses with the registry generation and
+        answer matching If-None-Match requests with 304
+        """
+        @functools.wraps(view)
+        def conditional_view(*args, **kwargs):
+            tag = Helper.etag(
+                flask.request, current_app.system.get_registry_generation())
+            return Helper.conditional(tag, view, args, kwargs)
+        return conditional_view
+
+    @staticmethod
+    def stream_json(data):
+        """
+        Generate a JSON document in chunks so that large collections never
+        have to be held in memory.  Dictionaries are encoded as objects and
+        any other iterable as an array
+        """
+        if isinstance(data, dict):
+            items = (flask.json.dumps(key) + ":" + flask.json.dumps(data[key])
+                     for key in data)
+            start, end = "{", "}"
+        else:
+            items = (flask.json.dumps(item) for item in data)
+            start, end = "[", "]"
+
+        chunk = []
+        separator = start
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == Helper.stream_chunk_size:
+                yield separator + ",".join(chunk)
+                separator = ","
+                chunk = []
+        if chunk:
+            yield separator + ",".join(chunk) + end
+        elif separator == start:
+            yield start + end
+        else:
+            yield end
+
+    @staticmethod
+    def next_page_url(request, after):
+        """URL of the current request resuming after the given key"""
+        args = request.args.to_dict()
+        args["after"] = after
+        args = dict((name, value.encode("utf-8") if isinstance(value, unicode)
+                     else value) for name, value in args.items())
+        return request.base_url + "?" + urllib.urlencode(args)
+
+    @staticmethod
+    def stream_page(request, name, data, key, limit):
+        """
+        Generate one page of a keyset paginated collection as a JSON object
+        holding the items under `name` and a `next` link.  The link can only
+        be known once the last item has been read so it is written at the end
+        """
+        last = {"count": 0, "key": None}
+
+        def items():
+            for item in data:
+                last["count"] += 1
+                last["key"] = item[key]
+                yield item
+
+        for chunk in Helper.stream_json(items()):
+            if chunk.startswith("["):
+                chunk = "{" + flask.json.dumps(name) + ":" + chunk
+            yield chunk
+
+        if last["count"] == limit:
+            next_url = Helper.next_page_url(request, last["key"])
+        else:
+            next_url = None
+        yield ',"next":' + flask.json.dumps(next_url) + "}"
+
+    @staticmethod
+    def get_page(template, name, request, data, key, limit):
+        """
+        Render one page of a keyset paginated collection as JSON or HTML.  key
+        is the field the collection is ordered by and pages resume after
+        """
+        if Helper.want_json(request):
+            payload = flask.Response(
+                flask.stream_with_context(
+                    Helper.stream_page(request, name, data, key, limit)),
+                mimetype='application/json')
+        else:
+            data = list(data)
+            if len(data) == limit:
+                next_url = Helper.next_page_url(request, data[-1][key])
+            else:
+                next_url = None
+            payload = render_template(template, data=data, next=next_url)
+        return payload
+
     @staticmethod
     def get_list(template, request, data):
-        print("---->" + str(data))
+        """
+        Render a collection as JSON or HTML.  data may be a dictionary or any
+        iterable (eg a generator reading from a database cursor), JSON output
+        is streamed as it is read
+        """
+        if not isinstance(data, dict) and data is not None:
+            # peek at the first item so empty collections can be reported
+            data = iter(data)
+            first = next(data, None)
+            data = chain([first], data) if first is not None else None
+
         if data:
             if Helper.want_json(request):
-                payload = flask.jsonify(data)
-                print str(payload)
+                payload = flask.Response(
+                    flask.stream_with_context(Helper.stream_json(data)),
+                    mimetype='application/json')
             else:
+                if not isinstance(data, dict):
+                    data = list(data)
                 payload = render_template(template, data=data)
         else:
             payload = "no data found"
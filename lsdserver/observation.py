@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+from flask import Blueprint, request, current_app
+from numbers import Number
+from lsdserver import aggregate
+from lsdserver import columnar
+from lsdserver import status
+from lsdserver.helper import Helper
+from lsdserver.validator import Validator
+import calendar
+import csv
+import flask
+import json
+import time
+
+observation = Blueprint('observation', __name__, template_folder='templates')
+
+# page size used when listing observations
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def parse_observations(json):
+    """
+    Normalise a POSTed observation or batch of observations into a list of
+    {timestamp, value} dictionaries.  Observations without a timestamp are
+    given the current system time
+
+    Returns
+    -------
+        list
+            The normalised observations or None if the payload is invalid
+    """
+    if isinstance(json, dict):
+        json = [json]
+
+    observations = None
+    if isinstance(json, list) and json:
+        now = time.time()
+        observations = []
+        for item in json:
+            if not isinstance(item, dict) or item.get("value") is None:
+                observations = None
+                break
+
+            timestamp = item.get("timestamp", now)
+            if not isinstance(timestamp, Number) or isinstance(timestamp, bool):
+                observations = None
+                break
+
+            observations.append({"timestamp": timestamp, "value": item["value"]})
+
+    return observations
+
+
+def parse_time(value):
+    """
+    Parse a query string time, either a unix timestamp or any date string
+    understood by dateutil (assumed to be UTC unless a zone is given)
+
+    Returns
+    -------
+        number
+            unix timestamp or None if value could not be parsed
+    """
+    try:
+        timestamp = float(value)
+    except ValueError:
+        parsed = Validator().validate_time_string(value)
+        if parsed:
+            timestamp = calendar.timegm(parsed.utctimetuple()) + \
+                parsed.microsecond / 1e6
+        else:
+            timestamp = None
+    return timestamp
+
+
+def parse_range(args):
+    """
+    Read the start, end, limit and after query string parameters
+
+    Returns
+    -------
+        dict
+            keyword arguments for LsdBackend.get_observations or None if any
+            parameter is invalid
+    """
+    query = {}
+    for name in ["start", "end", "after"]:
+        if name in args:
+            query[name] = parse_time(args[name])
+            if query[name] is None:
+                return None
+
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        return None
+    if limit < 1:
+        return None
+    query["limit"] = min(limit, MAX_LIMIT)
+
+    return query
+
+
+def next_page(observations, limit):
+    """
+    URL of the page following observations or None if this is the last page
+    """
+    if len(observations) < limit:
+        return None
+    last = observations[-1]["timestamp"]
+    # repr keeps full float precision so the page boundary is exact
+    return Helper.next_page_url(
+        request, repr(last) if isinstance(last, float) else str(last))
+
+
+def ndjson_records(lines):
+    """
+    Parse newline delimited JSON, one {timestamp, value} object per line
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            yield record
+
+
+def csv_records(lines):
+    """
+    Parse CSV rows of timestamp,value with an optional header row.  Cells are
+    decoded as JSON where possible so that numbers (including fractions) and
+    booleans keep their type
+    """
+    for row in csv.reader(lines):
+        if not row or row[0] == "timestamp":
+            continue
+        if len(row) != 2:
+            raise ValueError("expected timestamp,value")
+        cells = []
+        for cell in row:
+            try:
+                cells.append(json.loads(cell))
+            except ValueError:
+                cells.append(cell)
+        record = {"value": cells[1]}
+        if cells[0] != "":
+            record["timestamp"] = cells[0]
+        yield record
+
+
+# parsers for streamed uploads, selected by request content type
+stream_parsers = {
+    "application/x-ndjson": ndjson_records,
+    "text/csv": csv_records
+}
+
+
+def stream_observations(lines, parser):
+    """
+    Lazily parse and validate a streamed upload so that observations can be
+    written as they arrive rather than after the whole body has been read.
+    Raises ValueError on the first invalid record.  Values are passed on as
+    parsed, the backend checks them against the column type as it does for
+    JSON uploads
+    """
+    now = time.time()
+    for line_number, record in enumerate(parser(lines), 1):
+        if "value" not in record:
+            raise ValueError("record %d: missing value" % line_number)
+        timestamp = record.get("timestamp", now)
+        if not isinstance(timestamp, Number) or isinstance(timestamp, bool):
+            raise ValueError("record %d: invalid timestamp" % line_number)
+        yield {"timestamp": timestamp, "value": record["value"]}
+
+
+@observation.route(
+    '/<platform_id>/<manufacturer>/<model>/<serial_number>/<path:phenomena>',
+    methods=['POST'])
+def create(platform_id, manufacturer, model, serial_number, phenomena):
+    """
+    Create a single observation or a batch of observations.  NDJSON and CSV
+    uploads are parsed and stored incrementally as the body is read
+    """
+    if request.mimetype in stream_parsers:
+        return create_stream(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+    observations = parse_observations(request.get_json(silent=True))
+    if observations:
+        result = store_observations(
+            (platform_id, manufacturer, model, serial_number, phenomena),
+            observations)
+        message = "OK"
+    else:
+        result = status.BAD_REQUEST
+        message = "ERROR"
+
+    return message, result
+
+
+def create_stream(platform_id, manufacturer, model, serial_number, phenomena):
+    observations = stream_observations(
+        request.stream, stream_parsers[request.mimetype])
+    try:
+        if want_async():
+            # validate the whole upload before accepting any of it
+            observations = list(observations)
+        result = store_observations(
+            (platform_id, manufacturer, model, serial_number, phenomena),
+            observations)
+        message = "OK"
+    except ValueError as e:
+        result = status.BAD_REQUEST
+        message = "ERROR: %s" % e
+
+    return message, result
+
+
+def want_async():
+    """
+    Whether the client asked (Prefer: respond-async) for observations to be
+    spooled and committed later, and the spool is enabled
+    """
+    preferences = [preference.strip() for preference in
+                   request.headers.get("Prefer", "").split(",")]
+    return current_app.spool is not None and "respond-async" in preferences
+
+
+def store_observations(key, observations):
+    """
+    Write observations for a parameter straight to the backend or, if the
+    client prefers, to the write-behind spool.  Returns the HTTP status
+    """
+    if want_async():
+        current_app.spool.append(key, observations)
+        result = status.ACCEPTED
+    else:
+        current_app.system.create_observations(
+            *(list(key) + [observations]))
+        result = status.CREATED
+    return result
+
+
+@observation.route(
+    '/<platform_id>/<manufacturer>/<model>/<serial_number>/<path:phenomena>',
+    methods=['GET'])
+def get_list(platform_id, manufacturer, model, serial_number, phenomena):
+    """
+    Read observations.  Time ranges ending before the ingest watermark
+    (OBSERVATION_SEAL_AGE seconds ago) are sealed, reads of them carry cache
+    validators that only change when the parameter is written or backfilled
+    """
+    args = (platform_id, manufacturer, model, serial_number, phenomena)
+    end = parse_time(request.args["end"]) if "end" in request.args else None
+    system = current_app.system
+    watermark = time.time() - system.observation_seal_age
+    if end is not None and end <= watermark:
+        # sealed ranges change when the parameter is created or deleted, or
+        # when a late batch is written older than the watermark
+        tag = Helper.etag(
+            request,
+            system.get_registry_generation(),
+            system.get_observation_generation(*args))
+        payload = Helper.conditional(
+            tag, read_list, args, {}, cache_control="public, no-cache")
+    else:
+        payload = read_list(*args)
+    return payload
+
+
+def read_list(platform_id, manufacturer, model, serial_number, phenomena):
+    """
+    List observations in a time range, a page at a time.  Pages are keyed on
+    the last timestamp seen (?after=) rather than an offset
+    """
+    if "bucket" in request.args:
+        return get_aggregates(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+    if "points" in request.args:
+        return get_downsampled(
+            platform_id, manufacturer, model, serial_number, phenomena)
+
+    mimetype = Helper.want_binary(request, columnar.mimetypes())
+    if mimetype:
+        return get_binary(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            mimetype)
+
+    query = parse_range(request.args)
+    if query is None:
+        return "ERROR", status.BAD_REQUEST
+
+    data = current_app.system.get_observations(
+        platform_id, manufacturer, model, serial_number, phenomena, **query)
+    payload = flask.jsonify({
+        "observations": data,
+        "next": next_page(data, query["limit"])
+    })
+    return payload, status.OK
+
+
+def get_aggregates(platform_id, manufacturer, model, serial_number, phenomena):
+    """
+    Downsample a time range into fixed width buckets, eg
+    ?bucket=5m&agg=mean,min,max,count
+    """
+    bucket = aggregate.parse_bucket(request.args.get("bucket"))
+    aggs = aggregate.parse_aggregates(request.args.get("agg"))
+    query = parse_range(request.args)
+    if not bucket or not aggs or query is None:
+        return "ERROR", status.BAD_REQUEST
+
+    data = current_app.system.get_observation_aggregates(
+        platform_id, manufacturer, model, serial_number, phenomena,
+        bucket, aggs, start=query.get("start"), end=query.get("end"))
+    payload = flask.jsonify({"bucket": bucket, "observations": data})
+    return payload, status.OK
+
+
+def get_downsampled(platform_id, manufacturer, model, serial_number, phenomena):
+    """
+    Reduce a time range to at most ?points=N observations for charting using
+    the Largest-Triangle-Three-Buckets algorithm
+    """
+    try:
+        points = int(request.args["points"])
+    except ValueError:
+        points = 0
+    query = parse_range(request.args)
+    if points < 3 or query is None:
+        return "ERROR", status.BAD_REQUEST
+
+    timestamps, values = current_app.system.get_observation_arrays(
+        platform_id, manufacturer, model, serial_number, phenomena,
+        start=query.get("start"), end=query.get("end"))
+    timestamps, values = aggregate.lttb(timestamps, values, points)
+    mimetype = Helper.want_binary(request, columnar.mimetypes())
+    if mimetype:
+        return flask.Response(
+            columnar.encode(mimetype, timestamps, values), mimetype=mimetype)
+
+    data = [{"timestamp": int(timestamp) if timestamp.is_integer() else timestamp,
+             "value": value}
+            for timestamp, value in zip(timestamps.tolist(), values.tolist())]
+    payload = flask.jsonify({"points": points, "observations": data})
+    return payload, status.OK
+
+
+def get_binary(platform_id, manufacturer, model, serial_number, phenomena,
+               mimetype):
+    """
+    Export a whole time range as contiguous timestamp and value arrays, see
+    lsdserver.columnar for the formats
+    """
+    query = parse_range(request.args)
+    if query is None:
+        return "ERROR", status.BAD_REQUEST
+
+    timestamps, values = current_app.system.get_observation_arrays(
+        platform_id, manufacturer, model, serial_number, phenomena,
+        start=query.get("start"), end=query.get("end"))
+    return flask.Response(
+        columnar.encode(mimetype, timestamps, values), mimetype=mimetype)
@@ -25,6 +25,10 @@ import flask
 parameter = Blueprint('parameter', __name__, template_folder='templates')
 
 
+def parameter_filters():
+    return Helper.get_filters(request, current_app.system.parameter_filters)
+
+
 @parameter.route(
     '/<platform_id>/<manufacturer>/<model>/<serial_number>/<path:phenomena>',
     methods=['PUT'])
@@ -42,6 +46,7 @@ def create(platform_id, manufacturer, model, serial_number, phenomena):
     '/<platform_id>/<manufacturer>/<model>/<serial_number>/<path:phenomena>',
     methods=['GET']
 )
+@Helper.registry_etag
 def get(platform_id, manufacturer, model, serial_number, phenomena):
     data = current_app.system.get_parameter(
         platform_id, manufacturer, model, serial_number, phenomena)
@@ -58,36 +63,46 @@ def delete(platform_id, manufacturer, model, serial_number, phenomena):
     return "result", status.NO_CONTENT
 
 @parameter.route('/', methods=['GET'])
+@Helper.registry_etag
 def get_list():
-    data = current_app.system.get_parameters()
+    data = current_app.system.get_parameters(filters=parameter_filters())
     payload = Helper.get_list("parameters.html", request, data)
     return payload, status.OK
 
 
 @parameter.route('/<platform_id>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform(platform_id):
-    data = current_app.system.get_parameters(platform_id)
+    data = current_app.system.get_parameters(
+        platform_id, filters=parameter_filters())
     payload = Helper.get_list("parameters.html", request, data)
     return payload, status.OK
 
 
 @parameter.route('/<platform_id>/<manufacturer>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform_manufacturer(platform_id, manufacturer):
-    data = current_app.system.get_parameters(platform_id, manufacturer)
+    data = current_app.system.get_parameters(
+        platform_id, manufacturer, filters=parameter_filters())
     payload = Helper.get_list("parameters.html", request, data)
     return payload, status.OK
 
 
 @parameter.route('/<platform_id>/<manufacturer>/<model>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform_manufacturer_model(platform_id, manufacturer, model):
-    data = current_app.system.get_parameters(platform_id, manufacturer, model)
+    data = current_app.system.get_parameters(
+        platform_id, manufacturer, model, filters=parameter_filters())
     payload = Helper.get_list("parameters.html", request, data)
     return payload, status.OK
 
 
 @parameter.route('/<platform_id>/<manufacturer>/<model>/<serial_number>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform_manufacturer_model_serial_number(platform_id, manufacturer, model, serial_number):
-    data = current_app.system.get_parameters(platform_id, manufacturer, model, serial_number)
+    data = current_app.system.get_parameters(
+        platform_id, manufacturer, model, serial_number,
+        filters=parameter_filters())
     payload = Helper.get_list("parameters.html", request, data)
     return payload, status.OK
 
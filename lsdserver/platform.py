@@ -17,27 +17,118 @@
 # along with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 from flask import Blueprint, render_template, abort, request, current_app, redirect
+from lsdserver import spatial
 from lsdserver import status
 from lsdserver.helper import Helper
 import flask
 
 platform = Blueprint('platform', __name__, template_folder='templates')
 
+# largest page of platforms that may be requested with ?limit=
+MAX_LIMIT = 10000
 
+# map area clustered by /clusters without ?bbox=
+WORLD = "-180,-90,180,90"
+
+# number of platforms returned by ?near= without ?k= and the most allowed
+DEFAULT_K = 10
+MAX_K = 1000
+
+
+def parse_region(args):
+    """
+    The region to filter platforms by from ?location=POLYGON((...)) or
+    ?bbox=min_x,min_y,max_x,max_y, None if neither is given.  Raises
+    ValueError if the region is malformed
+    """
+    if "location" in args:
+        region = spatial.parse_polygon(args["location"])
+    elif "bbox" in args:
+        region = spatial.parse_bbox(args["bbox"])
+    else:
+        region = None
+    return region
 
 
 @platform.route('/', methods=['GET'])
+@Helper.registry_etag
 def get_platform_list():
     """
-    Get the list of platforms
+    Get the list of platforms, a page at a time if ?limit= is given
     """
     current_app.logger.debug("get_platform_list()")
-    data = current_app.system.get_platforms()
+    if "near" in request.args:
+        return get_nearest_platforms()
+
+    try:
+        region = parse_region(request.args)
+    except ValueError:
+        return "ERROR", status.BAD_REQUEST
+    query = {}
+    if region is not None:
+        query["region"] = region
+
+    if "limit" in request.args:
+        try:
+            limit = int(request.args["limit"])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return "ERROR", status.BAD_REQUEST
+
+        limit = min(limit, MAX_LIMIT)
+        data = current_app.system.get_platforms(
+            limit=limit, after=request.args.get("after"), **query)
+        payload = Helper.get_page(
+            "platforms.html", "platforms", request, data, "platform_id", limit)
+    else:
+        data = current_app.system.get_platforms(**query)
+        payload = Helper.get_list("platforms.html", request, data)
+    return payload, status.OK
+
+
+def get_nearest_platforms():
+    """
+    List the platforms nearest to ?near=POINT(x y), closest first
+    """
+    try:
+        x, y = spatial.parse_point(request.args["near"])
+        k = int(request.args.get("k", DEFAULT_K))
+    except ValueError:
+        return "ERROR", status.BAD_REQUEST
+    if k < 1:
+        return "ERROR", status.BAD_REQUEST
+
+    data = current_app.system.get_nearest_platforms(
+        x, y, min(k, MAX_K), request.args.get("phenomena"))
     payload = Helper.get_list("platforms.html", request, data)
     return payload, status.OK
 
 
+@platform.route('/clusters', methods=['GET'])
+@Helper.registry_etag
+def get_clusters():
+    """
+    Get the clusters of platform locations to draw at a map zoom level
+    """
+    try:
+        box = spatial.parse_bbox(request.args.get("bbox", WORLD))
+        zoom = int(request.args["zoom"])
+    except (KeyError, ValueError):
+        return "ERROR", status.BAD_REQUEST
+    if not 0 <= zoom <= spatial.MAX_ZOOM:
+        return "ERROR", status.BAD_REQUEST
+
+    data = current_app.system.get_platform_clusters(box, zoom)
+    if Helper.want_json(request):
+        payload = flask.jsonify(clusters=data)
+    else:
+        payload = render_template('clusters.html', data=data, zoom=zoom)
+    return payload, status.OK
+
+
 @platform.route('/<platform_id>', methods=['GET'])
+@Helper.registry_etag
 def get_platform(platform_id):
     """
     Get a specific platform
@@ -87,6 +178,7 @@ def delete_info(platform_id):
 
 
 @platform.route('/<platform_id>/location', methods=['GET'])
+@Helper.registry_etag
 def get_location(platform_id):
     data = current_app.system.get_platform(platform_id)
     if data and data["location"]:
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Background maintainer of the pool of empty o_N tables.  Creating a table is
+DDL which MySQL serialises on metadata locks, so rather than each parameter
+registration creating its own table a thread keeps some created ahead of
+time and registrations only claim one.  When the pool runs dry registration
+falls back to creating the table itself
+"""
+import logging
+import os
+import threading
+
+# seconds between checks of the pool
+POOL_INTERVAL = 5.0
+
+# o_N tables kept ready for each value type
+POOL_SIZE = 100
+
+# value types tables are pooled for, others are created on registration
+POOL_VALUE_TYPES = ["double"]
+
+
+class PoolMaintainer(object):
+    """
+    Thread topping up the table pool.  fill(value_type, size) is called for
+    each value type to create tables until size are pooled
+    """
+
+    logger = logging.getLogger("lsdserver.pool")
+
+    def __init__(self, fill, size=POOL_SIZE, value_types=POOL_VALUE_TYPES,
+                 interval=POOL_INTERVAL):
+        self.fill = fill
+        self.size = size
+        self.value_types = value_types
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.stopping = False
+
+    def top_up(self):
+        """Fill the pool of every value type"""
+        for value_type in self.value_types:
+            created = self.fill(value_type, self.size)
+            if created:
+                self.logger.info("pooled %d new %s observation tables",
+                                 created, value_type)
+
+    def run(self):
+        while not self.stopping:
+            try:
+                self.top_up()
+            except Exception:
+                self.logger.exception("filling table pool failed, will retry")
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def ensure_started(self):
+        """
+        Start the maintainer thread, again after a fork (eg uwsgi workers)
+        since threads don't survive it
+        """
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self.stopping = False
+                    self.thread = threading.Thread(
+                        target=self.run, name="lsdserver-pool")
+                    self.thread.daemon = True
+                    self.thread.start()
+
+    def stop(self):
+        """Stop the maintainer thread once its current top up finishes"""
+        if self.thread is not None and self.pid == os.getpid():
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+            self.pid = None
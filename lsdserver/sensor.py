@@ -24,6 +24,11 @@ import flask
 
 sensor = Blueprint('sensor', __name__, template_folder='templates')
 
+
+def sensor_filters():
+    return Helper.get_filters(request, current_app.system.sensor_filters)
+
+
 @sensor.route('/<platform_id>/<manufacturer>/<model>/<serial_number>', methods=['PUT'])
 def create(platform_id, manufacturer, model, serial_number):
     return Helper.create(request, current_app.system.create_sensor, {
@@ -46,35 +51,43 @@ def put_info(platform_id, manufacturer, model, serial_number):
     return Helper.put_info(data, request, update_function)
 
 @sensor.route('/<platform_id>/<manufacturer>/<model>/<serial_number>', methods=['GET'])
+@Helper.registry_etag
 def get(platform_id, manufacturer, model, serial_number):
     data = current_app.system.get_sensor(platform_id, manufacturer, model, serial_number)
     payload = flask.jsonify(data)
     return payload, status.OK
 
 @sensor.route('/', methods=['GET'])
+@Helper.registry_etag
 def get_list():
-    data = current_app.system.get_sensors()
+    data = current_app.system.get_sensors(filters=sensor_filters())
     payload = Helper.get_list("sensors.html", request, data)
     return payload, status.OK
 
 
 @sensor.route('/<platform_id>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform(platform_id):
-    data = current_app.system.get_sensors(platform_id)
+    data = current_app.system.get_sensors(
+        platform_id, filters=sensor_filters())
     payload = Helper.get_list("sensors.html", request, data)
     return payload, status.OK
 
 
 @sensor.route('/<platform_id>/<manufacturer>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform_manufacturer(platform_id, manufacturer):
-    data = current_app.system.get_sensors(platform_id, manufacturer)
+    data = current_app.system.get_sensors(
+        platform_id, manufacturer, filters=sensor_filters())
     payload = Helper.get_list("sensors.html", request, data)
     return payload, status.OK
 
 
 @sensor.route('/<platform_id>/<manufacturer>/<model>', methods=['GET'])
+@Helper.registry_etag
 def get_list_platform_manufacturer_model(platform_id, manufacturer, model):
-    data = current_app.system.get_sensors(platform_id, manufacturer, model)
+    data = current_app.system.get_sensors(
+        platform_id, manufacturer, model, filters=sensor_filters())
     payload = Helper.get_list("sensors.html", request, data)
     return payload, status.OK
 
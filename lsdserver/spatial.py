@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Parsing of WKT platform locations and an in-process grid index over them.
+Coordinates are (x, y) pairs, ie longitude then latitude
+"""
+import heapq
+import math
+import re
+import threading
+from lsdserver.validator import Validator
+
+# default grid cell size in coordinate units (degrees)
+CELL_SIZE = 1.0
+
+# deepest zoom level clustered, cells at zoom z are 360 / 2 ** z degrees wide
+MAX_ZOOM = 16
+
+# number of member keys reported for each cluster
+REPRESENTATIVES = 3
+
+WKT_RE = re.compile(r"^\s*(POINT|POLYGON)\s*\((.*)\)\s*$", re.IGNORECASE)
+
+
+def parse_numbers(numbers, text):
+    """
+    Convert coordinate strings to floats, rejecting nan and infinity which
+    can't be placed on the grid
+    """
+    values = [float(number) for number in numbers]
+    if any(math.isnan(value) or math.isinf(value) for value in values):
+        raise ValueError("coordinates must be finite: %s" % text)
+    return values
+
+
+def parse_coordinates(text):
+    """
+    Parse a list of points written as "x y, x y, ..." into (x, y) tuples.
+    A single point may also be written "x,y" as in POINT(0,0)
+    """
+    numbers = text.replace(",", " ").split()
+    if not numbers or len(numbers) % 2:
+        raise ValueError("odd number of coordinates: %s" % text)
+    values = parse_numbers(numbers, text)
+    return zip(values[0::2], values[1::2])
+
+
+def parse_point(wkt):
+    """
+    Parse WKT of the form POINT(x y) returning (x, y).  Raises ValueError if
+    the text is not a point
+    """
+    match = WKT_RE.match(wkt or "")
+    if not match or match.group(1).upper() != "POINT":
+        raise ValueError("not a WKT point: %s" % wkt)
+    points = parse_coordinates(match.group(2))
+    if len(points) != 1:
+        raise ValueError("not a WKT point: %s" % wkt)
+    return points[0]
+
+
+def location_coordinates(location):
+    """
+    Coordinates of a platform location or (None, None) when the location is
+    missing or not a WKT point accepted by the validator
+    """
+    try:
+        if Validator.position_regexp.match(location or ""):
+            return parse_point(location)
+    except ValueError:
+        pass
+    return None, None
+
+
+class BoundingBox(object):
+    """Axis aligned rectangle"""
+
+    def __init__(self, min_x, min_y, max_x, max_y):
+        if min_x > max_x or min_y > max_y:
+            raise ValueError("bounding box corners out of order")
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+
+    def bounds(self):
+        return self
+
+    def contains(self, x, y):
+        return self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y
+
+
+class Polygon(object):
+    """Simple polygon given by its outer ring"""
+
+    def __init__(self, points):
+        if len(points) < 3:
+            raise ValueError("a polygon needs at least 3 points")
+        self.points = points
+        xs = [x for x, y in points]
+        ys = [y for x, y in points]
+        self.box = BoundingBox(min(xs), min(ys), max(xs), max(ys))
+
+    def bounds(self):
+        return self.box
+
+    def contains(self, x, y):
+        """even-odd ray casting test"""
+        if not self.box.contains(x, y):
+            return False
+        inside = False
+        x1, y1 = self.points[-1]
+        for x2, y2 in self.points:
+            if (y1 > y) != (y2 > y) and \
+                    x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+            x1, y1 = x2, y2
+        return inside
+
+
+def parse_polygon(wkt):
+    """
+    Parse WKT of the form POLYGON((x y, x y, ...)).  Only the outer ring is
+    used.  Raises ValueError if the text is not a polygon
+    """
+    match = WKT_RE.match(wkt or "")
+    if not match or match.group(1).upper() != "POLYGON":
+        raise ValueError("not a WKT polygon: %s" % wkt)
+    ring = re.match(r"^\s*\(([^()]*)\)", match.group(2))
+    if not ring:
+        raise ValueError("not a WKT polygon: %s" % wkt)
+    return Polygon(parse_coordinates(ring.group(1)))
+
+
+def parse_bbox(text):
+    """Parse a bounding box written as min_x,min_y,max_x,max_y"""
+    values = parse_numbers(text.split(","), text)
+    if len(values) != 4:
+        raise ValueError("bbox needs 4 values: %s" % text)
+    return BoundingBox(*values)
+
+
+class GridIndex(object):
+    """
+    Thread safe index of points bucketed into square grid cells.  Queries
+    only visit the cells overlapping the region searched
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        # cell -> {key: (x, y)}
+        self.cells = {}
+        # key -> cell
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def cell(self, x, y):
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)))
+
+    def insert(self, key, x, y):
+        with self.lock:
+            self._remove(key)
+            cell = self.cell(x, y)
+            self.cells.setdefault(cell, {})[key] = (x, y)
+            self.keys[key] = cell
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        cell = self.keys.pop(key, None)
+        if cell is not None:
+            points = self.cells[cell]
+            del points[key]
+            if not points:
+                del self.cells[cell]
+
+    def clear(self):
+        with self.lock:
+            self.cells.clear()
+            self.keys.clear()
+
+    def query(self, region):
+        """Keys of the points inside region (a BoundingBox or Polygon)"""
+        box = region.bounds()
+        min_cx, min_cy = self.cell(box.min_x, box.min_y)
+        max_cx, max_cy = self.cell(box.max_x, box.max_y)
+        with self.lock:
+            if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self.cells):
+                # huge region, cheaper to walk the occupied cells
+                cells = [cell for cell in self.cells
+                         if min_cx <= cell[0] <= max_cx and
+                         min_cy <= cell[1] <= max_cy]
+            else:
+                cells = [(cx, cy)
+                         for cx in xrange(min_cx, max_cx + 1)
+                         for cy in xrange(min_cy, max_cy + 1)]
+            found = []
+            for cell in cells:
+                for key, (x, y) in self.cells.get(cell, {}).iteritems():
+                    if region.contains(x, y):
+                        found.append(key)
+        return found
+
+    def nearest(self, x, y, k, accept=None):
+        """
+        The k points nearest to (x, y) by planar distance in coordinate
+        units, as a list of (distance, key) pairs closest first.  accept is
+        an optional predicate keys must satisfy.
+
+        Searches rings of cells outwards from the cell holding (x, y).  Any
+        point outside ring r is at least r cells away so the search stops
+        once the k best found are that close
+        """
+        cx, cy = self.cell(x, y)
+        best = []
+        with self.lock:
+            seen = 0
+            radius = 0
+            while seen < len(self.keys):
+                if (2 * radius + 1) ** 2 > len(self.cells):
+                    # ring search has outgrown the occupied cells, finish by
+                    # checking whatever has not been visited yet
+                    cells = [cell for cell in self.cells
+                             if max(abs(cell[0] - cx),
+                                    abs(cell[1] - cy)) >= radius]
+                    radius = None
+                elif radius == 0:
+                    cells = [(cx, cy)]
+                else:
+                    cells = [(cx + dx, cy + dy)
+                             for dx in xrange(-radius, radius + 1)
+                             for dy in (-radius, radius)] + \
+                            [(cx + dx, cy + dy)
+                             for dx in (-radius, radius)
+                             for dy in xrange(1 - radius, radius)]
+                for cell in cells:
+                    points = self.cells.get(cell, {})
+                    seen += len(points)
+                    for key, (px, py) in points.iteritems():
+                        if accept is None or accept(key):
+                            distance = math.hypot(px - x, py - y)
+                            if len(best) < k:
+                                heapq.heappush(best, (-distance, key))
+                            elif -distance > best[0][0]:
+                                heapq.heapreplace(best, (-distance, key))
+                if radius is None or \
+                        (len(best) == k and
+                         -best[0][0] <= radius * self.cell_size):
+                    break
+                radius += 1
+        return sorted((-distance, key) for distance, key in best)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class Cluster(object):
+    """Running count and coordinate sums of the points in one grid cell"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.keys = set()
+        self.representatives = []
+
+    def add(self, key, x, y):
+        self.count += 1
+        self.sum_x += x
+        self.sum_y += y
+        self.keys.add(key)
+        if len(self.representatives) < REPRESENTATIVES:
+            self.representatives.append(key)
+
+    def remove(self, key, x, y):
+        self.count -= 1
+        self.sum_x -= x
+        self.sum_y -= y
+        self.keys.discard(key)
+        if key in self.representatives:
+            self.representatives.remove(key)
+            # promote any other member in place of the one removed
+            for other in self.keys:
+                if other not in self.representatives:
+                    self.representatives.append(other)
+                    break
+
+    def centroid(self):
+        return self.sum_x / self.count, self.sum_y / self.count
+
+    def to_dict(self):
+        x, y = self.centroid()
+        return {
+            "count": self.count,
+            "longitude": x,
+            "latitude": y,
+            "platform_ids": list(self.representatives)
+        }
+
+
+class ClusterIndex(object):
+    """
+    Thread safe grid clustering of points at every zoom level from 0 to
+    max_zoom, updated incrementally as points are inserted and removed
+    """
+
+    def __init__(self, max_zoom=MAX_ZOOM):
+        self.max_zoom = max_zoom
+        # one {cell: Cluster} per zoom level
+        self.levels = [{} for _ in xrange(max_zoom + 1)]
+        # key -> (x, y)
+        self.points = {}
+        self.lock = threading.Lock()
+
+    def cell(self, zoom, x, y):
+        size = 360.0 / 2 ** zoom
+        return int(math.floor(x / size)), int(math.floor(y / size))
+
+    def insert(self, key, x, y):
+        with self.lock:
+            self._remove(key)
+            self.points[key] = (x, y)
+            for zoom, clusters in enumerate(self.levels):
+                cell = self.cell(zoom, x, y)
+                cluster = clusters.get(cell)
+                if cluster is None:
+                    cluster = clusters[cell] = Cluster()
+                cluster.add(key, x, y)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        point = self.points.pop(key, None)
+        if point is not None:
+            x, y = point
+            for zoom, clusters in enumerate(self.levels):
+                cell = self.cell(zoom, x, y)
+                cluster = clusters[cell]
+                cluster.remove(key, x, y)
+                if not cluster.count:
+                    del clusters[cell]
+
+    def query(self, box, zoom):
+        """
+        Clusters at a zoom level whose centroid lies inside the bounding box,
+        as dictionaries of count, centroid and representative keys
+        """
+        zoom = max(0, min(zoom, self.max_zoom))
+        min_cx, min_cy = self.cell(zoom, box.min_x, box.min_y)
+        max_cx, max_cy = self.cell(zoom, box.max_x, box.max_y)
+        with self.lock:
+            clusters = self.levels[zoom]
+            if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(clusters):
+                cells = [cell for cell in clusters
+                         if min_cx <= cell[0] <= max_cx and
+                         min_cy <= cell[1] <= max_cy]
+            else:
+                cells = [(cx, cy)
+                         for cx in xrange(min_cx, max_cx + 1)
+                         for cy in xrange(min_cy, max_cy + 1)
+                         if (cx, cy) in clusters]
+            found = []
+            for cell in cells:
+                cluster = clusters[cell]
+                if box.contains(*cluster.centroid()):
+                    found.append(cluster.to_dict())
+        return found
+
+    def __len__(self):
+        return len(self.points)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+Write-behind spool for observations.  Batches are appended to a local file
+and fsync'ed so they survive a crash, then a background thread commits them
+to the backend in large transactions.
+
+Segments are written as <time>-<pid>-<seq>.open and renamed to .spool once
+full so any process sharing the directory may commit them.  .open segments
+no longer locked by their writer are committed too, which is how batches
+spooled before a crash are replayed on startup.  Segments are created as
+.new and only renamed to .open once locked, so they are never mistaken for
+abandoned while being opened
+"""
+from collections import OrderedDict
+from werkzeug.exceptions import HTTPException
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+# seconds between commits of the spool
+FLUSH_INTERVAL = 1.0
+
+# most observations committed in one transaction, reaching this many
+# spooled observations also triggers a commit
+BATCH_SIZE = 10000
+
+
+def abandoned(path):
+    """
+    Whether an .open segment's writer has gone.  Writers hold a lock on the
+    segment for as long as they live, which unlike their pid can't be
+    mistaken for a new process's after a restart
+    """
+    try:
+        segment = open(path)
+    except IOError:
+        # sealed or committed since it was listed
+        return False
+    with segment:
+        try:
+            fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            return False
+        fcntl.flock(segment, fcntl.LOCK_UN)
+    return True
+
+
+class Spool(object):
+    """
+    Durable queue of observation batches drained by a committer thread.
+    commit(key, observations) is called with the parameter natural key and
+    a list of {timestamp, value} dictionaries
+    """
+
+    logger = logging.getLogger("lsdserver.spool")
+
+    def __init__(self, directory, commit, flush_interval=FLUSH_INTERVAL,
+                 batch_size=BATCH_SIZE):
+        self.directory = directory
+        self.commit = commit
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.segment = None
+        self.segment_path = None
+        self.sequence = 0
+        self.pending = 0
+        self.thread = None
+        self.pid = None
+        self.stopping = False
+
+    def append(self, key, observations):
+        """Durably spool a batch of observations for a parameter"""
+        self.ensure_started()
+        line = json.dumps({"key": list(key), "observations": observations})
+        with self.lock:
+            if self.segment is None:
+                self.open_segment()
+            self.segment.write(line + "\n")
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            self.pending += len(observations)
+            if self.pending >= self.batch_size:
+                self.wakeup.set()
+
+    def open_segment(self):
+        self.sequence += 1
+        path = os.path.join(self.directory, "%016d-%d-%d" % (
+            int(time.time() * 1000), os.getpid(), self.sequence))
+        fd = os.open(path + ".new",
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0644)
+        segment = os.fdopen(fd, "a")
+        fcntl.flock(segment, fcntl.LOCK_EX)
+        os.rename(path + ".new", path + ".open")
+        self.segment = segment
+        self.segment_path = path + ".open"
+
+    def seal(self):
+        """
+        Close the segment being written so it can be committed.  Returns the
+        paths of every committable segment, oldest first
+        """
+        with self.lock:
+            if self.segment is not None:
+                sealed = self.segment_path[:-len(".open")] + ".spool"
+                os.rename(self.segment_path, sealed)
+                self.segment.close()
+                self.segment = None
+                self.pending = 0
+
+            paths = glob.glob(os.path.join(self.directory, "*.spool"))
+            for path in glob.glob(os.path.join(self.directory, "*.open")):
+                if abandoned(path):
+                    paths.append(path)
+        return sorted(paths, key=os.path.basename)
+
+    def drain(self):
+        """Commit every sealed segment, oldest first"""
+        for path in self.seal():
+            try:
+                segment = open(path)
+            except IOError:
+                # committed and removed by another process
+                continue
+            with segment:
+                try:
+                    fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    continue
+                if os.path.exists(path):
+                    self.commit_segment(segment)
+                    os.remove(path)
+
+    def commit_segment(self, segment):
+        batches = OrderedDict()
+        for line in segment:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # torn final write from a crash, never acknowledged
+                self.logger.warn("skipping partial spool record")
+                continue
+            batches.setdefault(tuple(record["key"]), []).extend(
+                record["observations"])
+
+        for key, observations in batches.items():
+            for start in xrange(0, len(observations), self.batch_size):
+                batch = observations[start:start + self.batch_size]
+                try:
+                    self.commit(key, batch)
+                except HTTPException as e:
+                    # unknown parameter or duplicate, retrying won't help
+                    self.reject(key, batch, e)
+
+    def reject(self, key, observations, error):
+        self.logger.error("rejected %d spooled observations for %s: %s",
+                          len(observations), "/".join(key), error)
+        with open(os.path.join(self.directory, "rejected.ndjson"), "a") as f:
+            f.write(json.dumps({"key": list(key),
+                                "observations": observations,
+                                "error": str(error)}) + "\n")
+
+    def run(self):
+        while not self.stopping:
+            try:
+                self.drain()
+            except Exception:
+                self.logger.exception("spool commit failed, will retry")
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+
+    def ensure_started(self):
+        """
+        Start the committer thread, again after a fork (eg uwsgi workers)
+        since threads don't survive it
+        """
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.segment = None
+                    self.pid = os.getpid()
+                    self.stopping = False
+                    self.thread = threading.Thread(
+                        target=self.run, name="lsdserver-spool")
+                    self.thread.daemon = True
+                    self.thread.start()
+
+    def stop(self):
+        """Stop the committer thread after committing everything spooled"""
+        if self.thread is not None and self.pid == os.getpid():
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+            self.pid = None
+        self.drain()
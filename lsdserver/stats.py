@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+#
+# lsdserver -- Linked Sensor Data Server
+# Copyright (C) 2014 Geoff Williams <geoff@geoffwilliams.me.uk>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+from flask import Blueprint, current_app
+from lsdserver import status
+import flask
+
+stats = Blueprint('stats', __name__, template_folder='templates')
+
+
+@stats.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    Get the hit/miss counters of the backend caches
+    """
+    return flask.jsonify(current_app.system.get_cache_stats()), status.OK
@@ -73,9 +73,12 @@ class Validator:
     def parse_bool_value(value):
         return bool(value)
 
+    # phenomena data types, each stored in a matching native column type
     parameter_type_support = {
         "int": parse_int_value,
+        "smallint": parse_int_value,
         "float": parse_float_value,
+        "double": parse_float_value,
         "bool": parse_bool_value
     }
 
@@ -18,7 +18,7 @@ This is some sample info, it will be created as a file and read back
         "name": "platform_name",
         "description": "platform_description",
         "info": "http://link_for_more_info",
-        "location": "POINT(0,0)"
+        "location": "POINT (0 0)"
     }
 
     """
@@ -1,6 +1,13 @@
 import logging
 import flask
+import math
+import numpy
+import time
+from lsdserver import aggregate
+from lsdserver import spatial
 from lsdserver import status
+from lsdserver.backend.mysql import DEFAULT_VALUE_TYPE, VALUE_TYPES, \
+    convert_values
 from lsdserver.driver import LsdBackend
 
 
@@ -14,6 +21,11 @@ class MockSystem(LsdBackend):
         self.sensors = {}
         self.phenomena = {}
         self.flags = {}
+        self.observations = {}
+        # bumped by every registry write
+        self.generation = 0
+        # writes older than observation_seal_age, by parameter
+        self.sealed = {}
 
     def get_platform(self, platform_id):
         data = None
@@ -33,42 +45,105 @@ class MockSystem(LsdBackend):
             flask.abort(status.NOT_FOUND)
         return data
 
-    def get_sensors(self, platform_id=None, manufacturer=None, model=None):
+    def match_filters(self, data, filters):
+        """check a sensor or parameter against query string filters"""
+        for name, value in (filters or {}).items():
+            if name == "parameter_phenomena":
+                try:
+                    phenomenas = self.parameters[data["platform_id"]]\
+                        [data["manufacturer"]][data["model"]]\
+                        [data["serial_number"]]
+                except KeyError:
+                    phenomenas = {}
+                if "phenomena" in data:
+                    matched = data["phenomena"] == value
+                else:
+                    matched = value in phenomenas
+            else:
+                field = name.split("_", 1)[1]
+                matched = data.get(field) == value
+            if not matched:
+                return False
+        return True
+
+    def get_sensors(self, platform_id=None, manufacturer=None, model=None,
+                    filters=None):
         matched = {}
         for idx_platform_id in self.sensors:
             if (platform_id and idx_platform_id == platform_id) or platform_id is None:
                 for idx_manufacturer in self.sensors[idx_platform_id]:
                     if (manufacturer and idx_manufacturer == manufacturer) or manufacturer is None:
                         for idx_model in self.sensors[idx_platform_id][idx_manufacturer]:
-                            if (idx_model in self.sensors[idx_platform_id][idx_manufacturer]) or model is None:
+                            if (model and idx_model == model) or model is None:
                                 for idx_serial_number in self.sensors[idx_platform_id][idx_manufacturer][idx_model]:
-                                    matched[idx_serial_number]=self.sensors[idx_platform_id][idx_manufacturer][idx_model][idx_serial_number]
+                                    data = self.sensors[idx_platform_id][idx_manufacturer][idx_model][idx_serial_number]
+                                    if self.match_filters(data, filters):
+                                        matched[idx_serial_number] = data
         return matched
 
-    def get_parameters(self, platform_id=None, manufacturer=None, model=None, serial_number=None):
+    def get_parameters(self, platform_id=None, manufacturer=None, model=None,
+                       serial_number=None, filters=None):
         matched = {}
         for idx_platform_id in self.parameters:
             if (platform_id and idx_platform_id == platform_id) or platform_id is None:
                 for idx_manufacturer in self.parameters[idx_platform_id]:
                     if (manufacturer and idx_manufacturer == manufacturer) or manufacturer is None:
                         for idx_model in self.parameters[idx_platform_id][idx_manufacturer]:
-                            if (idx_model in self.parameters[idx_platform_id][idx_manufacturer]) or model is None:
+                            if (model and idx_model == model) or model is None:
                                 for idx_serial_number in self.parameters[idx_platform_id][idx_manufacturer][idx_model]:
-                                    if (idx_serial_number in self.parameters[idx_platform_id][idx_manufacturer][idx_model]) or serial_number is None:
+                                    if (serial_number and idx_serial_number == serial_number) or serial_number is None:
                                         for idx_phenomena in self.parameters[idx_platform_id][idx_manufacturer][idx_model][idx_serial_number]:
-                                            matched[idx_phenomena]=self.parameters[idx_platform_id][idx_manufacturer][idx_model][idx_serial_number][idx_phenomena]
+                                            data = self.parameters[idx_platform_id][idx_manufacturer][idx_model][idx_serial_number][idx_phenomena]
+                                            if self.match_filters(data, filters):
+                                                matched[idx_phenomena] = data
 
         return matched
 
-    def get_platforms(self):
-        return self.platforms
+    def get_platform_clusters(self, box, zoom):
+        clusters = spatial.ClusterIndex()
+        for platform_id in sorted(self.platforms):
+            x, y = spatial.location_coordinates(
+                self.platforms[platform_id]["location"])
+            if x is not None:
+                clusters.insert(platform_id, x, y)
+        return clusters.query(box, zoom)
+
+    def get_nearest_platforms(self, x, y, k, phenomena=None):
+        data = []
+        for platform_id, platform in self.platforms.items():
+            px, py = spatial.location_coordinates(platform["location"])
+            if px is not None and (
+                    phenomena is None or
+                    self.get_parameters(platform_id=platform_id, filters={
+                        "parameter_phenomena": phenomena})):
+                data.append(dict(platform, distance=math.hypot(px - x, py - y)))
+        data.sort(key=lambda platform: platform["distance"])
+        return data[:k]
+
+    def get_platforms(self, limit=None, after=None, region=None):
+        platforms = self.platforms
+        if region is not None:
+            platforms = {}
+            for platform_id, data in self.platforms.items():
+                x, y = spatial.location_coordinates(data["location"])
+                if x is not None and region.contains(x, y):
+                    platforms[platform_id] = data
+        if limit:
+            data = [platforms[platform_id]
+                    for platform_id in sorted(platforms)
+                    if after is None or platform_id > after][:limit]
+        else:
+            data = platforms
+        return data
 
     def update_platform(self, data):
         """replace whole platform"""
+        self.generation += 1
         platform_id = data["platform_id"]
         self.platforms[platform_id] = data
 
     def create_platform(self, data):
+        self.generation += 1
         platform_id = data["platform_id"]
         if platform_id in self.platforms:
             self.logger.debug('duplicate platform:  %s', platform_id)
@@ -79,6 +154,7 @@ class MockSystem(LsdBackend):
             self.platforms[platform_id] = data
 
     def create_sensor(self, data):
+        self.generation += 1
         platform_id = data["platform_id"]
         manufacturer = data["manufacturer"]
         model = data["model"]
@@ -112,6 +188,7 @@ class MockSystem(LsdBackend):
 
     def update_sensor(self, data):
         """replace whole sensor"""
+        self.generation += 1
         try:
             self.sensors\
                 [data["platform_id"]]\
@@ -122,16 +199,19 @@ class MockSystem(LsdBackend):
             flask.abort(status.NOT_FOUND)
 
     def delete_platform(self, platform_id):
+        self.generation += 1
         if platform_id in self.platforms:
             del self.platforms[platform_id]
 
     def delete_sensor(self, platform_id, manufacturer, model, serial_number):
+        self.generation += 1
         try:
             del self.sensors[platform_id][manufacturer][model][serial_number]
         except KeyError:
             flask.abort(status.NOT_FOUND)
 
     def create_parameter(self, data):
+        self.generation += 1
         platform_id = data["platform_id"]
         manufacturer = data["manufacturer"]
         model = data["model"]
@@ -185,6 +265,7 @@ class MockSystem(LsdBackend):
                          model,
                          serial_number,
                          phenomena):
+        self.generation += 1
         try:
             del self.parameters\
                     [platform_id]\
@@ -231,10 +312,108 @@ class MockSystem(LsdBackend):
     def get_flags(self):
         return self.flags
 
+    def get_cache_stats(self):
+        return {}
+
+    def get_registry_generation(self):
+        return str(self.generation)
+
+    def get_observation_generation(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena):
+        key = (platform_id, manufacturer, model, serial_number, phenomena)
+        return str(self.sealed.get(key, 0))
+
     def delete_flag(self, term):
         try:
             del self.flags[term]
         except KeyError:
             flask.abort(status.NOT_FOUND)
 
-        
\ No newline at end of file
+    def create_observations(self,
+                            platform_id,
+                            manufacturer,
+                            model,
+                            serial_number,
+                            phenomena,
+                            observations):
+        # raises 404 for unknown parameters
+        self.get_parameter(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        key = (platform_id, manufacturer, model, serial_number, phenomena)
+        stored = self.observations.setdefault(key, {})
+        # observations already stored are overwritten (upsert), nothing is
+        # stored if the batch fails part way through
+        batch = {}
+        for observation in observations:
+            batch[observation["timestamp"]] = observation["value"]
+        # values are checked against the phenomena data_type like o_N columns
+        data_type = self.phenomena.get(phenomena, {}).get("data_type")
+        if data_type not in VALUE_TYPES:
+            data_type = DEFAULT_VALUE_TYPE
+        try:
+            values = convert_values(batch.values(), data_type)
+        except ValueError:
+            flask.abort(status.BAD_REQUEST)
+        stored.update(zip(batch.keys(), values))
+        if batch and min(batch) < time.time() - self.observation_seal_age:
+            self.sealed[key] = self.sealed.get(key, 0) + 1
+
+    def get_observations(self,
+                         platform_id,
+                         manufacturer,
+                         model,
+                         serial_number,
+                         phenomena,
+                         start=None,
+                         end=None,
+                         limit=None,
+                         after=None):
+        self.get_parameter(
+            platform_id, manufacturer, model, serial_number, phenomena)
+        key = (platform_id, manufacturer, model, serial_number, phenomena)
+        stored = self.observations.get(key, {})
+        result = []
+        for timestamp in sorted(stored):
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                break
+            if after is not None and timestamp <= after:
+                continue
+            result.append({"timestamp": timestamp, "value": stored[timestamp]})
+            if limit and len(result) == limit:
+                break
+        return result
+
+    def get_observation_arrays(self,
+                               platform_id,
+                               manufacturer,
+                               model,
+                               serial_number,
+                               phenomena,
+                               start=None,
+                               end=None):
+        data = self.get_observations(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            start=start, end=end)
+        return (numpy.array([o["timestamp"] for o in data], dtype=numpy.float64),
+                numpy.array([o["value"] for o in data], dtype=numpy.float64))
+
+    def get_observation_aggregates(self,
+                                   platform_id,
+                                   manufacturer,
+                                   model,
+                                   serial_number,
+                                   phenomena,
+                                   bucket,
+                                   aggs,
+                                   start=None,
+                                   end=None):
+        timestamps, values = self.get_observation_arrays(
+            platform_id, manufacturer, model, serial_number, phenomena,
+            start=start, end=end)
+        return aggregate.aggregate(timestamps, values, bucket, aggs)
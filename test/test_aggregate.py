@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver import aggregate
+
+
+class TestAggregate(unittest.TestCase):
+    """
+    Tests for bucketed aggregation of observations
+    """
+
+    def test_parse_bucket(self):
+        self.assertEqual(30, aggregate.parse_bucket("30"))
+        self.assertEqual(30, aggregate.parse_bucket("30s"))
+        self.assertEqual(300, aggregate.parse_bucket("5m"))
+        self.assertEqual(7200, aggregate.parse_bucket("2h"))
+        self.assertEqual(86400, aggregate.parse_bucket("1d"))
+
+    def test_parse_bucket_invalid(self):
+        self.assertEqual(None, aggregate.parse_bucket("0m"))
+        self.assertEqual(None, aggregate.parse_bucket("5y"))
+        self.assertEqual(None, aggregate.parse_bucket("-5m"))
+        self.assertEqual(None, aggregate.parse_bucket(None))
+
+    def test_parse_aggregates(self):
+        self.assertEqual(["count"], aggregate.parse_aggregates(None))
+        self.assertEqual(["mean", "max"], aggregate.parse_aggregates("mean,max"))
+        self.assertEqual(None, aggregate.parse_aggregates("mean,median"))
+
+    def test_aggregate_empty(self):
+        self.assertEqual([], aggregate.aggregate([], [], 60, ["count"]))
+
+    def test_aggregate(self):
+        timestamps = [0, 10, 59, 60, 200]
+        values = [1, 2, 3, 4, 5]
+        result = aggregate.aggregate(
+            timestamps, values, 60, ["count", "sum", "min", "max", "mean"])
+        self.assertEqual([
+            {"timestamp": 0, "count": 3, "sum": 6.0, "min": 1.0, "max": 3.0,
+             "mean": 2.0},
+            {"timestamp": 60, "count": 1, "sum": 4.0, "min": 4.0, "max": 4.0,
+             "mean": 4.0},
+            {"timestamp": 180, "count": 1, "sum": 5.0, "min": 5.0, "max": 5.0,
+             "mean": 5.0}
+        ], result)
+
+    def test_lttb_short_series(self):
+        """series no longer than the threshold are returned unchanged"""
+        timestamps, values = aggregate.lttb([1, 2, 3], [4, 5, 6], 3)
+        self.assertEqual([1, 2, 3], timestamps.tolist())
+        self.assertEqual([4, 5, 6], values.tolist())
+
+    def test_lttb(self):
+        """first, last and extreme points survive downsampling"""
+        timestamps = range(1000)
+        values = [0.0] * 1000
+        values[500] = 100.0
+        values[250] = -100.0
+        x, y = aggregate.lttb(timestamps, values, 10)
+        self.assertEqual(10, len(x))
+        self.assertEqual(0, x[0])
+        self.assertEqual(999, x[-1])
+        self.assertTrue(100.0 in y.tolist())
+        self.assertTrue(-100.0 in y.tolist())
+        self.assertEqual(sorted(x.tolist()), x.tolist())
+
+if __name__ == "__main__":
+    unittest.main()
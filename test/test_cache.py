@@ -0,0 +1,56 @@
+import unittest
+import sys
+import os
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver.cache import LruCache
+
+
+class TestLruCache(unittest.TestCase):
+    """
+    Tests for the bounded LRU cache
+    """
+
+    def setUp(self):
+        self.cache = LruCache(2)
+
+    def test_get_missing(self):
+        self.assertEqual(None, self.cache.get("a"))
+        self.assertEqual(0, self.cache.get("a", 0))
+
+    def test_put_get(self):
+        self.cache.put("a", 1)
+        self.assertEqual(1, self.cache.get("a"))
+
+    def test_eviction(self):
+        """least recently used entry is evicted once full"""
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        self.assertTrue("a" in self.cache)
+        self.assertFalse("b" in self.cache)
+        self.assertTrue("c" in self.cache)
+        self.assertEqual(2, len(self.cache))
+
+    def test_invalidate(self):
+        self.cache.put("a", 1)
+        self.cache.invalidate("a")
+        self.cache.invalidate("missing")
+        self.assertFalse("a" in self.cache)
+
+    def test_clear(self):
+        self.cache.put("a", 1)
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+
+    def test_stats(self):
+        self.cache.put("a", 1)
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("b")
+        self.assertEqual({"size": 2, "entries": 1, "hits": 2, "misses": 1},
+                         self.cache.stats())
+
+if __name__ == "__main__":
+    unittest.main()
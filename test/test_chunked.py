@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+import numpy
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver.backend import chunked
+
+
+class TestChunked(unittest.TestCase):
+    """
+    Tests for the compressed block encoding of observations
+    """
+
+    def test_timestamps_round_trip(self):
+        random = numpy.random.RandomState(0)
+        timestamps = 1434890106000000 + numpy.cumsum(
+            random.randint(1, 3000000, 5000)).astype(numpy.int64)
+        for count in [0, 1, 2, 3, 5000]:
+            self.assertTrue(numpy.array_equal(
+                timestamps[:count],
+                chunked.decode_timestamps(
+                    chunked.encode_timestamps(timestamps[:count]))))
+
+    def test_timestamps_before_1970(self):
+        timestamps = numpy.array([-2000000, -1500000, 0, 20000],
+                                 dtype=numpy.int64)
+        self.assertTrue(numpy.array_equal(
+            timestamps,
+            chunked.decode_timestamps(chunked.encode_timestamps(timestamps))))
+
+    def test_values_round_trip(self):
+        values = numpy.random.RandomState(1).randn(5000)
+        values[10] = numpy.nan
+        values[11] = -0.0
+        for count in [0, 1, 5000]:
+            decoded = chunked.decode_values(
+                chunked.encode_values(values[:count]))
+            # compare bits so nan and -0.0 count
+            self.assertTrue(numpy.array_equal(
+                values[:count].view(numpy.uint64),
+                decoded.view(numpy.uint64)))
+
+    def test_regular_series_compress(self):
+        """a day of 1Hz readings packs far below 16 bytes a point"""
+        timestamps = 1434844800000000 + \
+            numpy.arange(86400, dtype=numpy.int64) * 1000000
+        values = numpy.round(
+            20 + numpy.sin(numpy.arange(86400) / 3600.0) * 5, 1)
+        size = len(chunked.encode_timestamps(timestamps)) + \
+            len(chunked.encode_values(values))
+        self.assertTrue(size < 86400)
+
+    def test_merge(self):
+        """merged series are sorted and newer values win"""
+        timestamps, values = chunked.merge(
+            (numpy.array([1, 3, 5]), numpy.array([1.0, 3.0, 5.0])),
+            (numpy.array([2, 3]), numpy.array([2.0, 30.0])))
+        self.assertEqual([1, 2, 3, 5], timestamps.tolist())
+        self.assertEqual([1.0, 2.0, 30.0, 5.0], values.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,13 +23,19 @@ sys.path.append(APP_DIR)
 import unittest
 import lsdserver
 import tempfile
-from lsdserver import create_app
+from lsdserver import create_app, spool_committer
 from lsdserver import status
 from lsdserver.validator import Validator
+from lsdserver import columnar
+from lsdserver.spool import Spool
 import flask
 from flask import render_template, current_app
 import json
+import time
 import logging
+import numpy
+import shutil
+import struct
 import urllib
 from lsdserver.backend.mysql import Mysql
 from lsdserver.driver import LsdBackend
@@ -100,6 +106,202 @@ class TestRestApi(unittest.TestCase):
         json_data = json.loads(resp.data)
         self.assertTrue(SampleData.sample_platform_id in json_data)
 
+    def test_platform_read_list_streamed(self):
+        """collections read from a cursor are streamed as a JSON array"""
+        platforms = [dict(SampleData.sample_platform, platform_id="p%d" % i)
+                     for i in range(1200)]
+        self.app.system.get_platforms = lambda: (p for p in platforms)
+
+        resp = self.client.get('/platform/',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertTrue(resp.is_streamed)
+        self.assertEquals(platforms, json.loads(resp.data))
+
+    def test_platform_read_list_empty(self):
+        """an empty collection from a cursor is reported as such"""
+        self.app.system.get_platforms = lambda: (p for p in [])
+        resp = self.client.get('/platform/',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals("no data found", resp.data)
+
+    def test_platform_read_list_pages(self):
+        """follow next links through a keyset paginated platform list"""
+        for i in range(5):
+            self.app.system.create_platform(
+                dict(SampleData.sample_platform, platform_id="p%d" % i))
+
+        url = '/platform/?limit=2'
+        platform_ids = []
+        pages = 0
+        while url:
+            resp = self.client.get(url, headers={'Accept': 'application/json'})
+            self.assertEquals(status.OK, resp.status_code)
+            json_data = json.loads(resp.data)
+            platform_ids += [p["platform_id"] for p in json_data["platforms"]]
+            url = json_data["next"]
+            pages += 1
+
+        self.assertEquals(["p0", "p1", "p2", "p3", "p4"], platform_ids)
+        self.assertEquals(3, pages)
+
+    def test_platform_read_list_page_html(self):
+        """a full HTML page of platforms links to the next one"""
+        for i in range(3):
+            self.app.system.create_platform(
+                dict(SampleData.sample_platform, platform_id="p%d" % i))
+
+        resp = self.client.get('/platform/?limit=2')
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertTrue("after=p1" in resp.data)
+
+    def test_platform_read_list_bad_limit(self):
+        """limit must be a positive integer"""
+        resp = self.client.get('/platform/?limit=0',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.BAD_REQUEST, resp.status_code)
+
+    def test_platform_read_list_location(self):
+        """filter platforms by polygon and bounding box"""
+        for platform_id, location in [("canberra", "POINT (149.13 -35.28)"),
+                                      ("london", "POINT (-0.13 51.51)"),
+                                      ("nowhere", None)]:
+            self.app.system.create_platform(
+                dict(SampleData.sample_platform,
+                     platform_id=platform_id, location=location))
+
+        resp = self.client.get(
+            '/platform/?location=POLYGON((138.515625+-27.839076094777802,'
+            '154.3359375+-27.839076094777802,154.3359375+-40.044437584608566,'
+            '138.515625+-40.044437584608566,138.515625+-27.839076094777802))',
+            headers={'Accept': 'application/json'})
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertEquals(["canberra"], json.loads(resp.data).keys())
+
+        resp = self.client.get('/platform/?bbox=-10,40,10,60&limit=10',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertEquals(["london"], [p["platform_id"] for p in
+                                       json.loads(resp.data)["platforms"]])
+
+    def test_platform_read_list_bad_location(self):
+        """malformed regions are rejected"""
+        resp = self.client.get('/platform/?location=POINT(0 0)',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.BAD_REQUEST, resp.status_code)
+        for bbox in ["1,2", "nan,0,1,1", "0,0,inf,1"]:
+            resp = self.client.get('/platform/?bbox=' + bbox,
+                                   headers={'Accept': 'application/json'})
+            self.assertEquals(status.BAD_REQUEST, resp.status_code)
+
+    def test_platform_read_list_near(self):
+        """nearest platforms come back closest first"""
+        for platform_id, location in [("a", "POINT (0 0)"),
+                                      ("b", "POINT (3 4)"),
+                                      ("c", "POINT (1 1)")]:
+            self.app.system.create_platform(
+                dict(SampleData.sample_platform,
+                     platform_id=platform_id, location=location))
+        self.app.system.create_platform(SampleData.sample_platform)
+        self.app.system.create_sensor(SampleData.sample_sensor)
+        self.app.system.create_parameter(SampleData.sample_parameter)
+
+        resp = self.client.get('/platform/?near=POINT(3 3)&k=2',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.OK, resp.status_code)
+        json_data = json.loads(resp.data)
+        self.assertEquals(["b", "c"], [p["platform_id"] for p in json_data])
+        self.assertEquals(1.0, json_data[0]["distance"])
+
+        # only the sample platform measures the sample phenomena
+        resp = self.client.get(
+            '/platform/?near=POINT(3 3)&phenomena=' +
+            SampleData.sample_parameter["phenomena"],
+            headers={'Accept': 'application/json'})
+        self.assertEquals([SampleData.sample_platform_id],
+                          [p["platform_id"] for p in json.loads(resp.data)])
+
+    def test_platform_read_list_near_bad(self):
+        """near needs a point and k a positive integer"""
+        for query in ["near=somewhere", "near=POINT(0 0)&k=0",
+                      "near=POINT(0 0)&k=x", "near=POINT(nan 0)"]:
+            resp = self.client.get('/platform/?' + query,
+                                   headers={'Accept': 'application/json'})
+            self.assertEquals(status.BAD_REQUEST, resp.status_code)
+
+    def test_platform_clusters(self):
+        """cluster platforms for a map zoom level"""
+        for platform_id, location in [("a", "POINT (1 1)"),
+                                      ("b", "POINT (3 3)"),
+                                      ("c", "POINT (100 10)")]:
+            self.app.system.create_platform(
+                dict(SampleData.sample_platform,
+                     platform_id=platform_id, location=location))
+
+        resp = self.client.get('/platform/clusters?zoom=0',
+                               headers={'Accept': 'application/json'})
+        self.assertEquals(status.OK, resp.status_code)
+        clusters = json.loads(resp.data)["clusters"]
+        self.assertEquals([3], [c["count"] for c in clusters])
+
+        resp = self.client.get('/platform/clusters?zoom=4&bbox=0,0,10,10',
+                               headers={'Accept': 'application/json'})
+        clusters = json.loads(resp.data)["clusters"]
+        self.assertEquals(1, len(clusters))
+        self.assertEquals(["a", "b"], sorted(clusters[0]["platform_ids"]))
+
+        resp = self.client.get('/platform/clusters?zoom=0')
+        self.assertEquals(status.OK, resp.status_code)
+
+    def test_platform_clusters_bad(self):
+        """zoom is required and must be in range"""
+        for query in ["", "?zoom=x", "?zoom=99", "?zoom=1&bbox=1,2"]:
+            resp = self.client.get('/platform/clusters' + query,
+                                   headers={'Accept': 'application/json'})
+            self.assertEquals(status.BAD_REQUEST, resp.status_code)
+
+    def test_cache_stats(self):
+        """cache counters are reported as JSON"""
+        counters = {"platform": {"size": 1, "entries": 0, "hits": 2,
+                                 "misses": 3}}
+        self.app.system.get_cache_stats = lambda: counters
+        resp = self.client.get('/stats/cache')
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertEquals(counters, json.loads(resp.data))
+
+    def test_platform_read_not_modified(self):
+        """If-None-Match with the current ETag is answered by a 304"""
+        self.app.system.create_platform(SampleData.sample_platform)
+        uri = '/platform/' + SampleData.sample_platform_id
+        headers = {'Accept': 'application/json'}
+        resp = self.client.get(uri, headers=headers)
+        self.assertEquals(status.OK, resp.status_code)
+        etag = resp.headers["ETag"]
+
+        get_platform = self.app.system.get_platform
+        self.app.system.get_platform = None
+        headers["If-None-Match"] = etag
+        resp = self.client.get(uri, headers=headers)
+        self.assertEquals(status.NOT_MODIFIED, resp.status_code)
+        self.assertEquals(etag, resp.headers["ETag"])
+
+        # any registry write changes the tag
+        self.app.system.get_platform = get_platform
+        self.app.system.update_platform(
+            dict(SampleData.sample_platform, name="renamed"))
+        resp = self.client.get(uri, headers=headers)
+        self.assertEquals(status.OK, resp.status_code)
+        self.assertNotEqual(etag, resp.headers["ETag"])
+
+    def test_platform_list_etag_per_representation(self):
+        """JSON and HTML listings are tagged differently"""
+        self.app.system.create_platform(SampleData.sample_platform)
+        json_resp = self.client.get('/platform/',
+                                    headers={'Accept': 'application/json'})
+        html_resp = self.client.get('/platform/')
+        self.assertNotEqual(json_resp.headers["ETag"],
+                            html_resp.headers["ETag"])
+
     """
     # Create
     """
@@ -447,6 +649,33 @@ class TestRestApi(unittest.TestCase):
         #self.assertTrue(SampleData.sample_sensor_model in json_data)
         self.assertTrue(SampleData.sample_sensor_serial_number in json_data)
 
+    def test_sensor_list_filtered(self):
+        """filter the sensor list using the query string"""
+        self.app.system.create_platform(SampleData.sample_platform)
+        self.app.system.create_sensor(SampleData.sample_sensor)
+        other = dict(SampleData.sample_sensor,
+                     model="tm302", serial_number="other_serial_number")
+        self.app.system.create_sensor(other)
+        self.app.system.create_parameter(SampleData.sample_parameter)
+
+        resp = self.client.get('/sensor/?sensor_model=tm302',
+                               headers={'Accept': 'application/json'})
+        json_data = json.loads(resp.data)
+        self.assertEqual(["other_serial_number"], json_data.keys())
+
+        resp = self.client.get(
+            '/sensor/' + SampleData.sample_platform_id + '?' +
+            urllib.urlencode({
+                "parameter_phenomena": SampleData.sample_parameter_phenomena}),
+            headers={'Accept': 'application/json'})
+        json_data = json.loads(resp.data)
+        self.assertEqual([SampleData.sample_sensor_serial_number],
+                         json_data.keys())
+
+        resp = self.client.get('/sensor/?sensor_model=missing',
+                               headers={'Accept': 'application/json'})
+        self.assertEqual("no data found", resp.data)
+
     """
     #
     # Parameter API
@@ -744,23 +973,345 @@ class TestRestApi(unittest.TestCase):
     # /observation
     """
 
+    def observation_uri(self):
+        return '/observation/' + SampleData.sample_platform_id + "/" + \
+            SampleData.sample_sensor_manufacturer + "/" + \
+            SampleData.sample_sensor_model + "/" + \
+            SampleData.sample_sensor_serial_number + "/" + \
+            urllib.quote_plus(SampleData.sample_parameter_phenomena)
+
+    def demo_parameter(self):
+        self.app.system.create_platform(SampleData.sample_platform)
+        self.app.system.create_sensor(SampleData.sample_sensor)
+        self.app.system.create_parameter(SampleData.sample_parameter)
+
     """
     Create
     """
     def test_create_observation(self):
-        pass
+        """create a single observation"""
+        self.demo_parameter()
+        resp = self.client.post(
+            self.observation_uri(),
+            data=json.dumps(SampleData.sample_observation),
+            content_type='application/json')
+        self.assertEqual(status.CREATED, resp.status_code)
+
+        stored = self.app.system.observations.values()[0]
+        self.assertEqual(
+            SampleData.sample_observation["value"],
+            stored[SampleData.sample_observation["timestamp"]])
+
+    def test_create_observation_batch(self):
+        """create a batch of observations in one request"""
+        self.demo_parameter()
+        batch = [{"timestamp": SampleData.sample_observation["timestamp"] + i,
+                  "value": float(i)} for i in range(2500)]
+        resp = self.client.post(
+            self.observation_uri(),
+            data=json.dumps(batch),
+            content_type='application/json')
+        self.assertEqual(status.CREATED, resp.status_code)
+        self.assertEqual(2500, len(self.app.system.observations.values()[0]))
+
+    def test_create_observation_resend(self):
+        """resending a batch overwrites rather than conflicts"""
+        self.demo_parameter()
+        batch = [{"timestamp": SampleData.sample_observation["timestamp"] + i,
+                  "value": float(i)} for i in range(10)]
+        for value in [0.0, 5.0]:
+            batch[0]["value"] = value
+            resp = self.client.post(
+                self.observation_uri(),
+                data=json.dumps(batch),
+                content_type='application/json')
+            self.assertEqual(status.CREATED, resp.status_code)
+        stored = self.app.system.observations.values()[0]
+        self.assertEqual(10, len(stored))
+        self.assertEqual(5.0, stored[SampleData.sample_observation["timestamp"]])
+
+    def test_create_observation_no_timestamp(self):
+        """observations without a timestamp use the system time"""
+        self.demo_parameter()
+        resp = self.client.post(
+            self.observation_uri(),
+            data=json.dumps({"value": 1.0}),
+            content_type='application/json')
+        self.assertEqual(status.CREATED, resp.status_code)
+        self.assertEqual(1, len(self.app.system.observations.values()[0]))
 
     def test_create_observation_invalid(self):
-        pass
+        """observations must have a value and a numeric timestamp"""
+        self.demo_parameter()
+        for payload in [[], [{"timestamp": 1}], [{"timestamp": "x", "value": 1}]]:
+            resp = self.client.post(
+                self.observation_uri(),
+                data=json.dumps(payload),
+                content_type='application/json')
+            self.assertEqual(status.BAD_REQUEST, resp.status_code)
+
+    def test_create_observation_ndjson(self):
+        """stream observations as newline delimited JSON"""
+        self.demo_parameter()
+        lines = [json.dumps({"timestamp": 1434890106 + i, "value": i})
+                 for i in range(100)]
+        resp = self.client.post(
+            self.observation_uri(),
+            data="\n".join(lines) + "\n",
+            content_type='application/x-ndjson')
+        self.assertEqual(status.CREATED, resp.status_code)
+        stored = self.app.system.observations.values()[0]
+        self.assertEqual(100, len(stored))
+        self.assertEqual(99.0, stored[1434890106 + 99])
+
+    def test_create_observation_csv(self):
+        """stream observations as CSV with a header row"""
+        self.demo_parameter()
+        resp = self.client.post(
+            self.observation_uri(),
+            data="timestamp,value\n1434890106,1.5\n1434890107,2\n",
+            content_type='text/csv')
+        self.assertEqual(status.CREATED, resp.status_code)
+        stored = self.app.system.observations.values()[0]
+        self.assertEqual({1434890106: 1.5, 1434890107: 2.0}, stored)
+
+    def test_create_observation_stream_typed(self):
+        """streamed values are checked against the phenomena data_type"""
+        self.demo_parameter()
+        phenomena = dict(SampleData.sample_phenomena, data_type="int")
+        self.app.system.create_phenomena(phenomena)
+        resp = self.client.post(
+            self.observation_uri(),
+            data="1434890106,1\n1434890107,abc\n",
+            content_type='text/csv')
+        self.assertEqual(status.BAD_REQUEST, resp.status_code)
+        self.assertFalse(self.app.system.observations.values()[0])
+
+    def test_create_observation_stream_altered(self):
+        """streamed values that would be stored altered are refused"""
+        self.demo_parameter()
+        for data_type, value in [("int", 3.7), ("bool", "nope")]:
+            self.app.system.phenomena = {}
+            self.app.system.create_phenomena(
+                dict(SampleData.sample_phenomena, data_type=data_type))
+            for data, content_type in [
+                    (json.dumps({"timestamp": 1434890106, "value": value}),
+                     'application/x-ndjson'),
+                    ("1434890106,%s\n" % value, 'text/csv')]:
+                resp = self.client.post(
+                    self.observation_uri(),
+                    data=data,
+                    content_type=content_type)
+                self.assertEqual(status.BAD_REQUEST, resp.status_code)
+        self.assertFalse(self.app.system.observations.values()[0])
+
+    def test_create_observation_missing_parameter(self):
+        """observations can only be created for registered parameters"""
+        resp = self.client.post(
+            self.observation_uri(),
+            data=json.dumps(SampleData.sample_observation),
+            content_type='application/json')
+        self.assertEqual(status.NOT_FOUND, resp.status_code)
+
+    def test_create_observation_async(self):
+        """Prefer: respond-async spools observations and answers 202"""
+        self.demo_parameter()
+        directory = tempfile.mkdtemp()
+        try:
+            self.app.spool = Spool(directory, spool_committer(self.app))
+            self.app.spool.ensure_started = lambda: None
+            resp = self.client.post(
+                self.observation_uri(),
+                data=json.dumps(SampleData.sample_observation),
+                content_type='application/json',
+                headers={"Prefer": "respond-async"})
+            self.assertEqual(status.ACCEPTED, resp.status_code)
+            self.assertEqual({}, self.app.system.observations)
+
+            self.app.spool.drain()
+            stored = self.app.system.observations.values()[0]
+            self.assertEqual(1, len(stored))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_create_observation_async_disabled(self):
+        """without a spool configured observations are written at once"""
+        self.demo_parameter()
+        resp = self.client.post(
+            self.observation_uri(),
+            data=json.dumps(SampleData.sample_observation),
+            content_type='application/json',
+            headers={"Prefer": "respond-async"})
+        self.assertEqual(status.CREATED, resp.status_code)
 
     """
     Read
     """
+    def demo_observations(self, count):
+        self.demo_parameter()
+        self.app.system.create_observations(
+            SampleData.sample_platform_id,
+            SampleData.sample_sensor_manufacturer,
+            SampleData.sample_sensor_model,
+            SampleData.sample_sensor_serial_number,
+            SampleData.sample_parameter_phenomena,
+            [{"timestamp": 1434890106 + i, "value": float(i)}
+             for i in range(count)])
+
     def test_read_observation(self):
-        pass
+        """read back a time range of observations"""
+        self.demo_observations(10)
+        resp = self.client.get(
+            self.observation_uri() + "?start=1434890108&end=1434890111")
+        self.assertEqual(status.OK, resp.status_code)
+        json_data = json.loads(resp.data)
+        self.assertEqual([1434890108, 1434890109, 1434890110],
+                         [o["timestamp"] for o in json_data["observations"]])
+        self.assertEqual(None, json_data["next"])
+
+    def test_read_observation_sealed(self):
+        """sealed time ranges carry validators that must be revalidated"""
+        self.demo_observations(10)
+        uri = self.observation_uri() + "?start=1434890108&end=1434890111"
+        resp = self.client.get(uri)
+        self.assertEqual(status.OK, resp.status_code)
+        etag = resp.headers["ETag"]
+        self.assertEqual("public, no-cache", resp.headers["Cache-Control"])
+
+        get_observations = self.app.system.get_observations
+        def fail(*args, **kwargs):
+            raise AssertionError("backend read for a 304")
+        self.app.system.get_observations = fail
+        resp = self.client.get(uri, headers={"If-None-Match": etag})
+        self.assertEqual(status.NOT_MODIFIED, resp.status_code)
+        self.assertEqual("", resp.data)
+        self.app.system.get_observations = get_observations
+
+        # recent writes leave sealed ranges alone, backfills change their tag
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        self.app.system.create_observations(*(key + (
+            [{"timestamp": time.time(), "value": 1.0}],)))
+        resp = self.client.get(uri, headers={"If-None-Match": etag})
+        self.assertEqual(status.NOT_MODIFIED, resp.status_code)
+        self.app.system.create_observations(*(key + (
+            [{"timestamp": 1434890109, "value": 42.0}],)))
+        resp = self.client.get(uri, headers={"If-None-Match": etag})
+        self.assertEqual(status.OK, resp.status_code)
+        self.assertEqual(42.0, json.loads(resp.data)["observations"][1]["value"])
+
+    def test_read_observation_open_range(self):
+        """ranges reaching past the watermark aren't given validators"""
+        self.demo_observations(10)
+        resp = self.client.get(self.observation_uri() + "?start=1434890108")
+        self.assertEqual(status.OK, resp.status_code)
+        self.assertFalse("ETag" in resp.headers)
+
+    def test_read_observation_iso_time(self):
+        """start and end may be given as date strings"""
+        self.demo_observations(10)
+        resp = self.client.get(
+            self.observation_uri() + "?start=2015-06-21T12:35:15Z")
+        json_data = json.loads(resp.data)
+        self.assertEqual(1, len(json_data["observations"]))
+
+    def test_read_observation_pages(self):
+        """follow next links until all observations have been read"""
+        self.demo_observations(25)
+        uri = self.observation_uri() + "?limit=10"
+        seen = []
+        while uri:
+            resp = self.client.get(uri)
+            self.assertEqual(status.OK, resp.status_code)
+            json_data = json.loads(resp.data)
+            seen.extend(o["timestamp"] for o in json_data["observations"])
+            uri = json_data["next"]
+        self.assertEqual([1434890106 + i for i in range(25)], seen)
 
     def test_read_observation_invalid(self):
-        pass
+        """bad query strings and unknown parameters are rejected"""
+        self.demo_parameter()
+        for query in ["?start=notatime", "?limit=0", "?limit=abc"]:
+            resp = self.client.get(self.observation_uri() + query)
+            self.assertEqual(status.BAD_REQUEST, resp.status_code)
+
+        resp = self.client.get(self.observation_uri() + "/missing")
+        self.assertEqual(status.NOT_FOUND, resp.status_code)
+
+    def test_read_observation_aggregates(self):
+        """downsample observations into buckets"""
+        self.demo_observations(600)
+        resp = self.client.get(
+            self.observation_uri() + "?bucket=5m&agg=count,min,max,mean")
+        self.assertEqual(status.OK, resp.status_code)
+        json_data = json.loads(resp.data)
+        self.assertEqual(300, json_data["bucket"])
+        self.assertEqual(600, sum(o["count"] for o in json_data["observations"]))
+        first = json_data["observations"][0]
+        self.assertEqual(1434890100, first["timestamp"])
+        self.assertEqual(0.0, first["min"])
+        self.assertEqual(293.0, first["max"])
+
+    def test_read_observation_aggregates_invalid(self):
+        """unsupported buckets and aggregates are rejected"""
+        self.demo_parameter()
+        for query in ["?bucket=5y", "?bucket=5m&agg=median"]:
+            resp = self.client.get(self.observation_uri() + query)
+            self.assertEqual(status.BAD_REQUEST, resp.status_code)
+
+    def test_read_observation_points(self):
+        """downsample observations for charting"""
+        self.demo_observations(600)
+        resp = self.client.get(self.observation_uri() + "?points=50")
+        self.assertEqual(status.OK, resp.status_code)
+        json_data = json.loads(resp.data)
+        self.assertEqual(50, len(json_data["observations"]))
+        self.assertEqual(
+            {"timestamp": 1434890106, "value": 0.0},
+            json_data["observations"][0])
+
+        resp = self.client.get(self.observation_uri() + "?points=2")
+        self.assertEqual(status.BAD_REQUEST, resp.status_code)
+
+    def test_read_observation_raw(self):
+        """export observations as packed little-endian arrays"""
+        self.demo_observations(10)
+        resp = self.client.get(
+            self.observation_uri() + "?start=1434890108",
+            headers={'Accept': columnar.RAW_MIMETYPE})
+        self.assertEqual(status.OK, resp.status_code)
+        self.assertEqual(columnar.RAW_MIMETYPE, resp.mimetype)
+        count = struct.unpack('<Q', resp.data[:8])[0]
+        arrays = numpy.frombuffer(resp.data, dtype='<f8', offset=8)
+        self.assertEqual(8, count)
+        self.assertEqual(1434890108, arrays[0])
+        self.assertEqual(9.0, arrays[-1])
+
+    def test_read_observation_arrow(self):
+        """export observations as an Arrow IPC stream"""
+        if columnar.pyarrow is None:
+            return
+        self.demo_observations(10)
+        resp = self.client.get(
+            self.observation_uri(),
+            headers={'Accept': columnar.ARROW_MIMETYPE})
+        self.assertEqual(columnar.ARROW_MIMETYPE, resp.mimetype)
+        reader = columnar.pyarrow.ipc.open_stream(resp.data)
+        table = reader.read_all()
+        self.assertEqual(10, table.num_rows)
+        self.assertEqual(
+            [float(i) for i in range(10)],
+            table.column('value').to_pylist())
+
+    def test_read_observation_wildcard(self):
+        """clients accepting anything still get JSON"""
+        self.demo_observations(10)
+        resp = self.client.get(
+            self.observation_uri(), headers={'Accept': '*/*'})
+        self.assertEqual('application/json', resp.mimetype)
 
     """
     Delete
@@ -0,0 +1,188 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import numpy
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver.backend import mapped
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sample_data import SampleData
+
+
+class TestMapped(unittest.TestCase):
+    """
+    Tests for the memory mapped observation files
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.series = mapped.Series(self.directory, "o_1")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, timestamps, values):
+        self.series.write(numpy.array(timestamps, dtype='<i8'),
+                          numpy.array(values, dtype='<f8'))
+
+    def test_empty(self):
+        timestamps, values = self.series.read()
+        self.assertEqual(0, len(timestamps))
+        self.assertEqual(0, len(values))
+
+    def test_append(self):
+        self.write([1, 2], [1.0, 2.0])
+        self.write([3], [3.0])
+        timestamps, values = self.series.read()
+        self.assertEqual([1, 2, 3], timestamps.tolist())
+        self.assertEqual([1.0, 2.0, 3.0], values.tolist())
+        self.assertEqual(
+            3 * mapped.RECORD_WIDTH,
+            os.path.getsize(os.path.join(self.directory, "o_1.values")))
+
+    def test_out_of_order(self):
+        """late and resent observations are merged, newer values win"""
+        self.write([1, 3, 5], [1.0, 3.0, 5.0])
+        self.write([4, 2, 3], [4.0, 2.0, 30.0])
+        timestamps, values = self.series.read()
+        self.assertEqual([1, 2, 3, 4, 5], timestamps.tolist())
+        self.assertEqual([1.0, 2.0, 30.0, 4.0, 5.0], values.tolist())
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, "o_1.commit")))
+
+    def test_rewrite_suffix(self):
+        """late observations rewrite the files in place from where they go"""
+        self.write(range(0, 1000, 10), [float(t) for t in range(0, 1000, 10)])
+        path = os.path.join(self.directory, "o_1.ts")
+        inode = os.stat(path).st_ino
+        written = []
+        recover = self.series.recover
+        def spy():
+            if os.path.exists(path + ".new"):
+                written.append(os.path.getsize(path + ".new"))
+            recover()
+        self.series.recover = spy
+        self.write([985, 975], [1.0, 2.0])
+        self.assertEqual([4 * mapped.RECORD_WIDTH], written[-1:])
+        self.assertEqual(inode, os.stat(path).st_ino)
+        timestamps, values = self.series.read()
+        self.assertEqual([970, 975, 980, 985, 990], timestamps[-5:].tolist())
+        self.assertEqual([970.0, 2.0, 980.0, 1.0, 990.0], values[-5:].tolist())
+        self.assertEqual(102, len(timestamps))
+
+    def test_rewrite_mapped(self):
+        """files still mapped by a reader are replaced rather than changed"""
+        self.write([1, 3, 5], [1.0, 3.0, 5.0])
+        timestamps, values = self.series.read()
+        self.write([4], [4.0])
+        self.assertEqual([1, 3, 5], timestamps.tolist())
+        self.assertEqual([5.0], values[2:].tolist())
+        del timestamps, values
+        self.assertEqual([1.0, 3.0, 4.0, 5.0], self.series.read()[1].tolist())
+
+    def test_torn_append(self):
+        """a partial record left by a crash is ignored then overwritten"""
+        self.write([1], [1.0])
+        with open(os.path.join(self.directory, "o_1.values"), "ab") as f:
+            f.write(numpy.array([2.0]).tobytes()[:5])
+        self.assertEqual([1], self.series.read()[0].tolist())
+        self.write([2], [2.0])
+        self.assertEqual([1.0, 2.0], self.series.read()[1].tolist())
+
+    def test_recover_rewrite(self):
+        """a rewrite is rolled forward only once it was committed"""
+        self.write([1], [1.0])
+        for path in ["o_1.ts.new", "o_1.values.new"]:
+            with open(os.path.join(self.directory, path), "wb") as f:
+                f.write(numpy.array([9], dtype='<i8').tobytes())
+        self.assertEqual([1], self.series.read()[0].tolist())
+
+        for path in ["o_1.ts.new", "o_1.values.new"]:
+            with open(os.path.join(self.directory, path), "wb") as f:
+                f.write(numpy.array([9], dtype='<i8').tobytes())
+        open(os.path.join(self.directory, "o_1.commit"), "w").close()
+        self.assertEqual([9], self.series.read()[0].tolist())
+
+        # a suffix rewrite is copied over the files from the record given
+        for path in ["o_1.ts.new", "o_1.values.new"]:
+            with open(os.path.join(self.directory, path), "wb") as f:
+                f.write(numpy.array([10, 11], dtype='<i8').tobytes())
+        with open(os.path.join(self.directory, "o_1.commit"), "w") as f:
+            f.write("1")
+        self.assertEqual([9, 10, 11], self.series.read()[0].tolist())
+
+
+class TestMappedBackend(unittest.TestCase):
+    """
+    Tests for the mapped backend with its registry in SQLite
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(
+            "sqlite:///" + os.path.join(self.directory, "registry.db"))
+        self.backend = mapped.Mapped()
+        self.backend.observation_dir = os.path.join(
+            self.directory, "observations")
+        self.backend.prepare(self.engine)
+        self.backend.session = scoped_session(sessionmaker(bind=self.engine))
+        self.backend.create_platform(dict(SampleData.sample_platform))
+        self.backend.create_sensor(dict(SampleData.sample_sensor))
+        self.backend.create_parameter(dict(SampleData.sample_parameter))
+        self.key = tuple(SampleData.sample_parameter[field] for field in [
+            "platform_id", "manufacturer", "model", "serial_number",
+            "phenomena"])
+
+    def tearDown(self):
+        self.backend.session.remove()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def create(self, observations):
+        self.backend.create_observations(*(self.key + (observations,)))
+
+    def read(self, **kwargs):
+        return [(o["timestamp"], o["value"])
+                for o in self.backend.get_observations(*self.key, **kwargs)]
+
+    def test_get_observations(self):
+        """ranges, pages and aggregates are read from the files"""
+        self.create([{"timestamp": t, "value": t} for t in range(0, 100, 10)])
+        self.assertEqual([(20, 20.0), (30, 30.0), (40, 40.0)],
+                         self.read(start=20, end=50))
+        self.assertEqual([(40, 40.0), (50, 50.0)],
+                         self.read(start=20, after=30, limit=2))
+        self.assertEqual(10, len(self.read()))
+        self.assertEqual(
+            [{"timestamp": 0, "count": 5, "max": 40.0},
+             {"timestamp": 50, "count": 5, "max": 90.0}],
+            self.backend.get_observation_aggregates(
+                *(self.key + (50, ["count", "max"]))))
+
+    def test_late_batch(self):
+        """late batches rewrite the end of the files in place"""
+        self.create([{"timestamp": t, "value": t} for t in range(0, 100, 10)])
+        path = os.path.join(self.directory, "observations", "o_1.values")
+        inode = os.stat(path).st_ino
+        self.create([{"timestamp": 75, "value": 1}, {"timestamp": 80, "value": 2}])
+        self.assertEqual(inode, os.stat(path).st_ino)
+        self.assertEqual([(70, 70.0), (75, 1.0), (80, 2.0), (90, 90.0)],
+                         self.read(start=70))
+
+    def test_late_batch_while_mapped(self):
+        """arrays handed out don't change under a late batch"""
+        self.create([{"timestamp": t, "value": t} for t in range(0, 100, 10)])
+        timestamps, values = self.backend.get_observation_arrays(
+            *self.key, start=70)
+        self.create([{"timestamp": 75, "value": 1}, {"timestamp": 80, "value": 2}])
+        self.assertEqual([70.0, 80.0, 90.0], values.tolist())
+        del timestamps, values
+        self.assertEqual([(70, 70.0), (75, 1.0), (80, 2.0), (90, 90.0)],
+                         self.read(start=70))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import os
 APP_DIR = os.path.dirname(__file__) + "/.."
 sys.path.append(APP_DIR)
 from lsdserver.backend.mysql import Mysql
+from lsdserver.backend.chunked import Chunked
 import MySQLdb
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
@@ -13,12 +14,17 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.engine.url import URL
 from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, func
 from sqlalchemy.orm import relationship, backref
+from werkzeug.exceptions import HTTPException
 from lsdserver.backend.mysql import Platform
 from lsdserver.backend.mysql import Sensor
 from lsdserver.backend.mysql import Parameter
+from lsdserver.backend.mysql import Phenomena
+from lsdserver.backend.mysql import ObservationPool
 from sample_data import SampleData
 
 from lsdserver.base import Base
+from lsdserver import aggregate
+from lsdserver import spatial
 
 from sample_data import SampleData
 
@@ -117,6 +123,8 @@ class TestMysql(unittest.TestCase):
 
     def drop_db(self):
         self.db_session.query(Parameter).delete()
+        self.db_session.query(ObservationPool).delete()
+        self.db_session.query(Phenomena).delete()
         self.db_session.query(Sensor).delete()
         self.db_session.query(Platform).delete()
         self.db_session.commit()
@@ -161,13 +169,13 @@ class TestMysql(unittest.TestCase):
 
     def test_get_platforms_empty(self):
         """ get_platforms() with no data loaded"""
-        data = self.backend.get_platforms()
+        data = list(self.backend.get_platforms())
         self.assertEqual(len(data), 0)
 
     def test_get_platforms_data(self):
         """ get_platforms() with data loaded """
         self.demo_platform()
-        data = self.backend.get_platforms()
+        data = list(self.backend.get_platforms())
         self.assertEqual(len(data), 1)
 
         self.assertEqual(SampleData.sample_platform["platform_id"], data[0]["platform_id"])
@@ -176,6 +184,156 @@ class TestMysql(unittest.TestCase):
         self.assertEqual(SampleData.sample_platform["info"], data[0]["info"])
         self.assertEqual(SampleData.sample_platform["location"], data[0]["location"])
 
+    def test_get_platforms_page(self):
+        """ get_platforms() pages on platform_id """
+        for platform_id in ["c", "a", "b"]:
+            self.backend.create_platform(
+                dict(SampleData.sample_platform, platform_id=platform_id))
+
+        data = list(self.backend.get_platforms(limit=2))
+        self.assertEqual(["a", "b"], [p["platform_id"] for p in data])
+
+        data = list(self.backend.get_platforms(limit=2, after="b"))
+        self.assertEqual(["c"], [p["platform_id"] for p in data])
+
+    def test_get_platforms_region(self):
+        """ get_platforms() within a region uses the parsed location """
+        for platform_id, location in [("a", "POINT (1 1)"),
+                                      ("b", "POINT (5 5)"),
+                                      ("c", "POINT (1 2)"),
+                                      ("d", "unknown")]:
+            self.backend.create_platform(
+                dict(SampleData.sample_platform,
+                     platform_id=platform_id, location=location))
+        region = spatial.BoundingBox(0, 0, 2, 2)
+
+        data = list(self.backend.get_platforms(region=region))
+        self.assertEqual(["a", "c"], sorted(p["platform_id"] for p in data))
+
+        data = list(self.backend.get_platforms(limit=1, after="a",
+                                               region=region))
+        self.assertEqual(["c"], [p["platform_id"] for p in data])
+
+        # index follows deletes once loaded
+        self.backend.delete_platform("c")
+        data = list(self.backend.get_platforms(region=region))
+        self.assertEqual(["a"], [p["platform_id"] for p in data])
+
+    def test_get_nearest_platforms(self):
+        """ get_nearest_platforms() orders by distance """
+        for platform_id, location in [("a", "POINT (0 0)"),
+                                      ("b", "POINT (3 4)"),
+                                      ("c", "POINT (1 1)")]:
+            self.backend.create_platform(
+                dict(SampleData.sample_platform,
+                     platform_id=platform_id, location=location))
+
+        data = self.backend.get_nearest_platforms(3, 3, 2)
+        self.assertEqual(["b", "c"], [p["platform_id"] for p in data])
+        self.assertEqual(1.0, data[0]["distance"])
+
+        data = self.backend.get_nearest_platforms(3, 3, 2, "nothing")
+        self.assertEqual([], data)
+
+    def test_get_platform_clusters(self):
+        """ get_platform_clusters() follows creates and deletes """
+        world = spatial.BoundingBox(-180, -90, 180, 90)
+        self.backend.create_platform(
+            dict(SampleData.sample_platform, platform_id="a",
+                 location="POINT (1 1)"))
+        data = self.backend.get_platform_clusters(world, 0)
+        self.assertEqual([1], [c["count"] for c in data])
+
+        self.backend.create_platform(
+            dict(SampleData.sample_platform, platform_id="b",
+                 location="POINT (3 3)"))
+        data = self.backend.get_platform_clusters(world, 0)
+        self.assertEqual([2], [c["count"] for c in data])
+
+        self.backend.delete_platform("a")
+        data = self.backend.get_platform_clusters(world, 0)
+        self.assertEqual([["b"]], [c["platform_ids"] for c in data])
+
+    def test_get_platform_cached(self):
+        """ get_platform() is served from the registry cache """
+        self.demo_platform()
+        platform_id = SampleData.sample_platform_id
+        data = self.backend.get_platform(platform_id)
+        data["name"] = "changed by caller"
+        data = self.backend.get_platform(platform_id)
+        self.assertEqual(SampleData.sample_platform["name"], data["name"])
+        stats = self.backend.get_cache_stats()["platform"]
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(1, stats["hits"])
+
+    def test_update_platform_invalidates(self):
+        """ update_platform() is visible to the next get_platform() """
+        self.demo_platform()
+        data = self.backend.get_platform(SampleData.sample_platform_id)
+        data["info"] = "http://new_info"
+        data["location"] = "POINT (10 20)"
+        self.backend.update_platform(data)
+        data = self.backend.get_platform(SampleData.sample_platform_id)
+        self.assertEqual("http://new_info", data["info"])
+        self.assertEqual(20.0, data["latitude"])
+
+    def test_update_sensor_invalidates(self):
+        """ update_sensor() is visible to the next get_sensor() """
+        self.demo_sensor()
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number)
+        data = self.backend.get_sensor(*key)
+        data["info"] = "http://new_info"
+        self.backend.update_sensor(data)
+        self.assertEqual("http://new_info",
+                         self.backend.get_sensor(*key)["info"])
+        self.backend.delete_sensor(*key)
+        self.assertEqual(None, self.backend.get_sensor(*key))
+
+    def test_registry_invalidated_by_other_process(self):
+        """ writes by another backend instance evict cached entries """
+        self.backend.registry_poll_interval = 0
+        other = Mysql()
+        other.session = self.db_session
+        self.backend.create_platform(SampleData.sample_platform)
+        self.assertEqual(SampleData.sample_platform["info"],
+                         self.backend.get_platform(
+                             SampleData.sample_platform_id)["info"])
+
+        data = other.get_platform(SampleData.sample_platform_id)
+        data["info"] = "http://new_info"
+        other.update_platform(data)
+        self.assertEqual("http://new_info", self.backend.get_platform(
+            SampleData.sample_platform_id)["info"])
+
+    def test_registry_own_write_keeps_caches(self):
+        """ a process's own writes don't evict its other cached entries """
+        self.backend.create_platform(SampleData.sample_platform)
+        self.backend.get_registry_generation()
+        self.backend.get_spatial_index()
+        self.backend.create_platform(
+            dict(SampleData.sample_platform, platform_id="other"))
+        self.backend.get_platform("other")
+        self.assertTrue(self.backend.spatial_index is not None)
+        self.assertTrue("other" in self.backend.get_spatial_index().keys)
+
+    def test_registry_generation(self):
+        """ get_registry_generation() moves on every registry write """
+        before = self.backend.get_registry_generation()
+        self.backend.create_platform(SampleData.sample_platform)
+        after = self.backend.get_registry_generation()
+        self.assertNotEqual(before, after)
+        self.assertEqual(after, self.backend.get_registry_generation())
+
+    def test_create_platform_coordinates(self):
+        """ create_platform() stores numeric coordinates """
+        self.backend.create_platform(SampleData.sample_platform)
+        platform = self.backend.session.query(Platform).first()
+        self.assertEqual(0.0, platform.longitude)
+        self.assertEqual(0.0, platform.latitude)
+
 
     #
     # get_sensor()
@@ -203,7 +361,7 @@ class TestMysql(unittest.TestCase):
     def test_create_platform(self):
         """create a platform and attempt to read it back"""
         self.backend.create_platform(SampleData.sample_platform)
-        data = self.backend.get_platforms()
+        data = list(self.backend.get_platforms())
         self.assertEqual(len(data), 1)
 
 #    def test_create_platform_dup(self):
@@ -216,7 +374,7 @@ class TestMysql(unittest.TestCase):
         """Create a sensor and attempt to read it back"""
         self.demo_platform()
         self.backend.create_sensor(SampleData.sample_sensor)
-        data = self.backend.get_sensors()
+        data = list(self.backend.get_sensors())
         self.assertEqual(len(data), 1)
 
     def test_create_sensor_dup(self):
@@ -232,7 +390,7 @@ class TestMysql(unittest.TestCase):
         """create a platform and attempt to delete it"""
         self.demo_platform()
         self.backend.delete_platform(SampleData.sample_platform_id)
-        data = self.backend.get_platforms()
+        data = list(self.backend.get_platforms())
         self.assertEqual(len(data), 0)
 
     #
@@ -250,7 +408,7 @@ class TestMysql(unittest.TestCase):
             SampleData.sample_sensor_manufacturer,
             SampleData.sample_sensor_model,
             SampleData.sample_sensor_serial_number)
-        data = self.backend.get_sensors()
+        data = list(self.backend.get_sensors())
         self.assertEqual(len(data), 0)
 
     #
@@ -261,18 +419,100 @@ class TestMysql(unittest.TestCase):
         self.demo_platform()
         self.demo_sensor()
         self.backend.create_parameter(SampleData.sample_parameter)
-        data = self.backend.get_parameters()
+        data = list(self.backend.get_parameters())
         self.assertEqual(len(data), 1)
 
     def test_create_parameter_dup(self):
         pass
 
+    def test_create_parameter_value_type(self):
+        """the o_N value column follows the phenomena data_type"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_phenomena(
+            dict(SampleData.sample_phenomena, data_type="smallint"))
+        self.backend.create_parameter(SampleData.sample_parameter)
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        table = self.backend.get_observation_table(*key)
+        self.assertEqual("smallint", table.value_type)
+        # read back from the database for tables built by other processes
+        self.assertEqual(
+            "smallint",
+            self.backend.observation_layout(table.__tablename__)[1])
+
+        self.backend.create_observations(*(key + ([
+            {"timestamp": 1434890106, "value": 7},
+            {"timestamp": 1434890107, "value": -7.0}],)))
+        self.assertEqual([7, -7], [observation["value"] for observation in
+                                   self.backend.get_observations(*key)])
+        # out of range or fractional values would be stored altered
+        for value in [40000, -7.9]:
+            with self.assertRaises(HTTPException):
+                self.backend.create_observations(*(key + ([
+                    {"timestamp": 1434890108, "value": value}],)))
+        self.assertEqual(2, len(self.backend.get_observations(*key)))
+
+    def test_create_parameter_pooled(self):
+        """parameters claim a pooled table of their value type if there is one"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_phenomena(
+            dict(SampleData.sample_phenomena, data_type="smallint"))
+        self.backend.observation_pool = True
+        self.addCleanup(setattr, self.backend, "observation_pool", False)
+        self.assertEqual(1, self.backend.fill_observation_pool("double", 1))
+        pooled = self.db_session.query(ObservationPool.observation_link).scalar()
+
+        # no smallint tables pooled, so one is created
+        self.backend.create_parameter(SampleData.sample_parameter)
+        self.assertEqual(1, self.db_session.query(ObservationPool).count())
+
+        self.backend.create_parameter(
+            dict(SampleData.sample_parameter, phenomena="humidity"))
+        self.assertEqual(0, self.db_session.query(ObservationPool).count())
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               "humidity")
+        table = self.backend.get_observation_table(*key)
+        self.assertEqual(pooled, table.observation_link)
+        self.backend.create_observations(*(key + ([
+            {"timestamp": 1434890106, "value": 21.5}],)))
+        self.assertEqual(1, len(self.backend.get_observations(*key)))
+
+    #
+    # phenomena
+    #
+    def test_create_phenomena(self):
+        """Create a phenomena and read it back"""
+        self.backend.create_phenomena(SampleData.sample_phenomena)
+        data = self.backend.get_phenomena(SampleData.sample_phenomena_term)
+        self.assertEqual(SampleData.sample_phenomena["data_type"],
+                         data["data_type"])
+        self.assertEqual(1, len(list(self.backend.get_phenomenas())))
+
+    def test_create_phenomena_dup(self):
+        self.backend.create_phenomena(SampleData.sample_phenomena)
+        with self.assertRaises(HTTPException):
+            self.backend.create_phenomena(SampleData.sample_phenomena)
+
+    def test_delete_phenomena(self):
+        self.backend.create_phenomena(SampleData.sample_phenomena)
+        self.backend.delete_phenomena(SampleData.sample_phenomena_term)
+        with self.assertRaises(HTTPException):
+            self.backend.get_phenomena(SampleData.sample_phenomena_term)
+
     #
     # get_parameter()
     #
     def test_get_parameter_no_data(self):
         """ get_sensor() with no data loaded """
-        data = self.backend.get_parameters()
+        data = list(self.backend.get_parameters())
         self.assertEqual(len(data), 0)
 
     def test_get_parameter_data(self):
@@ -296,7 +536,7 @@ class TestMysql(unittest.TestCase):
             SampleData.sample_sensor_model,
             SampleData.sample_sensor_serial_number,
             SampleData.sample_parameter_phenomena)
-        data = self.backend.get_parameters()
+        data = list(self.backend.get_parameters())
         self.assertEqual(len(data), 0)
 
     #
@@ -304,7 +544,7 @@ class TestMysql(unittest.TestCase):
     #
     def test_get_parameters_no_data(self):
         """ get_parameters() with no data loaded """
-        data = self.backend.get_parameters()
+        data = list(self.backend.get_parameters())
         self.assertEqual(len(data), 0)
 
     def test_get_parameters_data(self):
@@ -313,8 +553,252 @@ class TestMysql(unittest.TestCase):
         self.demo_sensor()
         self.demo_parameter()
 
-        data = self.backend.get_parameters()
+        data = list(self.backend.get_parameters())
         self.assertEqual(len(data), 1)
 
+    def test_get_sensors_filtered(self):
+        """ get_sensors() pushes key prefix and query filters into SQL"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+
+        data = list(self.backend.get_sensors(
+            SampleData.sample_platform_id, SampleData.sample_sensor_manufacturer))
+        self.assertEqual(1, len(data))
+        data = list(self.backend.get_sensors(
+            SampleData.sample_platform_id, "other_manufacturer"))
+        self.assertEqual(0, len(data))
+        data = list(self.backend.get_sensors(filters={
+            "parameter_phenomena": SampleData.sample_parameter_phenomena}))
+        self.assertEqual(1, len(data))
+        data = list(self.backend.get_sensors(filters={"sensor_model": "other"}))
+        self.assertEqual(0, len(data))
+
+    def test_get_parameters_filtered(self):
+        """ get_parameters() pushes key prefix and query filters into SQL"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+
+        data = list(self.backend.get_parameters(filters={
+            "parameter_phenomena": SampleData.sample_parameter_phenomena}))
+        self.assertEqual(1, len(data))
+        data = list(self.backend.get_parameters(
+            SampleData.sample_platform_id,
+            SampleData.sample_sensor_manufacturer,
+            SampleData.sample_sensor_model,
+            "other_serial_number"))
+        self.assertEqual(0, len(data))
+
+    #
+    # create_observations()
+    #
+    def test_create_observations(self):
+        """create a batch of observations spanning several INSERT chunks"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+        observations = [{
+            "timestamp": SampleData.sample_observation["timestamp"] + i,
+            "value": i} for i in range(self.backend.observation_batch_size * 2 + 1)]
+        self.backend.create_observations(
+            SampleData.sample_platform_id,
+            SampleData.sample_sensor_manufacturer,
+            SampleData.sample_sensor_model,
+            SampleData.sample_sensor_serial_number,
+            SampleData.sample_parameter_phenomena,
+            observations)
+        table = self.backend.get_observation_table(
+            SampleData.sample_platform_id,
+            SampleData.sample_sensor_manufacturer,
+            SampleData.sample_sensor_model,
+            SampleData.sample_sensor_serial_number,
+            SampleData.sample_parameter_phenomena)
+        self.assertEqual(len(observations), self.db_session.query(table).count())
+
+    def test_observation_table_cached(self):
+        """o_N table lookups are cached until the parameter is deleted"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        table = self.backend.get_observation_table(*key)
+        self.assertTrue(table is self.backend.get_observation_table(*key))
+
+        self.backend.delete_parameter(*key)
+        self.assertEqual(None, self.backend.get_observation_table(*key))
+
+    def test_get_observation_aggregates(self):
+        """SQL aggregation agrees with the numpy implementation"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        self.backend.create_observations(*(key + ([{
+            "timestamp": SampleData.sample_observation["timestamp"] + i,
+            "value": i % 7} for i in range(1000)],)))
+
+        aggs = ["count", "sum", "min", "max", "mean"]
+        timestamps, values = self.backend.get_observation_arrays(*key)
+        self.assertEqual(
+            aggregate.aggregate(timestamps, values, 300, aggs),
+            self.backend.get_observation_aggregates(*(key + (300, aggs))))
+
+    def test_get_observation_aggregates_rollup(self):
+        """aggregates answered from rollup tables match the raw table"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.observation_rollups = True
+        try:
+            self.backend.create_parameter(SampleData.sample_parameter)
+        finally:
+            self.backend.observation_rollups = False
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        for offset in [0, 3]:
+            self.backend.create_observations(*(key + ([{
+                "timestamp": 1434880000 + offset + i * 7,
+                "value": i % 13} for i in range(5000)],)))
+
+        aggs = ["count", "sum", "min", "max", "mean"]
+        table = self.backend.get_observation_table(*key)
+        self.assertTrue(self.backend.choose_rollup(table, 3600, aggs, None, None))
+        timestamps, values = self.backend.get_observation_arrays(*key)
+        self.assertEqual(
+            aggregate.aggregate(timestamps, values, 3600, aggs),
+            self.backend.get_observation_aggregates(*(key + (3600, aggs))))
+
+    def test_create_observations_resend(self):
+        """resent observations are upserted and rollups stay exact"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.observation_rollups = True
+        try:
+            self.backend.create_parameter(SampleData.sample_parameter)
+        finally:
+            self.backend.observation_rollups = False
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        observations = [{"timestamp": 1434844800 + i * 37, "value": i % 11}
+                        for i in range(5000)]
+        self.backend.create_observations(*(key + (observations,)))
+        self.backend.create_observations(*(key + (observations[1000:3000],)))
+        observations[0]["value"] = 99
+        self.backend.create_observations(*(key + (observations[:1],)))
+
+        timestamps, values = self.backend.get_observation_arrays(*key)
+        self.assertEqual(5000, len(timestamps))
+        self.assertEqual(99, values[0])
+        aggs = ["count", "sum", "min", "max", "mean"]
+        for bucket in [3600, 86400]:
+            self.assertEqual(
+                aggregate.aggregate(timestamps, values, bucket, aggs),
+                self.backend.get_observation_aggregates(*(key + (bucket, aggs))))
+
+    def test_create_observations_subsecond(self):
+        """new o_N tables are keyed by epoch microseconds"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.backend.create_parameter(SampleData.sample_parameter)
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        # 50Hz
+        observations = [{"timestamp": 1434890106 + i * 0.02, "value": i}
+                        for i in range(500)]
+        self.backend.create_observations(*(key + (observations,)))
+
+        stored = self.backend.get_observations(*key)
+        self.assertEqual(500, len(stored))
+        self.assertEqual(1434890106, stored[0]["timestamp"])
+        self.assertAlmostEqual(1434890106.02, stored[1]["timestamp"])
+        self.assertEqual(range(25, 50), [observation["value"] for observation in
+            self.backend.get_observations(*key, start=1434890106.5,
+                                          end=1434890107)])
+        self.assertEqual(11, self.backend.get_observations(
+            *key, after=stored[10]["timestamp"], limit=1)[0]["value"])
+
+    def test_legacy_observation_table(self):
+        """o_N tables keyed by DATETIME stay readable and writable"""
+        self.demo_platform()
+        self.demo_sensor()
+        self.run_sql("CREATE TABLE IF NOT EXISTS " + self.db_name +
+                     ".o_9999 (timestamp DATETIME PRIMARY KEY, value INT)")
+        parameter = Parameter(**SampleData.sample_parameter)
+        parameter.observation_link = 9999
+        self.db_session.add(parameter)
+        self.db_session.commit()
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        self.backend.create_observations(*(key + ([{
+            "timestamp": SampleData.sample_observation["timestamp"] + i,
+            "value": i} for i in range(100)],)))
+
+        self.assertEqual(
+            {"timestamp": SampleData.sample_observation["timestamp"] + 10,
+             "value": 10},
+            self.backend.get_observations(
+                *key, after=SampleData.sample_observation["timestamp"] + 9,
+                limit=1)[0])
+        self.assertEqual([{"timestamp": 1434890100, "count": 100}],
+            self.backend.get_observation_aggregates(*(key + (300, ["count"]))))
+
+    def test_chunked_compaction(self):
+        """packed windows read back the same as the rows they replaced"""
+        self.demo_platform()
+        self.demo_sensor()
+        backend = Chunked()
+        backend.session = self.db_session
+        backend.chunk_delay = 0
+        backend.compact_interval = 3600
+        backend.create_parameter(SampleData.sample_parameter)
+        key = (SampleData.sample_platform_id,
+               SampleData.sample_sensor_manufacturer,
+               SampleData.sample_sensor_model,
+               SampleData.sample_sensor_serial_number,
+               SampleData.sample_parameter_phenomena)
+        backend.create_observations(*(key + ([{
+            "timestamp": 1434844800 + i * 7.5,
+            "value": i % 13} for i in range(30000)],)))
+        expected = backend.get_observations(*key)
+        timestamps, values = backend.get_observation_arrays(*key)
+
+        table = backend.get_observation_table(*key)
+        # the write packed the oldest of the 3 closed windows
+        self.assertEqual(2, backend.compact(table))
+        self.assertEqual(0, self.db_session.query(table).count())
+        self.assertEqual(expected, backend.get_observations(*key))
+        self.assertEqual(expected[100:200], backend.get_observations(
+            *key, after=expected[99]["timestamp"], limit=100))
+
+        # late writes to a packed window are merged over the block
+        backend.create_observations(*(key + ([
+            {"timestamp": 1434844800, "value": 99}],)))
+        self.assertEqual(99, backend.get_observations(*key, limit=1)[0]["value"])
+        aggs = ["count", "sum", "min", "max", "mean"]
+        values[0] = 99
+        self.assertEqual(
+            aggregate.aggregate(timestamps, values, 3600, aggs),
+            backend.get_observation_aggregates(*(key + (3600, aggs))))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
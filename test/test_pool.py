@@ -0,0 +1,43 @@
+import unittest
+import sys
+import os
+import time
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver.pool import PoolMaintainer
+
+
+class TestPool(unittest.TestCase):
+    """
+    Tests for the observation table pool maintainer
+    """
+
+    def setUp(self):
+        self.filled = []
+        self.pool = PoolMaintainer(self.fill, 5, ["double", "int"],
+                                   interval=0.01)
+
+    def fill(self, value_type, size):
+        self.filled.append((value_type, size))
+        return 0
+
+    def test_top_up(self):
+        """every value type is filled to the pool size"""
+        self.pool.top_up()
+        self.assertEqual([("double", 5), ("int", 5)], self.filled)
+
+    def test_thread_survives_errors(self):
+        """a failed top up is retried on the next interval"""
+        def fill(value_type, size):
+            self.filled.append(value_type)
+            raise Exception("database unavailable")
+        self.pool.fill = fill
+        self.pool.ensure_started()
+        while len(self.filled) < 4:
+            time.sleep(0.01)
+        self.pool.stop()
+        self.assertTrue(self.pool.thread is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
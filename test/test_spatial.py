@@ -0,0 +1,127 @@
+import unittest
+import sys
+import os
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver import spatial
+
+
+class TestSpatial(unittest.TestCase):
+    """
+    Tests for WKT parsing and the grid index
+    """
+
+    def test_parse_point(self):
+        self.assertEqual((1.5, -2.0), spatial.parse_point("POINT(1.5 -2)"))
+        self.assertEqual((0.0, 0.0), spatial.parse_point("POINT(0,0)"))
+        self.assertEqual((3.0, 4.0), spatial.parse_point(" point ( 3 4 ) "))
+
+    def test_parse_point_bad(self):
+        for wkt in ["", "POINT()", "POINT(1)", "POINT(1 2 3 4)",
+                    "POLYGON((0 0,1 0,1 1))", "somewhere", "POINT(nan 0)",
+                    "POINT(0 -inf)"]:
+            self.assertRaises(ValueError, spatial.parse_point, wkt)
+
+    def test_location_coordinates(self):
+        self.assertEqual((1.0, 2.0), spatial.location_coordinates("POINT (1 2)"))
+        self.assertEqual((None, None), spatial.location_coordinates(None))
+        self.assertEqual((None, None), spatial.location_coordinates("home"))
+        # only locations the validator accepts are indexed
+        for location in ["POINT(1,2)", "POINT (nan nan)", "POINT (1 2) x"]:
+            self.assertEqual((None, None),
+                             spatial.location_coordinates(location))
+
+    def test_polygon_contains(self):
+        # L shaped polygon
+        polygon = spatial.parse_polygon(
+            "POLYGON((0 0, 2 0, 2 1, 1 1, 1 2, 0 2, 0 0))")
+        self.assertTrue(polygon.contains(0.5, 0.5))
+        self.assertTrue(polygon.contains(0.5, 1.5))
+        self.assertFalse(polygon.contains(1.5, 1.5))
+        self.assertFalse(polygon.contains(3, 0.5))
+
+    def test_parse_polygon_bad(self):
+        for wkt in ["POLYGON(0 0, 1 0, 1 1)", "POLYGON((0 0, 1 0))",
+                    "POINT(0 0)"]:
+            self.assertRaises(ValueError, spatial.parse_polygon, wkt)
+
+    def test_parse_bbox(self):
+        box = spatial.parse_bbox("-1,-2,3,4")
+        self.assertTrue(box.contains(-1, 4))
+        self.assertFalse(box.contains(3.5, 0))
+        self.assertRaises(ValueError, spatial.parse_bbox, "1,2,3")
+        self.assertRaises(ValueError, spatial.parse_bbox, "3,0,1,1")
+        self.assertRaises(ValueError, spatial.parse_bbox, "nan,0,1,1")
+
+    def test_index_query(self):
+        index = spatial.GridIndex(10)
+        index.insert("a", 1, 1)
+        index.insert("b", 15, 15)
+        index.insert("c", -5, 25)
+        self.assertEqual(["a"], index.query(spatial.BoundingBox(0, 0, 10, 10)))
+        self.assertEqual(["a", "b", "c"], sorted(
+            index.query(spatial.BoundingBox(-1000, -1000, 1000, 1000))))
+
+    def test_index_move_remove(self):
+        index = spatial.GridIndex(10)
+        index.insert("a", 1, 1)
+        index.insert("a", 55, 55)
+        self.assertEqual([], index.query(spatial.BoundingBox(0, 0, 10, 10)))
+        self.assertEqual(1, len(index))
+        index.remove("a")
+        index.remove("missing")
+        self.assertEqual(0, len(index))
+        self.assertEqual({}, index.cells)
+
+    def test_nearest(self):
+        index = spatial.GridIndex(1)
+        for key, x, y in [("a", 0, 0), ("b", 3, 4), ("c", 1, 1),
+                          ("far", 500, 500)]:
+            index.insert(key, x, y)
+        self.assertEqual([(1.0, "b")], index.nearest(3, 3, 1))
+        self.assertEqual(["b", "c", "a", "far"],
+                         [key for _, key in index.nearest(3, 3, 10)])
+        self.assertEqual(["a", "far"], [key for _, key in index.nearest(
+            3, 3, 2, lambda key: key in ("a", "far"))])
+        self.assertEqual([], spatial.GridIndex().nearest(0, 0, 5))
+
+    def test_clusters(self):
+        clusters = spatial.ClusterIndex()
+        clusters.insert("a", 1, 1)
+        clusters.insert("b", 3, 3)
+        clusters.insert("c", 100, 10)
+        world = spatial.BoundingBox(-180, -90, 180, 90)
+
+        # everything in one cluster at zoom 0
+        data = clusters.query(world, 0)
+        self.assertEqual(1, len(data))
+        self.assertEqual(3, data[0]["count"])
+        self.assertAlmostEqual(104 / 3.0, data[0]["longitude"])
+        self.assertEqual(["a", "b", "c"], data[0]["platform_ids"])
+
+        # cells are 360 / 16 = 22.5 degrees wide at zoom 4
+        data = sorted(clusters.query(world, 4), key=lambda c: c["count"])
+        self.assertEqual([1, 2], [c["count"] for c in data])
+        self.assertEqual((2.0, 2.0), (data[1]["longitude"],
+                                      data[1]["latitude"]))
+
+        # only clusters centred inside the box
+        data = clusters.query(spatial.BoundingBox(0, 0, 10, 10), 4)
+        self.assertEqual([2], [c["count"] for c in data])
+
+    def test_clusters_remove(self):
+        clusters = spatial.ClusterIndex(max_zoom=2)
+        for key in ["a", "b", "c", "d"]:
+            clusters.insert(key, 1, 1)
+        clusters.remove("a")
+        world = spatial.BoundingBox(-180, -90, 180, 90)
+        data = clusters.query(world, 2)
+        self.assertEqual(3, data[0]["count"])
+        self.assertEqual(["b", "c", "d"], sorted(data[0]["platform_ids"]))
+        for key in ["b", "c", "d"]:
+            clusters.remove(key)
+        self.assertEqual([], clusters.query(world, 0))
+        self.assertEqual([{}, {}, {}], clusters.levels)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+import fcntl
+import json
+import shutil
+import tempfile
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from werkzeug.exceptions import Conflict
+from lsdserver import spool
+from lsdserver.spool import Spool
+
+KEY = ("platform", "manufacturer", "model", "serial", "phenomena")
+
+
+class TestSpool(unittest.TestCase):
+    """
+    Tests for the write-behind observation spool
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.committed = []
+        self.spool = Spool(self.directory, self.commit, batch_size=3)
+        # drive the spool by hand rather than from the committer thread
+        self.spool.ensure_started = lambda: None
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def commit(self, key, observations):
+        self.committed.append((key, observations))
+
+    def observations(self, start, count):
+        return [{"timestamp": start + i, "value": float(i)}
+                for i in range(count)]
+
+    def test_drain_batches(self):
+        """batches for a parameter are merged then split by batch_size"""
+        self.spool.append(KEY, self.observations(0, 2))
+        self.spool.append(KEY, self.observations(2, 2))
+        self.assertEqual([], self.committed)
+
+        self.spool.drain()
+        self.assertEqual([3, 1], [len(o) for _, o in self.committed])
+        self.assertEqual(KEY, self.committed[0][0])
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_append_durable(self):
+        """spooled observations are on disk before append returns"""
+        self.spool.append(KEY, self.observations(0, 1))
+        name = os.listdir(self.directory)[0]
+        self.assertTrue(name.endswith(".open"))
+        with open(os.path.join(self.directory, name)) as f:
+            self.assertEqual(list(KEY), json.loads(f.readline())["key"])
+
+    def test_replay_dead_process(self):
+        """segments left by a process that died are committed"""
+        segment = os.path.join(self.directory, "%016d-%d-1.open" % (1, 2 ** 22 + 1))
+        with open(segment, "w") as f:
+            f.write(json.dumps({"key": list(KEY),
+                                "observations": self.observations(0, 1)}))
+            f.write("\n{\"key\": [\"torn")
+        self.spool.drain()
+        self.assertEqual([(KEY, self.observations(0, 1))], self.committed)
+        self.assertFalse(os.path.exists(segment))
+
+    def test_replay_reused_pid(self):
+        """segments are committed once unlocked, even if their pid is live"""
+        segment = os.path.join(self.directory, "%016d-%d-1.open" % (
+            1, os.getpid()))
+        writer = open(segment, "w")
+        fcntl.flock(writer, fcntl.LOCK_EX)
+        writer.write(json.dumps({"key": list(KEY),
+                                 "observations": self.observations(0, 1)}))
+        writer.write("\n")
+        writer.flush()
+        self.spool.drain()
+        self.assertEqual([], self.committed)
+
+        writer.close()
+        self.spool.drain()
+        self.assertEqual([(KEY, self.observations(0, 1))], self.committed)
+
+    def test_open_segment_race(self):
+        """a segment being opened is not committed before it is locked"""
+        other = Spool(self.directory, self.commit)
+        class Fcntl(object):
+            LOCK_EX = fcntl.LOCK_EX
+            LOCK_NB = fcntl.LOCK_NB
+            LOCK_UN = fcntl.LOCK_UN
+            drained = False
+
+            @staticmethod
+            def flock(f, operation):
+                # another process drains as the segment is being created
+                if not Fcntl.drained:
+                    Fcntl.drained = True
+                    other.drain()
+                fcntl.flock(f, operation)
+        spool.fcntl = Fcntl
+        try:
+            self.spool.append(KEY, self.observations(0, 1))
+        finally:
+            spool.fcntl = fcntl
+        self.assertTrue(Fcntl.drained)
+        self.assertEqual([], self.committed)
+        self.spool.drain()
+        self.assertEqual([(KEY, self.observations(0, 1))], self.committed)
+
+    def test_reject(self):
+        """batches the backend refuses are set aside, not retried"""
+        def commit(key, observations):
+            raise Conflict()
+        self.spool.commit = commit
+        self.spool.append(KEY, self.observations(0, 1))
+        self.spool.drain()
+        self.assertEqual(["rejected.ndjson"], os.listdir(self.directory))
+        self.spool.drain()
+        with open(os.path.join(self.directory, "rejected.ndjson")) as f:
+            self.assertEqual(1, len(f.readlines()))
+
+    def test_retry_on_failure(self):
+        """segments stay spooled while the backend is unavailable"""
+        def commit(key, observations):
+            raise IOError("database down")
+        self.spool.commit = commit
+        self.spool.append(KEY, self.observations(0, 1))
+        self.assertRaises(IOError, self.spool.drain)
+        self.spool.commit = self.commit
+        self.spool.drain()
+        self.assertEqual(1, len(self.committed))
+
+    def test_committer_thread(self):
+        """the committer thread drains the spool until stopped"""
+        spool = Spool(self.directory, self.commit, flush_interval=0.01)
+        spool.append(KEY, self.observations(0, 5))
+        spool.stop()
+        self.assertEqual(5, sum(len(o) for _, o in self.committed))
+
+if __name__ == "__main__":
+    unittest.main()
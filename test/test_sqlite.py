@@ -0,0 +1,232 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import json
+import time
+APP_DIR = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(APP_DIR)
+from lsdserver import create_app, status
+from lsdserver.backend.mysql import EpochObservation, ObservationPool, \
+    Parameter, convert_values
+from lsdserver.backend.sqlite import Sqlite
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from werkzeug.exceptions import HTTPException
+from sample_data import SampleData
+
+
+class TestSqlite(unittest.TestCase):
+    """
+    Tests for the SQLite backend, run against a database file
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(
+            "sqlite:///" + os.path.join(self.directory, "lsdserver.db"))
+        self.backend = Sqlite()
+        self.backend.prepare(self.engine)
+        self.backend.session = scoped_session(sessionmaker(bind=self.engine))
+        self.backend.create_platform(dict(SampleData.sample_platform))
+        self.backend.create_sensor(dict(SampleData.sample_sensor))
+        self.backend.create_parameter(dict(SampleData.sample_parameter))
+        self.key = tuple(SampleData.sample_parameter[field] for field in [
+            "platform_id", "manufacturer", "model", "serial_number",
+            "phenomena"])
+
+    def tearDown(self):
+        self.backend.session.remove()
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def test_pragmas(self):
+        connection = self.engine.connect()
+        self.assertEqual(
+            "wal", connection.execute("PRAGMA journal_mode").scalar())
+        self.assertEqual(
+            1, connection.execute("PRAGMA foreign_keys").scalar())
+        connection.close()
+
+    def test_observation_table_without_rowid(self):
+        sql = self.engine.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'o_1'").scalar()
+        self.assertTrue(sql.endswith("WITHOUT ROWID"))
+
+    def test_create_observations(self):
+        """batches larger than a statement are stored, resends overwrite"""
+        self.backend.create_observations(*(self.key + ([
+            {"timestamp": t, "value": t * 0.5} for t in range(1000)],)))
+        self.backend.create_observations(*(self.key + ([
+            {"timestamp": 1.5, "value": 2}, {"timestamp": 2, "value": 3}],)))
+        data = self.backend.get_observations(*self.key, limit=4)
+        self.assertEqual(
+            [(0, 0.0), (1, 0.5), (1.5, 2.0), (2, 3.0)],
+            [(o["timestamp"], o["value"]) for o in data])
+        self.assertEqual(
+            1001, len(list(self.backend.get_observations(*self.key))))
+
+    def test_create_observations_invalid(self):
+        """values that would be stored altered are refused"""
+        for value in [float("nan"), float("inf")]:
+            with self.assertRaises(HTTPException):
+                self.backend.create_observations(*(self.key + ([
+                    {"timestamp": 1, "value": 1},
+                    {"timestamp": 2, "value": value}],)))
+            self.assertEqual([], self.backend.get_observations(*self.key))
+
+        for value_type, value in [("bool", "abc"), ("bool", 2), ("int", 1.7),
+                                  ("float", 1e40)]:
+            self.assertRaises(ValueError, convert_values, [value], value_type)
+        self.assertEqual([True, False], convert_values([1, False], "bool"))
+        self.assertEqual([2], convert_values([2.0], "smallint"))
+
+    def test_observation_generation(self):
+        """only writes older than the seal age change the generation"""
+        self.assertEqual("0", self.backend.get_observation_generation(*self.key))
+        self.backend.create_observations(*(self.key + ([
+            {"timestamp": time.time(), "value": 1}],)))
+        self.assertEqual("0", self.backend.get_observation_generation(*self.key))
+        self.backend.create_observations(*(self.key + ([
+            {"timestamp": time.time(), "value": 1},
+            {"timestamp": 1, "value": 1}],)))
+        self.assertEqual("1", self.backend.get_observation_generation(*self.key))
+        self.assertEqual("1.1.1", self.backend.get_registry_generation())
+
+        # read from the polled counters rather than queried
+        statements = []
+        def count(*args):
+            statements.append(args)
+        event.listen(self.engine, "before_cursor_execute", count)
+        self.backend.registry_poll_interval = 60
+        self.assertEqual("1", self.backend.get_observation_generation(*self.key))
+        event.remove(self.engine, "before_cursor_execute", count)
+        self.assertEqual([], statements)
+
+    def test_read_parameter(self):
+        """parameters are read through the REST API from the o_N cache"""
+        app = create_app(APP_DIR)
+        app.config['TESTING'] = True
+        app.system = self.backend
+        client = app.test_client()
+        uri = "/parameter/" + "/".join(self.key)
+        resp = client.get(uri, headers={'Accept': 'application/json'})
+        self.assertEqual(status.OK, resp.status_code)
+        self.assertEqual(dict(SampleData.sample_parameter, observation_link=1),
+                         json.loads(resp.data))
+
+        resp = client.get(uri + "_missing",
+                          headers={'Accept': 'application/json'})
+        self.assertEqual(status.NOT_FOUND, resp.status_code)
+
+    def test_observation_aggregates(self):
+        self.backend.create_observations(*(self.key + ([
+            {"timestamp": t, "value": t} for t in range(0, 200, 10)],)))
+        data = self.backend.get_observation_aggregates(
+            *(self.key + (100, ["count", "max"])))
+        self.assertEqual([{"timestamp": 0, "count": 10, "max": 90.0},
+                          {"timestamp": 100, "count": 10, "max": 190.0}],
+                         data)
+
+    def test_rollups_resend(self):
+        """resends only recompute the buckets they touch"""
+        self.backend.observation_rollups = True
+        self.backend.create_parameter(
+            dict(SampleData.sample_parameter, phenomena="humidity"))
+        key = self.key[:4] + ("humidity",)
+        day = 86400
+        self.backend.create_observations(*(key + ([
+            {"timestamp": t, "value": 1.0} for t in range(0, 30 * day, 600)],)))
+
+        reads = []
+        read_observation_arrays = self.backend.read_observation_arrays
+        def spy(table, start=None, end=None):
+            reads.append((start, end))
+            return read_observation_arrays(table, start, end)
+        self.backend.read_observation_arrays = spy
+        self.backend.create_observations(*(key + ([
+            {"timestamp": 0, "value": 5.0},
+            {"timestamp": 29 * day, "value": 5.0},
+            {"timestamp": 30 * day, "value": 5.0}],)))
+        self.assertEqual([(0, 3600), (29 * day, 29 * day + 3600)], reads)
+
+        data = self.backend.get_observation_aggregates(
+            *(key + (day, ["count", "sum"])))
+        self.assertEqual({"timestamp": 0, "count": 144, "sum": 148.0}, data[0])
+        self.assertEqual({"timestamp": 30 * day, "count": 1, "sum": 5.0},
+                         data[-1])
+
+    def test_rollups_concurrent(self):
+        """concurrent batches of the same observations are counted once"""
+        self.backend.observation_rollups = True
+        self.backend.create_parameter(
+            dict(SampleData.sample_parameter, phenomena="humidity"))
+        key = self.key[:4] + ("humidity",)
+        batch = [{"timestamp": t, "value": 1.0} for t in range(10)]
+
+        # another process writes the batch once this one has looked up what
+        # is stored
+        other = Sqlite()
+        other.session = scoped_session(sessionmaker(bind=self.engine))
+        def write():
+            other.create_observations(*(key + (batch,)))
+            other.session.remove()
+        thread = threading.Thread(target=write)
+        stored_keys = self.backend.stored_keys
+        def spy(table, rows):
+            keys = stored_keys(table, rows)
+            if not thread.is_alive():
+                thread.start()
+                time.sleep(0.2)
+            return keys
+        self.backend.stored_keys = spy
+        self.backend.create_observations(*(key + (batch,)))
+        thread.join()
+
+        self.assertEqual(
+            [{"timestamp": 0, "count": 10, "sum": 10.0}],
+            self.backend.get_observation_aggregates(
+                *(key + (3600, ["count", "sum"]))))
+
+    def test_create_parameter_lookup(self):
+        """lookups before the o_N table exists don't decide its layout"""
+        self.backend.create_phenomena(
+            dict(SampleData.sample_phenomena, term="count", data_type="int"))
+        key = self.key[:4] + ("count",)
+        create_observation_table = self.backend.create_observation_table
+        def create(link, value_type):
+            self.assertEqual(None, self.backend.get_observation_table(*key))
+            # a class left from an earlier table of the same name
+            self.backend.build_observation_table(
+                link, (EpochObservation, "double"))
+            create_observation_table(link, value_type)
+        self.backend.create_observation_table = create
+        self.backend.create_parameter(
+            dict(SampleData.sample_parameter, phenomena="count"))
+
+        table = self.backend.get_observation_table(*key)
+        self.assertEqual("int", table.value_type)
+        self.assertTrue("INTEGER" in self.engine.execute(
+            "SELECT sql FROM sqlite_master WHERE name = ?",
+            table.__tablename__).scalar())
+
+    def test_create_parameter_pooled(self):
+        """registration claims a pooled table rather than creating one"""
+        self.backend.observation_pool = True
+        self.assertEqual(2, self.backend.fill_observation_pool("double", 2))
+        self.assertEqual(0, self.backend.fill_observation_pool("double", 2))
+        self.backend.create_parameter(
+            dict(SampleData.sample_parameter, phenomena="humidity"))
+
+        session = self.backend.session
+        self.assertEqual(2, session.query(Parameter.observation_link).filter_by(
+            phenomena="humidity").scalar())
+        self.assertEqual([3], [row.observation_link
+                               for row in session.query(ObservationPool)])
+        self.assertTrue(self.engine.has_table("o_3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
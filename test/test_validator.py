@@ -42,6 +42,8 @@ class TestValidator(unittest.TestCase):
         self.assertTrue(self.validator.validate_parameter_type("int"))
         self.assertTrue(self.validator.validate_parameter_type("float"))
         self.assertTrue(self.validator.validate_parameter_type("bool"))
+        self.assertTrue(self.validator.validate_parameter_type("smallint"))
+        self.assertTrue(self.validator.validate_parameter_type("double"))
 
     def test_invalid_parameter_types(self):
         self.assertFalse(self.validator.validate_parameter_type("invalid"))